@@ -105,6 +105,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # SQLite has no row locks: take the write lock when a transaction starts so
+            # concurrent purchases queue (up to timeout seconds) instead of deadlocking
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -216,6 +222,61 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Google Maps API key
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', 'AIzaSyA-test-key-for-development-only')
 
+# Timeout (seconds) for Google Maps HTTP calls; the Distance Matrix URL can be pointed at a stub
+GOOGLE_MAPS_TIMEOUT = float(os.getenv('GOOGLE_MAPS_TIMEOUT', 10))
+GOOGLE_MAPS_DISTANCE_MATRIX_URL = os.getenv(
+    'GOOGLE_MAPS_DISTANCE_MATRIX_URL', 'https://maps.googleapis.com/maps/api/distancematrix/json'
+)
+
+# Route distance cache: entry lifetime in seconds and per-process LRU size
+DISTANCE_CACHE_TTL = int(os.getenv('DISTANCE_CACHE_TTL', 30 * 24 * 3600))
+DISTANCE_CACHE_SIZE = int(os.getenv('DISTANCE_CACHE_SIZE', 10000))
+
+# CACHES alias of a cache shared by every worker (e.g. Redis/Memcached). Snapshot
+# version stamps and unread notification counters live there when it is set;
+# otherwise versions are kept in the database (core.CacheVersion) and unread
+# counts are queried on every read, since the default cache is per process.
+SHARED_CACHE = os.getenv('SHARED_CACHE') or None
+
+# SystemConfig values are cached per process. Set SYSTEM_CONFIG_CACHE to a CACHES
+# alias (e.g. a shared Redis/Memcached cache; defaults to SHARED_CACHE) so config changes
+# reach every worker immediately; otherwise other workers pick them up within
+# SYSTEM_CONFIG_CACHE_TTL seconds.
+SYSTEM_CONFIG_CACHE = os.getenv('SYSTEM_CONFIG_CACHE') or SHARED_CACHE
+SYSTEM_CONFIG_CACHE_TTL = int(os.getenv('SYSTEM_CONFIG_CACHE_TTL', 30))
+
+# Provisional trip distances are finalized by an in-process worker pool after the
+# request commits; set TRIP_FINALIZE_ASYNC=False to leave it to `manage.py finalize_trips`
+TRIP_FINALIZE_ASYNC = os.getenv('TRIP_FINALIZE_ASYNC', 'True') == 'True'
+TRIP_FINALIZE_WORKERS = int(os.getenv('TRIP_FINALIZE_WORKERS', 2))
+
+# PDF/XLSX reports are rendered into MEDIA_ROOT by an in-process worker pool after
+# the request commits; set REPORT_JOBS_ASYNC=False to leave it to `manage.py run_report_jobs`
+REPORT_JOBS_ASYNC = os.getenv('REPORT_JOBS_ASYNC', 'True') == 'True'
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', 1))
+
+# Marketplace transaction notifications are written in one bulk insert after the
+# request commits, by an in-process worker pool; set MARKETPLACE_NOTIFICATIONS_ASYNC=False
+# to write them in the committing thread instead
+MARKETPLACE_NOTIFICATIONS_ASYNC = os.getenv('MARKETPLACE_NOTIFICATIONS_ASYNC', 'True') == 'True'
+MARKETPLACE_NOTIFICATION_WORKERS = int(os.getenv('MARKETPLACE_NOTIFICATION_WORKERS', 1))
+
+# Lifetime (seconds) of cached per-user unread notification counts; they are kept
+# current as notifications are written and read, this only bounds drift
+NOTIFICATION_UNREAD_CACHE_TTL = int(os.getenv('NOTIFICATION_UNREAD_CACHE_TTL', 300))
+
+# Lifetime (seconds) of cached employer dashboard snapshots; trip saves and
+# verifications invalidate them sooner
+EMPLOYER_DASHBOARD_CACHE_TTL = int(os.getenv('EMPLOYER_DASHBOARD_CACHE_TTL', 300))
+
+# Lifetime (seconds) of cached bank report snapshots; any marketplace transaction
+# change invalidates them sooner
+BANK_REPORT_CACHE_TTL = int(os.getenv('BANK_REPORT_CACHE_TTL', 600))
+
+# Used and expired credits older than this many days are compacted into
+# trips.CreditArchive by `manage.py archive_credits`
+CREDIT_ARCHIVE_AFTER_DAYS = int(os.getenv('CREDIT_ARCHIVE_AFTER_DAYS', 365))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,219 @@
+"""
+Daily analytics rollups for the bank dashboard.
+
+Credits issued, trips by mode and marketplace transactions are summed per
+day into the DailyCreditRollup, DailyTripRollup and DailyTransactionRollup
+tables as they are written, so a chart over any window reads at most a few
+rows per day instead of grouping the raw tables. Credits are tracked by
+CarbonCredit's save/delete and CarbonCreditQuerySet; trips and transactions
+by the signal handlers below. rebuild_daily_rollups recomputes any range
+from the raw tables and CreditArchive (see the backfill_daily_rollups command).
+"""
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from core.models import DailyCreditRollup, DailyTripRollup, DailyTransactionRollup
+from marketplace.models import MarketplaceTransaction
+from trips.models import Trip, CarbonCredit, CreditArchive
+
+# Fields that decide which rollup row a trip or transaction counts towards
+TRIP_ROLLUP_FIELDS = frozenset(('trip_date', 'transport_mode'))
+TRANSACTION_ROLLUP_FIELDS = frozenset(('created_at', 'credit_amount', 'total_price'))
+
+
+def _local_day(value):
+    """Day a datetime falls on in the current time zone (matches TruncDate)."""
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _trip_key(trip_date, transport_mode):
+    # trip_date defaults to timezone.now, so unsaved instances may hold a datetime
+    return (Trip._meta.get_field('trip_date').to_python(trip_date), transport_mode)
+
+
+def _transaction_deltas(created_at, credit_amount, total_price, sign=1):
+    return {(_local_day(created_at),): {
+        'transaction_count': sign,
+        'credit_volume': sign * credit_amount,
+        'total_value': sign * total_price,
+    }}
+
+
+def _tracks(update_fields, fields):
+    return update_fields is None or bool(fields.intersection(update_fields))
+
+
+@receiver(pre_save, sender=Trip)
+def remember_trip_rollup_key(sender, instance, update_fields=None, **kwargs):
+    """Note the rollup row an existing trip counted towards before it is saved."""
+    instance._rollup_key = None
+    if instance._state.adding or instance.pk is None or not _tracks(update_fields, TRIP_ROLLUP_FIELDS):
+        return
+    old = Trip._base_manager.filter(pk=instance.pk).values_list('trip_date', 'transport_mode').first()
+    if old is not None:
+        instance._rollup_key = old
+
+
+@receiver(post_save, sender=Trip)
+def rollup_trip_save(sender, instance, created, update_fields=None, **kwargs):
+    """Count a new trip, or move an edited one to its new day/mode."""
+    if not created and not _tracks(update_fields, TRIP_ROLLUP_FIELDS):
+        return
+    deltas = {_trip_key(instance.trip_date, instance.transport_mode): {'trip_count': 1}}
+    old_key = getattr(instance, '_rollup_key', None)
+    if not created:
+        if old_key is None:
+            return
+        deltas.setdefault(old_key, {'trip_count': 0})['trip_count'] -= 1
+    DailyTripRollup.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Trip)
+def rollup_trip_delete(sender, instance, **kwargs):
+    DailyTripRollup.apply_deltas({_trip_key(instance.trip_date, instance.transport_mode): {'trip_count': -1}})
+
+
+@receiver(pre_save, sender=MarketplaceTransaction)
+def remember_transaction_rollup_values(sender, instance, update_fields=None, **kwargs):
+    """Note what an existing transaction contributed to its day before it is saved."""
+    instance._rollup_values = None
+    if instance._state.adding or instance.pk is None or not _tracks(update_fields, TRANSACTION_ROLLUP_FIELDS):
+        return
+    instance._rollup_values = MarketplaceTransaction._base_manager.filter(pk=instance.pk).values_list(
+        'created_at', 'credit_amount', 'total_price'
+    ).first()
+
+
+@receiver(post_save, sender=MarketplaceTransaction)
+def rollup_transaction_save(sender, instance, created, update_fields=None, **kwargs):
+    """Add a new transaction to its day, or re-apply an edited one."""
+    if not created and not _tracks(update_fields, TRANSACTION_ROLLUP_FIELDS):
+        return
+    old = getattr(instance, '_rollup_values', None)
+    if not created and old is None:
+        return
+    deltas = _transaction_deltas(instance.created_at, instance.credit_amount, instance.total_price)
+    if old is not None:
+        for day, changes in _transaction_deltas(*old, sign=-1).items():
+            day_deltas = deltas.setdefault(day, {field: 0 for field in changes})
+            for field, amount in changes.items():
+                day_deltas[field] += amount
+    DailyTransactionRollup.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=MarketplaceTransaction)
+def rollup_transaction_delete(sender, instance, **kwargs):
+    DailyTransactionRollup.apply_deltas(
+        _transaction_deltas(instance.created_at, instance.credit_amount, instance.total_price, sign=-1)
+    )
+
+
+def rebuild_daily_rollups(start=None, end=None):
+    """
+    Recompute the daily rollups from the raw tables.
+
+    Args:
+        start: Optional first day (date) to rebuild
+        end: Optional last day (date) to rebuild
+
+    Returns:
+        Dict mapping rollup model name to the number of rows written
+    """
+    def day_range(queryset, field):
+        if start:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{field}__lte': end})
+        return queryset
+
+    credit_days = {}
+    for row in day_range(CarbonCredit.objects.all(), 'timestamp__date').order_by().values(
+        day=TruncDate('timestamp')
+    ).annotate(total=Sum('amount'), count=Count('id')):
+        credit_days[row['day']] = [row['total'] or 0, row['count']]
+    # Archived credits were issued on their day too
+    for row in day_range(CreditArchive.objects.all(), 'day').order_by().values('day').annotate(
+        total=Sum('amount'), count=Sum('credit_count')
+    ):
+        totals = credit_days.setdefault(row['day'], [0, 0])
+        totals[0] += row['total'] or 0
+        totals[1] += row['count'] or 0
+    credit_rows = [
+        DailyCreditRollup(day=day, credits_issued=total, credit_count=count)
+        for day, (total, count) in sorted(credit_days.items())
+    ]
+    trip_rows = [
+        DailyTripRollup(day=row['trip_date'], transport_mode=row['transport_mode'], trip_count=row['count'])
+        for row in day_range(Trip.objects.all(), 'trip_date').order_by().values(
+            'trip_date', 'transport_mode'
+        ).annotate(count=Count('id'))
+    ]
+    transaction_rows = [
+        DailyTransactionRollup(
+            day=row['day'],
+            transaction_count=row['count'],
+            credit_volume=row['volume'] or 0,
+            total_value=row['value'] or 0
+        )
+        for row in day_range(MarketplaceTransaction.objects.all(), 'created_at__date').order_by().values(
+            day=TruncDate('created_at')
+        ).annotate(count=Count('id'), volume=Sum('credit_amount'), value=Sum('total_price'))
+    ]
+
+    written = {}
+    with transaction.atomic():
+        for model, rows in (
+            (DailyCreditRollup, credit_rows),
+            (DailyTripRollup, trip_rows),
+            (DailyTransactionRollup, transaction_rows),
+        ):
+            day_range(model.objects.all(), 'day').delete()
+            model.objects.bulk_create(rows, batch_size=500)
+            written[model.__name__] = len(rows)
+    return written
+
+
+def get_daily_analytics(start_day):
+    """
+    Read the dashboard chart series from the rollup tables.
+
+    Args:
+        start_day: First day (date) of the window
+
+    Returns:
+        Dict with credits_per_day, trips_per_day, transport_modes and
+        transactions_per_day lists, days formatted as YYYY-MM-DD
+    """
+    credits_per_day = [
+        {'day': day.isoformat(), 'total': total}
+        for day, total in DailyCreditRollup.objects.filter(
+            day__gte=start_day, credit_count__gt=0
+        ).order_by('day').values_list('day', 'credits_issued')
+    ]
+
+    trip_rows = DailyTripRollup.objects.filter(day__gte=start_day, trip_count__gt=0)
+    trips_per_day = [
+        {'day': row['day'].isoformat(), 'count': row['count']}
+        for row in trip_rows.order_by('day').values('day').annotate(count=Sum('trip_count'))
+    ]
+    transport_modes = list(
+        trip_rows.order_by().values('transport_mode').annotate(count=Sum('trip_count')).order_by('-count')
+    )
+
+    transactions_per_day = [
+        {'day': day.isoformat(), 'count': count, 'volume': volume}
+        for day, count, volume in DailyTransactionRollup.objects.filter(
+            day__gte=start_day, transaction_count__gt=0
+        ).order_by('day').values_list('day', 'transaction_count', 'credit_volume')
+    ]
+
+    return {
+        'credits_per_day': credits_per_day,
+        'trips_per_day': trips_per_day,
+        'transport_modes': transport_modes,
+        'transactions_per_day': transactions_per_day,
+    }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Register the dashboard/report cache invalidation and daily rollup signal handlers
+        from . import analytics, employer_stats, reports  # noqa: F401
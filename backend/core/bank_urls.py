@@ -11,6 +11,8 @@ from core.views.bank_views import (
     buy_credits,
     BankReportsView,
     export_report,
+    report_job_status,
+    download_report,
     generate_report,
     transactions,
     approvals,
@@ -36,5 +38,7 @@ urlpatterns = [
     path('reports/', BankReportsView.as_view(), name='bank_reports'),
     path('reports/generate/', generate_report, name='generate_report'),
     path('reports/export/', export_report, name='export_report'),
+    path('reports/jobs/<int:job_id>/', report_job_status, name='report_job_status'),
+    path('reports/jobs/<int:job_id>/download/', download_report, name='download_report'),
     path('transactions/', transactions, name='transactions'),
 ] 
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Employer dashboard statistics.
+
+The dashboard figures come from one conditional-aggregation query over
+the employer's trips, one over their employees and one grouped query for
+the leaderboard. The result is cached per employer under a version stamp
+that is bumped whenever one of the employer's trips or employees is
+saved, verified or deleted (bulk writers that skip signals call
+invalidate_dashboards_for_employees), so repeat page loads do no
+aggregate queries at all. Snapshots are kept in the shared cache when one
+is configured, otherwise in the local cache under a database version stamp
+(see core.utils.versioning).
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum, Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from trips.models import Trip
+from users.models import EmployeeProfile
+from .utils.versioning import bump_version_on_commit, get_version, shared_cache
+
+# Default lifetime of a cached snapshot, in seconds
+DEFAULT_DASHBOARD_CACHE_TTL = 300
+
+# Number of employees on the leaderboard
+LEADERBOARD_SIZE = 5
+
+DASHBOARD_VERSION_KEY = 'employer_dashboard:{employer_id}:version'
+DASHBOARD_SNAPSHOT_KEY = 'employer_dashboard:{employer_id}:{version}'
+
+
+def invalidate_employer_dashboard(employer_id):
+    """Drop an employer's cached dashboard now and again once the current transaction commits."""
+    bump_version_on_commit(shared_cache(), DASHBOARD_VERSION_KEY.format(employer_id=employer_id))
+
+
+def invalidate_dashboards_for_employees(employee_ids):
+    """Invalidate the dashboards of every employer with one of these employees (for bulk trip writes)."""
+    employer_ids = EmployeeProfile.objects.filter(pk__in=set(employee_ids)).order_by().values_list(
+        'employer_id', flat=True
+    ).distinct()
+    for employer_id in employer_ids:
+        invalidate_employer_dashboard(employer_id)
+
+
+def get_employer_dashboard(employer_profile):
+    """
+    Get the dashboard figures for an employer, from cache when possible.
+
+    Args:
+        employer_profile: EmployerProfile to summarize
+
+    Returns:
+        Dict of dashboard statistics (see build_employer_dashboard)
+    """
+    shared = shared_cache()
+    key = DASHBOARD_SNAPSHOT_KEY.format(
+        employer_id=employer_profile.id,
+        version=get_version(shared, DASHBOARD_VERSION_KEY.format(employer_id=employer_profile.id))
+    )
+    snapshots = shared or cache
+    snapshot = snapshots.get(key)
+    if snapshot is None:
+        snapshot = build_employer_dashboard(employer_profile)
+        snapshots.set(key, snapshot, getattr(settings, 'EMPLOYER_DASHBOARD_CACHE_TTL', DEFAULT_DASHBOARD_CACHE_TTL))
+    return snapshot
+
+
+def build_employer_dashboard(employer_profile):
+    """
+    Compute the dashboard figures for an employer in three queries.
+
+    Args:
+        employer_profile: EmployerProfile to summarize
+
+    Returns:
+        Dict with employee and trip counts, credit totals and growth, CO2
+        saved and the month's top employees
+    """
+    now = timezone.now()
+    this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).date()
+    last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
+
+    employees = employer_profile.employees.aggregate(
+        total_employees=Count('id'),
+        active_employees=Count('id', filter=Q(approved=True))
+    )
+
+    trips = Trip.objects.filter(employee__employer=employer_profile).aggregate(
+        total_trips=Count('id'),
+        pending_trips=Count('id', filter=Q(verification_status='pending')),
+        total_credits=Sum('credits_earned'),
+        co2_saved=Sum('carbon_savings'),
+        this_month_credits=Sum('credits_earned', filter=Q(trip_date__gte=this_month_start)),
+        last_month_credits=Sum(
+            'credits_earned',
+            filter=Q(trip_date__gte=last_month_start, trip_date__lt=this_month_start)
+        )
+    )
+
+    this_month_credits = trips['this_month_credits'] or 0
+    last_month_credits = trips['last_month_credits'] or 1  # Avoid division by zero
+    credits_growth = ((this_month_credits - last_month_credits) / last_month_credits) * 100 if last_month_credits > 0 else 0
+    co2_saved = trips['co2_saved'] or 0
+
+    this_month = Q(trips__trip_date__gte=this_month_start)
+    leaders = employer_profile.employees.filter(approved=True).annotate(
+        trip_count=Count('trips', filter=this_month),
+        total_distance=Sum('trips__distance_km', filter=this_month),
+        total_credits=Sum('trips__credits_earned', filter=this_month),
+        co2_saved=Sum('trips__carbon_savings', filter=this_month)
+    ).filter(trip_count__gt=0).select_related('user').order_by('-total_credits', 'id')[:LEADERBOARD_SIZE]
+
+    return {
+        'total_employees': employees['total_employees'],
+        'active_employees': employees['active_employees'],
+        'total_trips': trips['total_trips'],
+        'pending_trips': trips['pending_trips'],
+        'total_credits': trips['total_credits'] or 0,
+        'credits_growth': credits_growth,
+        'co2_saved': co2_saved,
+        'tree_equivalent': int(co2_saved / 21),  # Rough estimate: 1 tree absorbs ~21kg CO2 per year
+        'top_employees': [
+            {
+                'user': profile.user,
+                'department': getattr(profile, 'department', 'N/A'),
+                'trip_count': profile.trip_count,
+                'total_distance': profile.total_distance or 0,
+                'total_credits': profile.total_credits or 0,
+                'co2_saved': profile.co2_saved or 0
+            }
+            for profile in leaders
+        ],
+    }
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def invalidate_dashboard_on_trip_save(sender, instance, **kwargs):
+    """Invalidate the owning employer's dashboard when a trip is created, ended, verified or deleted."""
+    if Trip.employee.is_cached(instance):
+        employer_id = instance.employee.employer_id
+    else:
+        employer_id = EmployeeProfile.objects.filter(
+            pk=instance.employee_id
+        ).values_list('employer_id', flat=True).first()
+    if employer_id is not None:
+        invalidate_employer_dashboard(employer_id)
+
+
+@receiver(pre_save, sender=EmployeeProfile)
+def remember_dashboard_employer(sender, instance, **kwargs):
+    """Note the employer an existing employee belonged to, in case the save moves them."""
+    instance._dashboard_employer_id = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._dashboard_employer_id = EmployeeProfile.objects.filter(
+            pk=instance.pk
+        ).values_list('employer_id', flat=True).first()
+
+
+@receiver(post_save, sender=EmployeeProfile)
+@receiver(post_delete, sender=EmployeeProfile)
+def invalidate_dashboard_on_employee_change(sender, instance, **kwargs):
+    """Invalidate the employer's dashboard when an employee joins, is approved, moves or is removed."""
+    for employer_id in {instance.employer_id, getattr(instance, '_dashboard_employer_id', None)}:
+        if employer_id is not None:
+            invalidate_employer_dashboard(employer_id)
@@ -2,7 +2,7 @@ from django.urls import path
 from core.views.employer_views import (
     dashboard, employees_list, locations_list, trading,
     pending_trips, trip_approval, create_transaction, create_offer,
-    mark_notification_read, employee_approval, invite_employee,
+    mark_notification_read, mark_all_notifications_read, employee_approval, invite_employee,
     location_add, location_edit, location_delete, location_set_primary,
     employee_marketplace, approve_all_trips
 )
@@ -26,5 +26,6 @@ urlpatterns = [
     path('trips/<int:trip_id>/approve/', trip_approval, name='trip_approval'),
     path('trips/approve-all/', approve_all_trips, name='approve_all_trips'),
     path('notifications/<int:notification_id>/mark-read/', mark_notification_read, name='mark_notification_read'),
+    path('notifications/mark-all-read/', mark_all_notifications_read, name='mark_all_notifications_read'),
     path('employee-marketplace/', employee_marketplace, name='employee_marketplace'),
 ] 
\ No newline at end of file
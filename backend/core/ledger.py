@@ -0,0 +1,328 @@
+"""
+Carbon credit ledger operations.
+
+Credits are consumed oldest-first (FIFO by timestamp). Draw-downs are
+planned in memory over a locked snapshot of the owner's active credits
+and written back with bulk operations in a single transaction.
+"""
+
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from core.employer_stats import invalidate_employer_dashboard
+from trips.models import Trip, CarbonCredit
+from users.models import EmployeeProfile, EmployerProfile
+
+# Validity period for newly issued credits
+CREDIT_VALIDITY_DAYS = 365
+
+# Rows per bulk write statement
+BULK_BATCH_SIZE = 500
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when an owner does not hold enough active credits for a draw-down."""
+
+    def __init__(self, required, available):
+        self.required = required
+        self.available = available
+        super().__init__(f"Not enough credits: {required} required, {available} available")
+
+
+class _Drawdown:
+    """
+    In-memory FIFO draw-down over one owner's active credits.
+
+    Fully consumed credits are marked used; the credit that straddles the
+    requested amount is reduced and a used record is created for the
+    consumed portion, matching the split the views used to do row by row.
+    """
+
+    def __init__(self, credits):
+        self.credits = credits
+        self.available = sum((credit.amount for credit in credits), Decimal('0'))
+        self.changed = {}
+        self.created = []
+        self._index = 0
+
+    def draw(self, amount, source_trip=None, now=None):
+        """
+        Consume amount from the oldest credits.
+
+        Returns:
+            List of (amount, source_credit) portions that were consumed
+        """
+        now = now or timezone.now()
+        remaining = Decimal(str(amount))
+        portions = []
+
+        while remaining > 0 and self._index < len(self.credits):
+            credit = self.credits[self._index]
+
+            if credit.amount <= remaining:
+                # Use the entire credit
+                credit.status = 'used'
+                self.changed[credit.pk] = credit
+                portions.append((credit.amount, credit))
+                remaining -= credit.amount
+                self._index += 1
+            else:
+                # Split the credit, keeping the rest active
+                credit.amount -= remaining
+                self.changed[credit.pk] = credit
+                self.created.append(CarbonCredit(
+                    amount=remaining,
+                    source_trip=source_trip if source_trip is not None else credit.source_trip,
+                    owner_type=credit.owner_type,
+                    owner_id=credit.owner_id,
+                    timestamp=now,
+                    status='used',
+                    expiry_date=credit.expiry_date
+                ))
+                portions.append((remaining, credit))
+                remaining = Decimal('0')
+
+        self.available -= Decimal(str(amount)) - remaining
+        return portions
+
+
+def _lock_active_credits(owner_type, owner_id):
+    """Lock an owner's active credits and return them oldest first."""
+    return list(
+        CarbonCredit.objects.select_for_update().filter(
+            owner_type=owner_type,
+            owner_id=owner_id,
+            status='active'
+        ).order_by('timestamp', 'id')
+    )
+
+
+def approve_trips(employer_profile, trips):
+    """
+    Approve a batch of pending trips and pay their credits out of the employer's wallet.
+
+    The employer's active credits are locked once, the FIFO draw-down for
+    the whole batch is computed in memory, and the results are written with
+    bulk_update/bulk_create inside one transaction, so the number of queries
+    does not grow with the number of trips.
+
+    Args:
+        employer_profile: EmployerProfile paying for the credits
+        trips: Trip queryset (or iterable of trips) to approve; already verified trips are skipped
+
+    Returns:
+        Number of trips approved
+
+    Raises:
+        InsufficientCreditsError: if the employer can't cover the batch; nothing is written
+    """
+    trip_ids = trips.values('id') if hasattr(trips, 'values') else [trip.id for trip in trips]
+    now = timezone.now()
+
+    with transaction.atomic():
+        trips = list(
+            Trip.objects.select_for_update().filter(
+                id__in=trip_ids
+            ).exclude(
+                verification_status='verified'
+            ).order_by('trip_date', 'id')
+        )
+        if not trips:
+            return 0
+
+        paid_trips = [trip for trip in trips if trip.credits_earned and trip.credits_earned > 0]
+        total_needed = sum((trip.credits_earned for trip in paid_trips), Decimal('0'))
+
+        drawdown = _Drawdown(_lock_active_credits('employer', employer_profile.id))
+        if drawdown.available < total_needed:
+            raise InsufficientCreditsError(total_needed, drawdown.available)
+
+        # Pending employee credits already issued for these trips, grouped by trip
+        pending_by_trip = {}
+        pending_credits = CarbonCredit.objects.select_for_update().filter(
+            source_trip_id__in=[trip.id for trip in paid_trips],
+            owner_type='employee',
+            status='pending'
+        )
+        for credit in pending_credits:
+            pending_by_trip.setdefault(credit.source_trip_id, []).append(credit)
+
+        activated = []
+        issued = []
+        for trip in paid_trips:
+            trip_pending = [
+                credit for credit in pending_by_trip.get(trip.id, [])
+                if credit.owner_id == trip.employee_id
+            ]
+            if trip_pending:
+                for credit in trip_pending:
+                    credit.status = 'active'
+                    activated.append(credit)
+            else:
+                # Create new credits for employee if none exist
+                issued.append(CarbonCredit(
+                    amount=trip.credits_earned,
+                    source_trip=trip,
+                    owner_type='employee',
+                    owner_id=trip.employee_id,
+                    timestamp=now,
+                    status='active',
+                    expiry_date=now + timezone.timedelta(days=CREDIT_VALIDITY_DAYS)
+                ))
+
+            # Deduct credits from employer's wallet
+            drawdown.draw(trip.credits_earned, source_trip=trip, now=now)
+
+        Trip.objects.filter(id__in=[trip.id for trip in trips]).update(
+            verification_status='verified',
+            updated_at=now
+        )
+
+        for credit in activated:
+            drawdown.changed[credit.pk] = credit
+        _write_drawdown(drawdown, extra=issued)
+
+        # Trips were verified with a queryset update, which sends no post_save
+        invalidate_employer_dashboard(employer_profile.id)
+
+    return len(trips)
+
+
+def _owner_key(owner):
+    """Resolve an EmployeeProfile/EmployerProfile (or an (owner_type, owner_id) pair) to its ledger key."""
+    if isinstance(owner, tuple):
+        return owner
+    if isinstance(owner, EmployerProfile):
+        return ('employer', owner.id)
+    if isinstance(owner, EmployeeProfile):
+        return ('employee', owner.id)
+    raise TypeError(f"Unsupported credit owner: {owner!r}")
+
+
+def debit(owner, amount, source_trip=None):
+    """
+    Consume credits from an owner's wallet, oldest first.
+
+    Locks the owner's active credits once, plans the split in memory and
+    writes it back with one bulk_update and one bulk_create.
+
+    Args:
+        owner: EmployeeProfile, EmployerProfile or (owner_type, owner_id) pair
+        amount: Decimal amount of credits to consume
+        source_trip: Trip to record on the used portion of a split credit (defaults to the split credit's trip)
+
+    Returns:
+        List of (amount, credit) portions that were consumed
+
+    Raises:
+        InsufficientCreditsError: if the owner holds fewer active credits than amount
+    """
+    owner_type, owner_id = _owner_key(owner)
+    amount = Decimal(str(amount))
+
+    with transaction.atomic():
+        drawdown = _Drawdown(_lock_active_credits(owner_type, owner_id))
+        if drawdown.available < amount:
+            raise InsufficientCreditsError(amount, drawdown.available)
+
+        portions = drawdown.draw(amount, source_trip=source_trip)
+        _write_drawdown(drawdown)
+
+    return portions
+
+
+def transfer(src, dst, amount):
+    """
+    Move credits from one owner to another, oldest source credits first.
+
+    The source's consumed credits are marked used (split where needed) and
+    the destination receives matching active credits with a fresh validity
+    period. The whole transfer is a constant number of queries.
+
+    Args:
+        src: owner giving the credits
+        dst: owner receiving the credits
+        amount: Decimal amount of credits to move
+
+    Returns:
+        List of credits created for the destination
+
+    Raises:
+        InsufficientCreditsError: if the source holds fewer active credits than amount
+    """
+    src_type, src_id = _owner_key(src)
+    dst_type, dst_id = _owner_key(dst)
+    amount = Decimal(str(amount))
+    now = timezone.now()
+
+    with transaction.atomic():
+        drawdown = _Drawdown(_lock_active_credits(src_type, src_id))
+        if drawdown.available < amount:
+            raise InsufficientCreditsError(amount, drawdown.available)
+
+        received = [
+            CarbonCredit(
+                amount=portion,
+                source_trip_id=credit.source_trip_id,
+                owner_type=dst_type,
+                owner_id=dst_id,
+                timestamp=now,
+                status='active',
+                expiry_date=now + timezone.timedelta(days=CREDIT_VALIDITY_DAYS)
+            )
+            for portion, credit in drawdown.draw(amount, now=now)
+        ]
+        _write_drawdown(drawdown, extra=received)
+
+    return received
+
+
+class InsufficientFundsError(Exception):
+    """Raised when a profile's wallet balance can't cover a payment."""
+
+    def __init__(self, required, available):
+        self.required = required
+        self.available = available
+        super().__init__(f"Not enough balance: {required} required, {available} available")
+
+
+def pay(payer, payee, amount):
+    """
+    Move money between two profiles' wallet balances.
+
+    Both balances change with F() updates, and the payer's is conditional
+    on still covering amount, so concurrent payments can't overdraw it or
+    lose each other's writes. Call inside the transaction that records what
+    was paid for so a later failure rolls the payment back too.
+
+    Args:
+        payer: EmployeeProfile or EmployerProfile paying
+        payee: EmployeeProfile or EmployerProfile being paid
+        amount: Decimal amount of money
+
+    Raises:
+        InsufficientFundsError: if the payer's wallet balance is below amount; nothing is written
+    """
+    amount = Decimal(str(amount))
+    with transaction.atomic():
+        paid = type(payer).objects.filter(pk=payer.pk, wallet_balance__gte=amount).update(
+            wallet_balance=F('wallet_balance') - amount
+        )
+        if not paid:
+            available = type(payer).objects.filter(pk=payer.pk).values_list('wallet_balance', flat=True).first()
+            raise InsufficientFundsError(amount, available or Decimal('0'))
+        type(payee).objects.filter(pk=payee.pk).update(wallet_balance=F('wallet_balance') + amount)
+    payer.wallet_balance -= amount
+    payee.wallet_balance += amount
+
+
+def _write_drawdown(drawdown, extra=()):
+    """Persist a planned draw-down (plus any extra new credits) with bulk writes."""
+    if drawdown.changed:
+        CarbonCredit.objects.bulk_update(
+            list(drawdown.changed.values()), ['status', 'amount'], batch_size=BULK_BATCH_SIZE
+        )
+    created = drawdown.created + list(extra)
+    if created:
+        CarbonCredit.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
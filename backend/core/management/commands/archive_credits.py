@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from trips.tasks import ARCHIVE_BATCH_SIZE, DEFAULT_ARCHIVE_AFTER_DAYS, archive_credits
+
+
+class Command(BaseCommand):
+    help = 'Compact used and expired carbon credits older than the archive horizon into CreditArchive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'CREDIT_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS),
+            help='Archive credits settled more than this many days ago'
+        )
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Credits archived per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep archiving as credits age instead of exiting')
+        parser.add_argument('--interval', type=float, default=86400.0, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            before = timezone.now() - timedelta(days=options['days'])
+            archived = archive_credits(before=before, batch_size=batch_size, limit=batch_size)
+            total += archived
+            if archived:
+                self.stdout.write(self.style.SUCCESS(f'Archived {archived} credits'))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} credits in total'))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.analytics import rebuild_daily_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily analytics rollups (credits, trips by mode, transactions) from the raw tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start, end = options['start_date'], options['end_date']
+        if start and end and start > end:
+            raise CommandError('--start-date must not be after --end-date')
+
+        self.stdout.write(self.style.NOTICE('Rebuilding daily rollups...'))
+
+        written = rebuild_daily_rollups(start, end)
+
+        for name, rows in written.items():
+            self.stdout.write(f'{name}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS('Daily rollups rebuilt'))
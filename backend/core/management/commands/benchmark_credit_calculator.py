@@ -0,0 +1,54 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from core.utils.credit_calculator import (
+    calculate_batch,
+    calculate_carbon_credits,
+    calculate_carbon_savings,
+)
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of the scalar and batch credit/savings calculators on synthetic trips'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=1000000, help='Number of synthetic trips')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic trips')
+
+    def handle(self, *args, **options):
+        count = options['trips']
+        rng = random.Random(options['seed'])
+        modes = [mode for mode, _ in Trip.TRANSPORT_MODES]
+
+        # Same shape as Trip.distance_km: Decimal with 2 decimal places
+        distances = [Decimal(rng.randrange(1, 10000)).scaleb(-2) for _ in range(count)]
+        transport_modes = [rng.choice(modes) for _ in range(count)]
+
+        self.stdout.write(self.style.NOTICE(f'Calculating {count} trips...'))
+
+        started = time.perf_counter()
+        scalar_credits = [calculate_carbon_credits(d, m) for d, m in zip(distances, transport_modes)]
+        scalar_savings = [calculate_carbon_savings(d, m) for d, m in zip(distances, transport_modes)]
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch_credits, batch_savings = calculate_batch(distances, transport_modes)
+        batch_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            1 for values in zip(scalar_credits, batch_credits, scalar_savings, batch_savings)
+            if values[0] != values[1] or values[2] != values[3]
+        )
+
+        self.stdout.write(f'scalar: {scalar_seconds:.2f} s ({count / scalar_seconds:,.0f} trips/s)')
+        self.stdout.write(f'batch:  {batch_seconds:.2f} s ({count / batch_seconds:,.0f} trips/s)')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {scalar_seconds / batch_seconds:.1f}x'))
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} trips differ between the scalar and batch results'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Scalar and batch results match exactly'))
@@ -0,0 +1,160 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from users.models import CustomUser, EmployerProfile, EmployeeProfile
+from trips.models import Trip, CarbonCredit
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and compare query plans and timings of the '
+        'dashboard and approval queries with and without the CarbonCredit/Trip indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credits', type=int, default=1000000, help='Number of CarbonCredit rows to seed')
+        parser.add_argument('--trips', type=int, default=1000000, help='Number of Trip rows to seed')
+        parser.add_argument('--employers', type=int, default=100, help='Number of employers to seed')
+        parser.add_argument('--employees', type=int, default=5000, help='Number of employees to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query (best is reported)')
+
+    def handle(self, *args, **options):
+        # Never touch the configured database: build a disposable test database instead
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.NOTICE('Seeding benchmark data...'))
+            employer, employee = self.seed(options)
+
+            queries = self.get_queries(employer, employee)
+            indexes = [
+                (model, index)
+                for model in (CarbonCredit, Trip)
+                for index in model._meta.indexes
+            ]
+
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.remove_index(model, index)
+            before = self.measure(queries, options['repeat'])
+
+            with connection.schema_editor() as schema_editor:
+                for model, index in indexes:
+                    schema_editor.add_index(model, index)
+            after = self.measure(queries, options['repeat'])
+
+            self.report(queries, before, after)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        """Bulk-load employers, employees, trips and credits with a skewed, realistic shape."""
+        now = timezone.now()
+        batch_size = 5000
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_employer_{i}', email=f'bench_employer_{i}@example.com', is_employer=True)
+            for i in range(options['employers'])
+        ], batch_size=batch_size)
+        employers = EmployerProfile.objects.bulk_create([
+            EmployerProfile(user=user, company_name=f'Bench Company {i}')
+            for i, user in enumerate(users)
+        ], batch_size=batch_size)
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench_employee_{i}', email=f'bench_employee_{i}@example.com', is_employee=True)
+            for i in range(options['employees'])
+        ], batch_size=batch_size)
+        employees = EmployeeProfile.objects.bulk_create([
+            EmployeeProfile(user=user, employer=employers[i % len(employers)])
+            for i, user in enumerate(users)
+        ], batch_size=batch_size)
+
+        rng = random.Random(42)
+        modes = [mode for mode, _ in Trip.TRANSPORT_MODES]
+        statuses = ['verified'] * 8 + ['pending', 'rejected']
+
+        for start in range(0, options['trips'], batch_size):
+            Trip.objects.bulk_create([
+                Trip(
+                    employee=employees[rng.randrange(len(employees))],
+                    trip_date=(now - timedelta(days=rng.randrange(730))).date(),
+                    transport_mode=rng.choice(modes),
+                    distance_km=Decimal('10.00'),
+                    carbon_savings=Decimal('1.20'),
+                    credits_earned=Decimal('1.50'),
+                    verification_status=rng.choice(statuses)
+                )
+                for _ in range(start, min(start + batch_size, options['trips']))
+            ], batch_size=batch_size)
+
+        credit_statuses = ['used'] * 6 + ['active'] * 2 + ['pending', 'expired']
+        for start in range(0, options['credits'], batch_size):
+            rows = []
+            for _ in range(start, min(start + batch_size, options['credits'])):
+                if rng.random() < 0.3:
+                    owner_type, owner_id = 'employer', employers[rng.randrange(len(employers))].id
+                else:
+                    owner_type, owner_id = 'employee', employees[rng.randrange(len(employees))].id
+                rows.append(CarbonCredit(
+                    amount=Decimal('1.50'),
+                    owner_type=owner_type,
+                    owner_id=owner_id,
+                    timestamp=now - timedelta(minutes=rng.randrange(525600)),
+                    status=rng.choice(credit_statuses),
+                    expiry_date=now + timedelta(days=365)
+                ))
+            CarbonCredit.objects.bulk_create(rows, batch_size=batch_size)
+
+        return employers[0], employees[0]
+
+    def get_queries(self, employer, employee):
+        """The hot filter shapes used by the dashboards and approval flows."""
+        employee_ids = list(employer.employees.values_list('id', flat=True))
+        return [
+            ('approval: employer active credits, FIFO', lambda: CarbonCredit.objects.filter(
+                owner_type='employer', owner_id=employer.id, status='active'
+            ).order_by('timestamp', 'id')),
+            ('wallet: employee active sum', lambda: CarbonCredit.objects.filter(
+                owner_type='employee', owner_id=employee.id, status='active'
+            ).values('owner_id').annotate(total=Sum('amount'))),
+            ('history: employee credits by status', lambda: CarbonCredit.objects.filter(
+                owner_type='employee', owner_id=employee.id, status='used'
+            ).order_by('-timestamp')[:20]),
+            ('dashboard: employer pending trips', lambda: Trip.objects.filter(
+                employee__in=employee_ids, verification_status='pending'
+            ).order_by('-trip_date')),
+            ('dashboard: employee recent trips', lambda: Trip.objects.filter(
+                employee=employee, trip_date__gte=timezone.now().date() - timedelta(days=30)
+            ).order_by('-trip_date')),
+        ]
+
+    def measure(self, queries, repeat):
+        """Return {label: (best_ms, plan)} for each query."""
+        results = {}
+        for label, build in queries:
+            plan = build().explain()
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build())
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = (best, plan)
+        return results
+
+    def report(self, queries, before, after):
+        for label, _ in queries:
+            before_ms, before_plan = before[label]
+            after_ms, after_plan = after[label]
+            self.stdout.write(self.style.SUCCESS(
+                f'{label}: {before_ms:.2f} ms -> {after_ms:.2f} ms ({before_ms / max(after_ms, 0.001):.1f}x)'
+            ))
+            self.stdout.write(f'  before: {" | ".join(before_plan.splitlines())}')
+            self.stdout.write(f'  after:  {" | ".join(after_plan.splitlines())}')
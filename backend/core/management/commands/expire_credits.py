@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trips.tasks import EXPIRY_BATCH_SIZE, expire_credits
+
+
+class Command(BaseCommand):
+    help = 'Move active carbon credits past their expiry date to expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE, help='Credits expired per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping for newly due credits instead of exiting')
+        parser.add_argument('--interval', type=float, default=3600.0, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            expired = expire_credits(batch_size=batch_size, limit=batch_size)
+            total += expired
+            if expired:
+                self.stdout.write(self.style.SUCCESS(f'Expired {expired} credits'))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Expired {total} credits in total'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trips.tasks import finalize_trips
+
+
+class Command(BaseCommand):
+    help = 'Resolve route distances and addresses for trips ended with a provisional distance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Trips finalized per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new trips instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            finalized = finalize_trips(limit=batch_size)
+            total += finalized
+            if finalized:
+                self.stdout.write(self.style.SUCCESS(f'Finalized {finalized} trips'))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Finalized {total} trips in total'))
@@ -0,0 +1,167 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core.employer_stats import invalidate_dashboards_for_employees
+from core.utils.credit_calculator import calculate_batch
+from trips.models import Trip
+from trips.tasks import sync_pending_credits
+
+
+def _init_worker():
+    """Set up Django in a pool worker; each worker opens its own database connections."""
+    django.setup()
+    connections.close_all()
+
+
+def _filtered_trips(options):
+    """Unverified trips matching the command's date/employer filters (verified trips are already paid)."""
+    trips = Trip.objects.filter(distance_km__isnull=False).exclude(verification_status='verified')
+    if options['start_date']:
+        trips = trips.filter(trip_date__gte=options['start_date'])
+    if options['end_date']:
+        trips = trips.filter(trip_date__lte=options['end_date'])
+    if options['employer']:
+        trips = trips.filter(employee__employer_id__in=options['employer'])
+    return trips
+
+
+def recalculate_range(options, employer_range=None):
+    """
+    Recalculate credits_earned/carbon_savings for the filtered trips.
+
+    Trips are streamed in id order with iterator(chunk_size=batch_size) and
+    each batch is recalculated in one core.utils.credit_calculator.calculate_batch
+    call, with the current SystemConfig multipliers and base rate, as trips
+    are when they are ended and finalized. Changed rows are written back
+    with one bulk_update per batch, and their pending credits are resized
+    in the same transaction (trips.tasks.sync_pending_credits).
+
+    Args:
+        options: Command options (filters, batch_size, dry_run)
+        employer_range: Optional (first_id, last_id) employer id range to restrict to
+
+    Returns:
+        Tuple (scanned, changed, diff_lines)
+    """
+    trips = _filtered_trips(options)
+    if employer_range:
+        trips = trips.filter(employee__employer__id__range=employer_range)
+    trips = trips.only(
+        'id', 'employee_id', 'distance_km', 'transport_mode', 'carbon_savings', 'credits_earned'
+    ).order_by('id')
+
+    batch_size = options['batch_size']
+    scanned = changed = 0
+    diff_lines = []
+    batch = []
+
+    def flush():
+        nonlocal changed
+        updated = []
+        credits, savings = calculate_batch(
+            [trip.distance_km for trip in batch],
+            [trip.transport_mode for trip in batch]
+        )
+        for trip, new_credits, new_savings in zip(batch, credits, savings):
+            if trip.credits_earned == new_credits and trip.carbon_savings == new_savings:
+                continue
+            if options['dry_run']:
+                diff_lines.append(
+                    f'Trip #{trip.id}: credits {trip.credits_earned} -> {new_credits}, '
+                    f'savings {trip.carbon_savings} -> {new_savings}'
+                )
+            trip.credits_earned = new_credits
+            trip.carbon_savings = new_savings
+            updated.append(trip)
+
+        if updated and not options['dry_run']:
+            with transaction.atomic():
+                Trip.objects.bulk_update(updated, ['credits_earned', 'carbon_savings'], batch_size=batch_size)
+                sync_pending_credits(updated)
+                # bulk_update sends no post_save, so drop the affected dashboards here
+                invalidate_dashboards_for_employees(trip.employee_id for trip in updated)
+        changed += len(updated)
+        batch.clear()
+
+    for trip in trips.iterator(chunk_size=batch_size):
+        batch.append(trip)
+        scanned += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return scanned, changed, diff_lines
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculate Trip.credits_earned and Trip.carbon_savings for unverified trips with the configured '
+        'trip credit formula, resizing their pending credits (verified trips are not changed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=date.fromisoformat, help='Only trips on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=date.fromisoformat, help='Only trips on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--employer', type=int, action='append', help='Only trips of this employer id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Trips fetched and written per batch')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes, each handling an employer id range')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the changes without writing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive')
+
+        self.stdout.write(self.style.NOTICE('Recalculating trips...'))
+
+        if options['workers'] == 1:
+            results = [recalculate_range(options)]
+        else:
+            results = self.run_parallel(options)
+
+        scanned = sum(result[0] for result in results)
+        changed = sum(result[1] for result in results)
+        for result in results:
+            for line in result[2]:
+                self.stdout.write(line)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'{changed} of {scanned} trips would change (dry run, nothing written)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Updated {changed} of {scanned} trips'))
+
+    def run_parallel(self, options):
+        """Split the matching employers into contiguous id ranges and process each in its own worker."""
+        employer_ids = list(
+            _filtered_trips(options).order_by().values_list(
+                'employee__employer_id', flat=True
+            ).distinct()
+        )
+        employer_ids.sort()
+        if not employer_ids:
+            return []
+
+        workers = min(options['workers'], len(employer_ids))
+        size = -(-len(employer_ids) // workers)
+        ranges = [
+            (chunk[0], chunk[-1])
+            for chunk in (employer_ids[i:i + size] for i in range(0, len(employer_ids), size))
+        ]
+
+        # Only plain, picklable options go to the workers
+        job = {key: options[key] for key in ('start_date', 'end_date', 'employer', 'batch_size', 'dry_run')}
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            return list(pool.map(recalculate_range, [job] * len(ranges), ranges))
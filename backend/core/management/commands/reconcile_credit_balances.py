@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from trips.models import CreditBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized credit balances from CarbonCredit and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without rewriting the balances',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        self.stdout.write(self.style.NOTICE('Reconciling credit balances...'))
+
+        drift = CreditBalance.rebuild(dry_run=dry_run)
+
+        for owner_type, owner_id, status, stored, expected in drift:
+            self.stdout.write(self.style.WARNING(
+                f'{owner_type} #{owner_id} {status}: stored {stored}, expected {expected}'
+            ))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All credit balances match CarbonCredit'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'Found {len(drift)} drifted balance values (dry run, nothing changed)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Corrected {len(drift)} drifted balance values'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.tasks import run_report_job
+
+
+class Command(BaseCommand):
+    help = 'Render pending PDF/XLSX report jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while True:
+            job = run_report_job()
+            if job is not None:
+                total += 1
+                if job.status == 'completed':
+                    self.stdout.write(self.style.SUCCESS(f'Rendered report job #{job.id}: {job.file.name}'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Report job #{job.id} failed: {job.error}'))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} report jobs'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 08:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistanceCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_latitude', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('start_longitude', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('end_latitude', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('end_longitude', models.DecimalField(decimal_places=4, max_digits=9)),
+                ('mode', models.CharField(max_length=20)),
+                ('distance_km', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('start_latitude', 'start_longitude', 'end_latitude', 'end_longitude', 'mode'), name='unique_distance_cache_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_distancecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCreditRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('credits_issued', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credit_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day',), name='unique_daily_credit_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('credit_volume', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day',), name='unique_daily_transaction_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTripRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('transport_mode', models.CharField(max_length=20)),
+                ('trip_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'transport_mode'), name='unique_daily_trip_rollup')],
+            },
+        ),
+    ]
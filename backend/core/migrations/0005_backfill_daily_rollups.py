@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Fill the daily rollup tables from the existing credits, trips and transactions (see core.analytics)."""
+    CarbonCredit = apps.get_model('trips', 'CarbonCredit')
+    Trip = apps.get_model('trips', 'Trip')
+    MarketplaceTransaction = apps.get_model('marketplace', 'MarketplaceTransaction')
+    DailyCreditRollup = apps.get_model('core', 'DailyCreditRollup')
+    DailyTripRollup = apps.get_model('core', 'DailyTripRollup')
+    DailyTransactionRollup = apps.get_model('core', 'DailyTransactionRollup')
+
+    credit_rows = [
+        DailyCreditRollup(day=row['day'], credits_issued=row['total'] or 0, credit_count=row['count'])
+        for row in CarbonCredit.objects.order_by().values(day=TruncDate('timestamp')).annotate(
+            total=Sum('amount'), count=Count('id')
+        )
+    ]
+    trip_rows = [
+        DailyTripRollup(day=row['trip_date'], transport_mode=row['transport_mode'], trip_count=row['count'])
+        for row in Trip.objects.order_by().values('trip_date', 'transport_mode').annotate(count=Count('id'))
+    ]
+    transaction_rows = [
+        DailyTransactionRollup(
+            day=row['day'],
+            transaction_count=row['count'],
+            credit_volume=row['volume'] or 0,
+            total_value=row['value'] or 0
+        )
+        for row in MarketplaceTransaction.objects.order_by().values(day=TruncDate('created_at')).annotate(
+            count=Count('id'), volume=Sum('credit_amount'), value=Sum('total_price')
+        )
+    ]
+
+    for model, rows in (
+        (DailyCreditRollup, credit_rows),
+        (DailyTripRollup, trip_rows),
+        (DailyTransactionRollup, transaction_rows),
+    ):
+        model.objects.all().delete()
+        model.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_reportjob'),
+        ('trips', '0008_trip_distance_status'),
+        ('marketplace', '0006_offer_book_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,53 @@
-from django.db import models
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import models, transaction, IntegrityError
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
+from .utils.versioning import bump_version, get_version
+
+
+# Shared cache keys for SystemConfig (only used when SYSTEM_CONFIG_CACHE is set)
+CONFIG_VERSION_KEY = 'system_config:version'
+CONFIG_VALUES_KEY = 'system_config:values:{version}'
+
+
+class _ConfigCache:
+    """
+    Process-local snapshot of all active SystemConfig values.
+
+    The snapshot is tagged with a version stamp. Without a shared cache the
+    stamp is local and only changes when a config is saved/deleted in this
+    process, so the snapshot is also reloaded every SYSTEM_CONFIG_CACHE_TTL
+    seconds to pick up changes made by other workers. With a shared cache
+    the stamp lives there and is re-checked at most every TTL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = None
+        self.version = 0
+        self.checked_at = 0.0
+
+    def clear(self):
+        with self.lock:
+            self.values = None
+            self.version += 1
+
+
+_config_cache = _ConfigCache()
+
+
+def _shared_config_cache():
+    """Return the Django cache used to share config versions, or None for process-local only."""
+    alias = getattr(settings, 'SYSTEM_CONFIG_CACHE', None)
+    return caches[alias] if alias else None
+
 
 class SystemConfig(models.Model):
     """Model for storing system-wide configuration settings."""
@@ -18,8 +65,300 @@ class SystemConfig(models.Model):
     @classmethod
     def get_value(cls, name, default=None):
         """Get a configuration value by name."""
-        try:
-            config = cls.objects.get(name=name, is_active=True)
-            return config.value
-        except cls.DoesNotExist:
-            return default
+        return cls.get_values().get(name, default)
+
+    @classmethod
+    def get_values(cls):
+        """
+        Get all active configuration values, served from the process-local cache.
+
+        Returns:
+            Dict mapping config name to value
+        """
+        cache = _config_cache
+        ttl = getattr(settings, 'SYSTEM_CONFIG_CACHE_TTL', 30)
+        now = time.monotonic()
+
+        values = cache.values
+        if values is not None and now - cache.checked_at < ttl:
+            return values
+
+        shared = _shared_config_cache()
+        with cache.lock:
+            if shared is None:
+                version = cache.version
+                values = None
+            else:
+                version = get_version(shared, CONFIG_VERSION_KEY)
+                if version == cache.version and cache.values is not None:
+                    cache.checked_at = now
+                    return cache.values
+                values = shared.get(CONFIG_VALUES_KEY.format(version=version))
+
+            if values is None:
+                values = dict(cls.objects.filter(is_active=True).values_list('name', 'value'))
+                if shared is not None:
+                    shared.set(CONFIG_VALUES_KEY.format(version=version), values, timeout=None)
+
+            cache.values = values
+            cache.version = version
+            cache.checked_at = now
+            return values
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Drop the cached values here and bump the shared version so other workers reload."""
+        _config_cache.clear()
+        shared = _shared_config_cache()
+        if shared is not None:
+            bump_version(shared, CONFIG_VERSION_KEY)
+
+
+@receiver(post_save, sender=SystemConfig)
+@receiver(post_delete, sender=SystemConfig)
+def invalidate_system_config_cache(sender, **kwargs):
+    """Invalidate cached config values when a SystemConfig changes."""
+    # Drop the local snapshot now so this request sees its own write, and again
+    # once committed so no worker keeps a snapshot read before the commit
+    SystemConfig.invalidate_cache()
+    transaction.on_commit(SystemConfig.invalidate_cache)
+
+
+@receiver(setting_changed)
+def reset_system_config_cache(setting, **kwargs):
+    """Drop the local snapshot when the config cache settings change (e.g. override_settings in tests)."""
+    if setting in ('SYSTEM_CONFIG_CACHE', 'SYSTEM_CONFIG_CACHE_TTL', 'CACHES'):
+        _config_cache.clear()
+
+
+class DistanceCacheEntry(models.Model):
+    """Persisted route distance between two quantized coordinate pairs for a travel mode."""
+
+    start_latitude = models.DecimalField(max_digits=9, decimal_places=4)
+    start_longitude = models.DecimalField(max_digits=9, decimal_places=4)
+    end_latitude = models.DecimalField(max_digits=9, decimal_places=4)
+    end_longitude = models.DecimalField(max_digits=9, decimal_places=4)
+    mode = models.CharField(max_length=20)
+    distance_km = models.DecimalField(max_digits=10, decimal_places=3)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['start_latitude', 'start_longitude', 'end_latitude', 'end_longitude', 'mode'],
+                name='unique_distance_cache_key'
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"({self.start_latitude}, {self.start_longitude}) -> "
+            f"({self.end_latitude}, {self.end_longitude}) [{self.mode}]: {self.distance_km} km"
+        )
+
+
+class CacheVersion(models.Model):
+    """
+    Version stamp for cached snapshots, used when no cache is shared between workers.
+
+    The stamp is bumped in the same transaction as the write it covers, so
+    every worker sees the new version as soon as that write commits.
+    """
+
+    key = models.CharField(max_length=200, unique=True)
+    version = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+def upsert_deltas(model, key_fields, sum_fields, deltas, lookup=None, create_defaults=None, using='default'):
+    """
+    Add per-key deltas to the running totals of a table with one row per key.
+
+    Locks the affected rows, adjusts them in memory and writes them back with
+    one bulk_update plus one bulk_create for keys seen for the first time.
+    Must be called inside the transaction that changed the source rows.
+
+    Args:
+        model: Model with a unique key over key_fields, sum_fields and updated_at
+        key_fields: Names of the fields making up each key
+        sum_fields: Names of the fields the deltas may change; others are ignored
+        deltas: Dict mapping key tuples to {field: amount}
+        lookup: Optional Q selecting (at least) the affected rows; defaults to one term per key
+        create_defaults: Optional dict mapping keys to extra field values for new rows
+        using: Database alias
+    """
+    deltas = {
+        key: {field: amount for field, amount in changes.items() if field in sum_fields and amount}
+        for key, changes in deltas.items()
+    }
+    deltas = {key: changes for key, changes in deltas.items() if changes}
+    if not deltas:
+        return
+
+    if lookup is None:
+        lookup = models.Q()
+        for key in deltas:
+            lookup |= models.Q(**dict(zip(key_fields, key)))
+    create_defaults = create_defaults or {}
+
+    with transaction.atomic(using=using):
+        existing = {
+            tuple(getattr(row, field) for field in key_fields): row
+            for row in model.objects.using(using).select_for_update().filter(lookup)
+        }
+
+        to_update, to_create = [], {}
+        now = timezone.now()
+        for key, changes in deltas.items():
+            row = existing.get(key)
+            if row is None:
+                row = model(**dict(zip(key_fields, key)), **create_defaults.get(key, {}))
+                to_create[key] = row
+            else:
+                to_update.append(row)
+            for field, amount in changes.items():
+                setattr(row, field, getattr(row, field) + amount)
+            row.updated_at = now
+
+        if to_update:
+            model.objects.using(using).bulk_update(to_update, list(sum_fields) + ['updated_at'])
+        if to_create:
+            try:
+                with transaction.atomic(using=using):
+                    model.objects.using(using).bulk_create(to_create.values())
+            except IntegrityError:
+                # Another transaction created a row first; retry against the locked rows
+                upsert_deltas(
+                    model, key_fields, sum_fields, {key: deltas[key] for key in to_create},
+                    create_defaults=create_defaults, using=using
+                )
+
+
+class DailyRollup(models.Model):
+    """
+    Base for pre-summed analytics tables keyed by day (plus KEY_FIELDS).
+
+    Rows are adjusted with apply_deltas in the same transaction as the
+    writes they summarize, and can be rebuilt from the raw tables with the
+    backfill_daily_rollups command.
+    """
+
+    KEY_FIELDS = ('day',)
+    SUM_FIELDS = ()
+
+    day = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def apply_deltas(cls, deltas, using='default'):
+        """
+        Apply per-key deltas, e.g. {(date(2024, 5, 1),): {'transaction_count': 1, 'credit_volume': Decimal('5')}}.
+
+        Must be called inside the transaction that changed the source rows
+        (see upsert_deltas).
+        """
+        upsert_deltas(cls, cls.KEY_FIELDS, cls.SUM_FIELDS, deltas, using=using)
+
+
+class DailyCreditRollup(DailyRollup):
+    """Carbon credits issued per day (by CarbonCredit.timestamp, any status)."""
+
+    SUM_FIELDS = ('credits_issued', 'credit_count')
+
+    credits_issued = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credit_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day'], name='unique_daily_credit_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.credits_issued} credits issued"
+
+
+class DailyTripRollup(DailyRollup):
+    """Trips logged per day and transport mode (by Trip.trip_date)."""
+
+    KEY_FIELDS = ('day', 'transport_mode')
+    SUM_FIELDS = ('trip_count',)
+
+    transport_mode = models.CharField(max_length=20)
+    trip_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'transport_mode'], name='unique_daily_trip_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.transport_mode}: {self.trip_count} trips"
+
+
+class DailyTransactionRollup(DailyRollup):
+    """Marketplace transactions per day (by MarketplaceTransaction.created_at, any status)."""
+
+    SUM_FIELDS = ('transaction_count', 'credit_volume', 'total_value')
+
+    transaction_count = models.IntegerField(default=0)
+    credit_volume = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day'], name='unique_daily_transaction_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.transaction_count} transactions"
+
+
+class ReportJob(models.Model):
+    """A PDF/XLSX report rendered in the background and downloaded once ready."""
+
+    REPORT_TYPES = (
+        ('summary', 'Summary Report'),
+        ('transactions', 'Transactions Report'),
+        ('price', 'Price History Report'),
+        ('employer_activity', 'Employer Activity Report'),
+    )
+
+    FORMATS = (
+        ('pdf', 'PDF'),
+        ('xlsx', 'Excel'),
+    )
+
+    STATUS = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='report_jobs'
+    )
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
+    date_range = models.CharField(max_length=10, default='7d')
+    format = models.CharField(max_length=10, choices=FORMATS)
+    status = models.CharField(max_length=10, choices=STATUS, default='pending')
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker queue: oldest pending jobs first
+            models.Index(fields=['status', 'created_at'], name='report_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_report_type_display()} ({self.format}, {self.date_range}): {self.status}"
@@ -0,0 +1,155 @@
+"""
+Keyset (cursor) pagination for APIView list endpoints.
+
+A page is fetched by filtering on the ordering columns of the last row
+already seen, e.g. ``(timestamp, id) < (last.timestamp, last.id)``,
+instead of OFFSET, so deep pages cost the same as the first and rows
+written while a client pages don't shift or repeat results. The ordering
+must end in a unique field (the id) and use non-null columns. The cursor
+is an opaque token holding the last row's ordering values.
+
+Every paginated endpoint answers with the same envelope:
+``{"results": [...], "next_cursor": <token or null>, "next": <url or null>}``.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Largest page a client may ask for with ?page_size=
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ParseError):
+    """Raised (as a 400 response in API views) when a cursor can't be decoded."""
+    default_detail = 'Invalid cursor'
+
+
+def _fields(ordering):
+    """Split an ordering like ('-timestamp', '-id') into (field, descending) pairs."""
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def encode_cursor(row, ordering):
+    """
+    Opaque cursor pointing just past row in the given ordering.
+
+    Args:
+        row: Model instance from the current page
+        ordering: Ordering the page was fetched with
+    """
+    values = [getattr(row, field) for field, _ in _fields(ordering)]
+    payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    """
+    Decode a cursor from encode_cursor back into ordering values.
+
+    Raises:
+        InvalidCursor: if the cursor is malformed or doesn't match the ordering
+    """
+    fields = _fields(ordering)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [model._meta.get_field(field).to_python(value) for (field, _), value in zip(fields, values)]
+    except Exception:
+        raise InvalidCursor()
+
+
+def keyset_filter(ordering, values):
+    """Q matching rows strictly after values in ordering (row-value comparison spelled out as ORs)."""
+    fields = _fields(ordering)
+    condition = Q()
+    for index, (field, descending) in enumerate(fields):
+        clause = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[index]})
+        for earlier in range(index):
+            clause &= Q(**{fields[earlier][0]: values[earlier]})
+        condition |= clause
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=None):
+    """
+    One page of queryset in ordering, starting after cursor.
+
+    Args:
+        queryset: QuerySet to page (any existing ordering is replaced)
+        ordering: Tuple of order_by fields ending in a unique field, e.g. ('-created_at', '-id')
+        cursor: Optional next_cursor from the previous page
+        page_size: Rows per page (defaults to REST_FRAMEWORK PAGE_SIZE, capped at MAX_PAGE_SIZE)
+
+    Returns:
+        (rows, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        InvalidCursor: if cursor is malformed
+    """
+    page_size = max(1, min(page_size or settings.REST_FRAMEWORK.get('PAGE_SIZE', 20), MAX_PAGE_SIZE))
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, queryset.model, ordering)))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1], ordering) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination for APIViews over an (ordering field, id) keyset.
+
+    Usage in a view::
+
+        paginator = KeysetPagination(ordering=('-timestamp', '-id'))
+        page = paginator.paginate_queryset(credits, request, view=self)
+        return paginator.get_paginated_response(CarbonCreditSerializer(page, many=True).data)
+
+    Clients pass ?cursor= (from next_cursor) and optionally ?page_size=.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, ordering=('-created_at', '-id')):
+        self.ordering = tuple(ordering)
+        self.next_cursor = None
+        self.request = None
+
+    def get_page_size(self, request):
+        try:
+            return int(request.query_params.get(self.page_size_query_param, 0)) or None
+        except ValueError:
+            return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        rows, self.next_cursor = keyset_page(
+            queryset,
+            self.ordering,
+            cursor=request.query_params.get(self.cursor_query_param),
+            page_size=self.get_page_size(request)
+        )
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data, **extra):
+        """Wrap a serialized page in the shared envelope; extra keys are added alongside."""
+        return Response({
+            'results': data,
+            'next_cursor': self.next_cursor,
+            'next': self.get_next_link(),
+            **extra,
+        })
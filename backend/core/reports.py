@@ -0,0 +1,435 @@
+"""
+Bank report data and PDF/XLSX rendering.
+
+A report is a list of tables (heading, header row, row iterable). Row
+iterables stream from values_list(...).iterator(); XLSX output goes
+through openpyxl's write-only workbook, and PDF output is split into one
+ReportLab table per PDF_TABLE_ROWS rows so long reports lay out quickly.
+Rendering runs in the background (see core.tasks), never on the request
+path. The on-screen reports page is served from cached snapshots (below).
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from openpyxl import Workbook
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from marketplace.models import MarketplaceTransaction
+from .utils.versioning import bump_version_on_commit, get_version, shared_cache
+
+# Days covered by each date range option ('all' has no start)
+DATE_RANGE_DAYS = {'7d': 7, '30d': 30, '90d': 90, '1y': 365}
+
+# Rows fetched per database round trip
+REPORT_CHUNK_SIZE = 2000
+
+# Rows per ReportLab table; one huge table is slow to lay out and split
+PDF_TABLE_ROWS = 500
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def report_window(date_range, now=None):
+    """
+    Get the (start, end) datetimes for a date range option.
+
+    Args:
+        date_range: One of DATE_RANGE_DAYS or 'all'
+        now: Optional end of the window (defaults to now)
+
+    Returns:
+        Tuple (start, end); start is None for 'all'
+    """
+    end = now or timezone.now()
+    days = DATE_RANGE_DAYS.get(date_range)
+    return (end - timedelta(days=days) if days else None), end
+
+
+def _transactions(start, end):
+    transactions = MarketplaceTransaction.objects.filter(created_at__lte=end)
+    if start is not None:
+        transactions = transactions.filter(created_at__gte=start)
+    return transactions
+
+
+def _price():
+    """Per-credit price of a transaction, as an expression."""
+    return F('total_price') / F('credit_amount')
+
+
+def summary_stats(transactions):
+    """
+    Headline figures for a set of transactions, in one aggregate query.
+
+    Shared by the reports page, the report exports and the bank summary
+    views, so they always agree.
+
+    Returns:
+        Dict with total_transactions, total_volume, total_value, avg_price,
+        completed and pending
+    """
+    stats = transactions.aggregate(
+        total_transactions=Count('id'),
+        total_volume=Sum('credit_amount'),
+        total_value=Sum('total_price'),
+        avg_price=Avg(_price()),
+        completed=Count('id', filter=Q(status='completed')),
+        pending=Count('id', filter=Q(status='pending')),
+    )
+    return {
+        'total_transactions': stats['total_transactions'],
+        'total_volume': stats['total_volume'] or 0,
+        'total_value': stats['total_value'] or 0,
+        'avg_price': stats['avg_price'] or 0,
+        'completed': stats['completed'],
+        'pending': stats['pending'],
+    }
+
+
+def daily_prices(transactions):
+    """
+    Per-day price statistics, oldest day first, in one grouped query.
+
+    Each row has day, count, volume, price_sum, avg_price, low, high and the
+    day's open_price/close_price (first and last trade, from correlated
+    subqueries), so no transaction rows are fetched into Python.
+    """
+    priced = transactions.filter(credit_amount__gt=0).annotate(price=_price())
+
+    def trade_price(*ordering):
+        return Subquery(priced.filter(created_at__date=OuterRef('day')).order_by(*ordering).values('price')[:1])
+
+    return priced.order_by().values(day=TruncDate('created_at')).annotate(
+        count=Count('id'),
+        volume=Sum('credit_amount'),
+        price_sum=Sum('price'),
+        avg_price=Avg('price'),
+        low=Min('price'),
+        high=Max('price'),
+        open_price=trade_price('created_at', 'id'),
+        close_price=trade_price('-created_at', '-id'),
+    ).order_by('day')
+
+
+def employer_activity(transactions):
+    """
+    Purchase and sale totals per employer, from one query grouped by (buyer, seller).
+
+    Returns:
+        Dict mapping company name to {'buy': [count, volume, value], 'sell': [count, volume, value]}
+    """
+    activity = {}
+    pairs = transactions.order_by().values('buyer__company_name', 'seller__company_name').annotate(
+        count=Count('id'), volume=Sum('credit_amount'), value=Sum('total_price')
+    )
+    for pair in pairs:
+        for side, name in (('buy', pair['buyer__company_name']), ('sell', pair['seller__company_name'])):
+            totals = activity.setdefault(name, {'buy': [0, 0, 0], 'sell': [0, 0, 0]})[side]
+            totals[0] += pair['count']
+            totals[1] += pair['volume'] or 0
+            totals[2] += pair['value'] or 0
+    return activity
+
+
+def _transaction_records(transactions):
+    """Transactions newest first as (created_at, id, buyer, seller, volume, total_price, status) tuples."""
+    return transactions.order_by('-created_at', '-id').values_list(
+        'created_at', 'id', 'buyer__company_name', 'seller__company_name', 'credit_amount', 'total_price', 'status'
+    )
+
+
+def report_tables(report_type, start, end):
+    """
+    Build the tables for a report.
+
+    Args:
+        report_type: One of ReportJob.REPORT_TYPES
+        start: Start datetime (or None for all time)
+        end: End datetime
+
+    Returns:
+        List of (heading, header, rows) tuples; rows may be a generator
+    """
+    transactions = _transactions(start, end)
+
+    if report_type == 'summary':
+        stats = summary_stats(transactions)
+        return [('Summary', ['Metric', 'Value'], [
+            ['Total Transactions', stats['total_transactions']],
+            ['Total Volume', stats['total_volume']],
+            ['Total Value', stats['total_value']],
+            ['Average Price', round(stats['avg_price'], 2)],
+            ['Completed Transactions', stats['completed']],
+            ['Pending Transactions', stats['pending']],
+        ])]
+
+    if report_type == 'transactions':
+        return [(
+            'Transactions',
+            ['Date', 'Transaction ID', 'Buyer', 'Seller', 'Volume', 'Price', 'Total Value', 'Status'],
+            _transaction_rows(transactions)
+        )]
+
+    if report_type == 'price':
+        return [(
+            'Daily Prices',
+            ['Date', 'Transactions', 'Volume', 'Avg. Price', 'Low', 'High'],
+            (
+                [row['day'].isoformat(), row['count'], row['volume'],
+                 round(row['avg_price'], 2), round(row['low'], 2), round(row['high'], 2)]
+                for row in daily_prices(transactions).iterator(chunk_size=REPORT_CHUNK_SIZE)
+            )
+        )]
+
+    if report_type == 'employer_activity':
+        activity = employer_activity(transactions)
+        return [(
+            'Employer Activity',
+            ['Employer', 'Purchases', 'Buy Volume', 'Buy Value', 'Sales', 'Sell Volume', 'Sell Value'],
+            [
+                [company or 'N/A', *activity[company]['buy'], *activity[company]['sell']]
+                for company in sorted(activity, key=lambda name: name or '')
+            ]
+        )]
+
+    raise ValueError(f"Unknown report type: {report_type}")
+
+
+def _transaction_rows(transactions):
+    for created_at, tx_id, buyer, seller, credit_amount, total_price, status in _transaction_records(
+        transactions
+    ).iterator(chunk_size=REPORT_CHUNK_SIZE):
+        yield [
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            tx_id,
+            buyer or 'N/A',
+            seller or 'N/A',
+            credit_amount,
+            round(total_price / credit_amount, 2) if credit_amount else 0,
+            total_price,
+            status,
+        ]
+
+
+def csv_rows(tables):
+    """
+    Flatten report tables into CSV rows.
+
+    The first table is written as its header and rows, so a single-table
+    report is a plain CSV. Each later table follows a blank separator row
+    and a row holding its heading.
+    """
+    for index, (heading, header, rows) in enumerate(tables):
+        if index:
+            yield []
+            yield [heading]
+        yield header
+        yield from rows
+
+
+def render_xlsx(title, tables, output):
+    """Write the report tables to an XLSX file object, one worksheet per table."""
+    workbook = Workbook(write_only=True)
+    for heading, header, rows in tables:
+        sheet = workbook.create_sheet(title=heading[:31])
+        sheet.append([title])
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(output)
+
+
+def render_pdf(title, tables, output, subtitle=''):
+    """Write the report tables to a PDF file object."""
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f2937')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')]),
+    ])
+
+    def flowables():
+        yield Paragraph(title, styles['Title'])
+        if subtitle:
+            yield Paragraph(subtitle, styles['Normal'])
+        for heading, header, rows in tables:
+            yield Spacer(1, 12)
+            yield Paragraph(heading, styles['Heading2'])
+            chunk = []
+            emitted = False
+            for row in rows:
+                chunk.append([str(value) for value in row])
+                if len(chunk) >= PDF_TABLE_ROWS:
+                    yield Table([header] + chunk, repeatRows=1, style=table_style)
+                    chunk = []
+                    emitted = True
+            if chunk or not emitted:
+                yield Table([header] + chunk, repeatRows=1, style=table_style)
+
+    document = SimpleDocTemplate(output, pagesize=landscape(A4), title=title)
+    document.build(list(flowables()))
+
+
+# Report page snapshots -------------------------------------------------------
+#
+# The bank reports page shows the same few windows to every bank admin, so
+# each report is computed in one pass over the window's transactions and
+# cached under (report_type, start, end, data version). Saving or deleting
+# any marketplace transaction (creation, approval, rejection...) bumps the
+# version, so a cached snapshot is never staler than the last transaction.
+
+# Default lifetime of a cached report snapshot, in seconds
+DEFAULT_REPORT_CACHE_TTL = 600
+
+# Most recent transactions listed on the transactions report page (the
+# export has all of them)
+REPORT_PAGE_TRANSACTIONS = 500
+
+# Buyers/sellers listed on the employer activity report
+TOP_EMPLOYERS = 5
+
+REPORT_VERSION_KEY = 'bank_reports:version'
+REPORT_SNAPSHOT_KEY = 'bank_reports:{version}:{report_type}:{start}:{end}'
+
+
+def invalidate_report_snapshots():
+    """Drop every cached report snapshot now and again once the current transaction commits."""
+    bump_version_on_commit(shared_cache(), REPORT_VERSION_KEY)
+
+
+def get_report_snapshot(report_type, start_date, end_date=None):
+    """
+    Get the data for a reports page, from cache when possible.
+
+    Args:
+        report_type: 'summary', 'transactions', 'price' or 'employer_activity'
+        start_date: Start datetime of the window (or None for all time)
+        end_date: End datetime of the window, or None for "up to now"
+
+    Returns:
+        Dict of template context for the report (see build_report_snapshot)
+    """
+    shared = shared_cache()
+    key = REPORT_SNAPSHOT_KEY.format(
+        version=get_version(shared, REPORT_VERSION_KEY),
+        report_type=report_type,
+        start=start_date.isoformat() if start_date else 'all',
+        end=end_date.isoformat() if end_date else 'now'
+    )
+    snapshots = shared or cache
+    snapshot = snapshots.get(key)
+    if snapshot is None:
+        snapshot = build_report_snapshot(report_type, start_date, end_date)
+        snapshots.set(key, snapshot, getattr(settings, 'BANK_REPORT_CACHE_TTL', DEFAULT_REPORT_CACHE_TTL))
+    return snapshot
+
+
+def build_report_snapshot(report_type, start_date, end_date=None):
+    """
+    Compute the data for a reports page with one query.
+
+    Uses the same builders as the report exports (summary_stats,
+    daily_prices, employer_activity), so the page and the files agree.
+
+    Args:
+        report_type: 'summary', 'transactions', 'price' or 'employer_activity'
+        start_date: Start datetime of the window (or None for all time)
+        end_date: End datetime of the window, or None for "up to now"
+
+    Returns:
+        Dict of plain values, safe to cache
+    """
+    transactions = MarketplaceTransaction.objects.all()
+    if start_date is not None:
+        transactions = transactions.filter(created_at__gte=start_date)
+    if end_date is not None:
+        transactions = transactions.filter(created_at__lte=end_date)
+
+    if report_type == 'summary':
+        stats = summary_stats(transactions)
+        return {
+            'total_transactions': stats['total_transactions'],
+            'total_volume': stats['total_volume'],
+            'total_value': stats['total_value'],
+            'avg_price': stats['avg_price'],
+            # Every marketplace transaction is both a purchase and a sale
+            'buy_count': stats['total_transactions'],
+            'sell_count': stats['total_transactions'],
+        }
+
+    if report_type == 'transactions':
+        rows = _transaction_records(transactions)[:REPORT_PAGE_TRANSACTIONS]
+        return {'transactions': [
+            {
+                'id': tx_id,
+                'timestamp': created_at,
+                'transaction_type': 'buy',
+                'buyer': buyer or 'N/A',
+                'seller': seller or 'N/A',
+                'volume': credit_amount,
+                'price': total_price / credit_amount if credit_amount else 0,
+                'total_value': total_price,
+            }
+            for created_at, tx_id, buyer, seller, credit_amount, total_price, _ in rows
+        ]}
+
+    if report_type == 'price':
+        days = list(daily_prices(transactions))
+        count = sum(day['count'] for day in days)
+        return {
+            'current_price': days[-1]['close_price'] if days else 0,
+            'avg_price': sum(day['price_sum'] for day in days) / count if count else 0,
+            'highest_price': max((day['high'] for day in days), default=0),
+            'lowest_price': min((day['low'] for day in days), default=0),
+            'price_changes': [
+                {
+                    'date': day['day'],
+                    'open_price': day['open_price'],
+                    'close_price': day['close_price'],
+                    'price_change': day['close_price'] - day['open_price'],
+                    'percent_change': (
+                        (day['close_price'] - day['open_price']) / day['open_price'] * 100 if day['open_price'] else 0
+                    ),
+                }
+                for day in reversed(days)
+            ],
+        }
+
+    if report_type == 'employer_activity':
+        activity = employer_activity(transactions)
+
+        def top(side):
+            entries = [
+                {
+                    'employer_name': name,
+                    'transaction_count': totals[side][0],
+                    'volume': totals[side][1],
+                    'total_value': totals[side][2],
+                }
+                for name, totals in activity.items() if totals[side][0]
+            ]
+            return sorted(entries, key=lambda entry: (-entry['volume'], entry['employer_name'] or ''))[:TOP_EMPLOYERS]
+
+        return {'top_buyers': top('buy'), 'top_sellers': top('sell')}
+
+    return {}
+
+
+@receiver(post_save, sender=MarketplaceTransaction)
+@receiver(post_delete, sender=MarketplaceTransaction)
+def invalidate_reports_on_transaction_change(sender, **kwargs):
+    """Invalidate cached report snapshots when a transaction is created, changes status or is deleted."""
+    invalidate_report_snapshots()
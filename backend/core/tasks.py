@@ -0,0 +1,107 @@
+"""
+Background report rendering.
+
+Export requests only create a ReportJob; the PDF/XLSX file is rendered by
+the in-process worker pool (queued on commit by enqueue_report_job) or by
+the run_report_jobs management command, written to MEDIA_ROOT through the
+default storage, and then polled for and downloaded by the client.
+"""
+
+import logging
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ReportJob
+from .reports import render_pdf, render_xlsx, report_tables, report_window
+from .utils.workers import LazyExecutor
+
+logger = logging.getLogger(__name__)
+
+_executor = LazyExecutor('REPORT_JOB_WORKERS', 1, 'report-job')
+
+
+def enqueue_report_job(job_id):
+    """
+    Queue a report job for background rendering once the current transaction commits.
+
+    With REPORT_JOBS_ASYNC disabled nothing is queued and jobs wait for the
+    run_report_jobs command.
+    """
+    if not getattr(settings, 'REPORT_JOBS_ASYNC', True):
+        return
+    transaction.on_commit(lambda: _executor.submit(_run_job, job_id))
+
+
+def _run_job(job_id):
+    """Worker-thread entry point: own database connection, errors logged not raised."""
+    close_old_connections()
+    try:
+        run_report_job(job_id)
+    except Exception:
+        logger.exception(f"Report job {job_id} failed")
+    finally:
+        close_old_connections()
+
+
+def claim_report_job(job_id=None):
+    """
+    Mark a pending job as running so no other worker picks it up.
+
+    Args:
+        job_id: Optional id of the job to claim; defaults to the oldest pending job
+
+    Returns:
+        The claimed ReportJob, or None if there was nothing to claim
+    """
+    pending = ReportJob.objects.filter(status='pending')
+    if job_id is not None:
+        pending = pending.filter(id=job_id)
+    for candidate in pending.order_by('created_at').values_list('id', flat=True)[:5]:
+        if ReportJob.objects.filter(id=candidate, status='pending').update(status='running'):
+            return ReportJob.objects.get(id=candidate)
+    return None
+
+
+def run_report_job(job_id=None):
+    """
+    Render a pending report job to a file.
+
+    Args:
+        job_id: Optional id of the job to run; defaults to the oldest pending job
+
+    Returns:
+        The finished ReportJob, or None if there was nothing to run
+    """
+    job = claim_report_job(job_id)
+    if job is None:
+        return None
+
+    try:
+        start, end = report_window(job.date_range, now=job.created_at)
+        title = job.get_report_type_display()
+        subtitle = f"{start:%Y-%m-%d} to {end:%Y-%m-%d}" if start else f"All time to {end:%Y-%m-%d}"
+        tables = report_tables(job.report_type, start, end)
+
+        with tempfile.TemporaryFile() as output:
+            if job.format == 'pdf':
+                render_pdf(title, tables, output, subtitle=subtitle)
+            else:
+                render_xlsx(f"{title} ({subtitle})", tables, output)
+            output.seek(0)
+            name = f"{job.report_type}_report_{job.date_range}_{job.id}.{job.format}"
+            job.file.save(name, File(output), save=False)
+
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.save(update_fields=['file', 'status', 'completed_at'])
+    except Exception as e:
+        logger.exception(f"Rendering report job {job.id} failed")
+        job.status = 'failed'
+        job.error = str(e)
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'completed_at'])
+    return job
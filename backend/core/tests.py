@@ -1,3 +1,1243 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from random import Random
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from openpyxl import load_workbook
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.utils import timezone
+from rest_framework.test import APIClient
+from datetime import timedelta
+from decimal import Decimal
+
+from users.models import EmployerProfile, EmployeeProfile
+from trips.models import Trip, CarbonCredit, CreditBalance
+from trips.tasks import archive_credits
+from marketplace.models import EmployeeCreditOffer, MarketplaceTransaction
+from core.views import admin_views, bank_views, employee_views, employer_views
+from core.ledger import approve_trips, debit, pay, transfer, InsufficientCreditsError, InsufficientFundsError
+from core.employer_stats import (
+    DASHBOARD_VERSION_KEY, build_employer_dashboard, get_employer_dashboard, invalidate_employer_dashboard
+)
+from core.analytics import rebuild_daily_rollups
+from core.reports import build_report_snapshot, csv_rows, report_tables
+from core.tasks import run_report_job
+from core.models import (
+    ReportJob, SystemConfig, CacheVersion, DistanceCacheEntry, DailyCreditRollup, DailyTripRollup,
+    DailyTransactionRollup, _config_cache
+)
+from core.utils.distance_cache import DistanceCache, distance_cache
+from core.utils.distance_calculator import (
+    MAX_MATRIX_DESTINATIONS, MAX_MATRIX_ELEMENTS, MAX_MATRIX_ORIGINS, resolve_distances
+)
+from core.utils.credit_calculator import calculate_batch, calculate_carbon_credits, calculate_carbon_savings
+
+User = get_user_model()
+
+
+class LedgerTestMixin:
+    """Shared employer/employee setup for ledger tests."""
+
+    def setUp(self):
+        self.employer_user = User.objects.create_user(
+            username='employer',
+            email='employer@test.com',
+            password='password123',
+            is_employer=True
+        )
+        self.employer = EmployerProfile.objects.create(
+            user=self.employer_user,
+            company_name='Test Company'
+        )
+        self.employee_user = User.objects.create_user(
+            username='employee',
+            email='employee@test.com',
+            password='password123',
+            is_employee=True
+        )
+        self.employee = EmployeeProfile.objects.create(
+            user=self.employee_user,
+            employer=self.employer
+        )
+
+    def give_credits(self, amount, owner_type='employer', owner_id=None, days_ago=0):
+        return CarbonCredit.objects.create(
+            amount=Decimal(amount),
+            owner_type=owner_type,
+            owner_id=owner_id or self.employer.id,
+            timestamp=timezone.now() - timedelta(days=days_ago),
+            status='active',
+            expiry_date=timezone.now() + timedelta(days=365)
+        )
+
+    def add_employees(self, count):
+        offset = EmployeeProfile.objects.count()
+        for i in range(count):
+            user = User.objects.create_user(
+                username=f'staff{offset + i}', email=f'staff{offset + i}@test.com', password='password123', is_employee=True
+            )
+            employee = EmployeeProfile.objects.create(user=user, employer=self.employer)
+            Trip.objects.create(
+                employee=employee, transport_mode='carpool', distance_km=Decimal('5'),
+                carbon_savings=Decimal('1.00'), credits_earned=Decimal(i + 1), verification_status='verified'
+            )
+
+    def create_trip(self, credits, with_pending_credit=True):
+        trip = Trip.objects.create(
+            employee=self.employee,
+            transport_mode='carpool',
+            distance_km=Decimal('10'),
+            carbon_savings=Decimal(credits),
+            credits_earned=Decimal(credits),
+            verification_status='pending'
+        )
+        if with_pending_credit:
+            CarbonCredit.objects.create(
+                amount=Decimal(credits),
+                source_trip=trip,
+                owner_type='employee',
+                owner_id=self.employee.id,
+                status='pending'
+            )
+        return trip
+
+
+class ApproveTripsTestCase(LedgerTestMixin, TestCase):
+    """Tests for the bulk trip approval engine."""
+
+    def test_approves_batch_with_fifo_drawdown(self):
+        """Test that a batch approval drains the oldest employer credits first."""
+        oldest = self.give_credits('5.00', days_ago=2)
+        newest = self.give_credits('20.00', days_ago=1)
+        self.create_trip('3.00')
+        self.create_trip('4.00', with_pending_credit=False)
+
+        approved = approve_trips(self.employer, Trip.objects.all())
+
+        self.assertEqual(approved, 2)
+        self.assertEqual(Trip.objects.filter(verification_status='verified').count(), 2)
+        oldest.refresh_from_db()
+        newest.refresh_from_db()
+        self.assertEqual(oldest.status, 'used')
+        self.assertEqual(newest.amount, Decimal('18.00'))
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('18.00'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id), Decimal('7.00'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id, 'pending'), Decimal('0'))
+        self.assertEqual(CreditBalance.rebuild(dry_run=True), [])
+
+    def test_insufficient_credits_writes_nothing(self):
+        """Test that an uncovered batch raises and leaves every trip pending."""
+        self.give_credits('2.00')
+        self.create_trip('3.00')
+
+        with self.assertRaises(InsufficientCreditsError) as ctx:
+            approve_trips(self.employer, Trip.objects.all())
+
+        self.assertEqual(ctx.exception.required, Decimal('3.00'))
+        self.assertEqual(Trip.objects.filter(verification_status='pending').count(), 1)
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('2.00'))
+
+    def test_query_count_independent_of_batch_size(self):
+        """Test that approving many trips costs the same number of queries as a few."""
+        self.give_credits('1000.00')
+        for _ in range(5):
+            self.create_trip('1.00')
+        with CaptureQueriesContext(connection) as small:
+            approve_trips(self.employer, Trip.objects.filter(verification_status='pending'))
+
+        for _ in range(100):
+            self.create_trip('1.00')
+        with CaptureQueriesContext(connection) as large:
+            approve_trips(self.employer, Trip.objects.filter(verification_status='pending'))
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class LedgerServiceTestCase(LedgerTestMixin, TestCase):
+    """Tests for the debit/transfer ledger service."""
+
+    def test_debit_splits_oldest_credit(self):
+        """Test that a debit uses the oldest credits and splits the last one."""
+        first = self.give_credits('4.00', days_ago=3)
+        second = self.give_credits('6.00', days_ago=1)
+
+        debit(self.employer, Decimal('5.00'))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'used')
+        self.assertEqual(second.amount, Decimal('5.00'))
+        self.assertEqual(second.status, 'active')
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('5.00'))
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id, 'used'), Decimal('5.00'))
+
+    def test_debit_rejects_overdraft(self):
+        """Test that debiting more than the active balance raises and changes nothing."""
+        self.give_credits('3.00')
+
+        with self.assertRaises(InsufficientCreditsError):
+            debit(self.employer, Decimal('3.01'))
+
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('3.00'))
+
+    def test_transfer_moves_credits(self):
+        """Test that a transfer debits the source and credits the destination."""
+        self.give_credits('2.00', days_ago=2)
+        self.give_credits('10.00', days_ago=1)
+
+        received = transfer(self.employer, self.employee, Decimal('7.50'))
+
+        self.assertEqual(sum(credit.amount for credit in received), Decimal('7.50'))
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('4.50'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id), Decimal('7.50'))
+        self.assertEqual(CreditBalance.rebuild(dry_run=True), [])
+
+    def test_transfer_query_count_is_constant(self):
+        """Test that a transfer costs the same queries however many rows it consumes."""
+        self.give_credits('1.00')
+        # First transfer creates the employee's balance row
+        transfer(self.employer, self.employee, Decimal('0.25'))
+        with CaptureQueriesContext(connection) as few:
+            transfer(self.employer, self.employee, Decimal('0.50'))
+
+        for days_ago in range(50):
+            self.give_credits('1.00', days_ago=days_ago)
+        with CaptureQueriesContext(connection) as many:
+            transfer(self.employer, self.employee, Decimal('40.25'))
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_pay_rejects_overdraft_with_current_balance(self):
+        """Test that a payment checks the stored wallet balance, not the caller's copy."""
+        EmployerProfile.objects.filter(pk=self.employer.pk).update(wallet_balance=Decimal('10.00'))
+        self.employer.wallet_balance = Decimal('100.00')
+
+        with self.assertRaises(InsufficientFundsError) as raised:
+            pay(self.employer, self.employee, Decimal('10.01'))
+        self.assertEqual(raised.exception.available, Decimal('10.00'))
+
+        pay(self.employer, self.employee, Decimal('4.00'))
+        self.employer.refresh_from_db()
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employer.wallet_balance, Decimal('6.00'))
+        self.assertEqual(self.employee.wallet_balance, Decimal('4.00'))
+
+    def process_offer(self, offer, action):
+        request = RequestFactory().post('/', {'action': action})
+        request.user = self.employer_user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        employer_views.process_employee_offer(request, offer.id)
+        return [str(message) for message in request._messages]
+
+    def test_employee_offer_is_settled_once(self):
+        """Test that an employee offer moves credits and money once, however often it is approved."""
+        self.give_credits('5.00', owner_type='employee', owner_id=self.employee.id)
+        EmployerProfile.objects.filter(pk=self.employer.pk).update(wallet_balance=Decimal('50.00'))
+        offer = EmployeeCreditOffer.objects.create(
+            employee=self.employee, employer=self.employer, offer_type='sell',
+            credit_amount=Decimal('2.00'), market_rate=Decimal('5.00'), total_amount=Decimal('10.00')
+        )
+
+        self.assertIn('Successfully bought', self.process_offer(offer, 'approve')[0])
+        messages = self.process_offer(offer, 'approve') + self.process_offer(offer, 'reject')
+
+        self.assertTrue(all('Successfully' not in message for message in messages))
+        offer.refresh_from_db()
+        self.employer.refresh_from_db()
+        self.employee.refresh_from_db()
+        self.assertEqual(offer.status, 'approved')
+        self.assertEqual(self.employer.wallet_balance, Decimal('40.00'))
+        self.assertEqual(self.employee.wallet_balance, Decimal('10.00'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id), Decimal('3.00'))
+        self.assertEqual(CreditBalance.get_balance('employer', self.employer.id), Decimal('2.00'))
+
+        # A request still holding the pending offer can't settle it again
+        offer.status = 'pending'
+        with self.assertRaises(EmployeeCreditOffer.DoesNotExist):
+            employer_views._lock_pending_offer(offer)
+
+
+class SystemConfigTestMixin:
+    """
+    Start and end every test with an empty SystemConfig cache.
+
+    Configs a test writes are rolled back with it, but the process-local
+    snapshot would keep serving them to later tests until the TTL expires.
+    """
+
+    def setUp(self):
+        super().setUp()
+        SystemConfig.invalidate_cache()
+        self.addCleanup(SystemConfig.invalidate_cache)
+
+
+class SystemConfigCacheTestCase(SystemConfigTestMixin, TestCase):
+    """Tests for the cached SystemConfig lookups."""
+
+    def setUp(self):
+        super().setUp()
+        SystemConfig.objects.create(name='base_credit_rate', value='0.2')
+
+    def test_credit_calculation_uses_no_queries_when_warm(self):
+        """Test that credit calculation hits the database only for the first lookup."""
+        calculate_carbon_credits(Decimal('10'), 'carpool')
+
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(50):
+                credits = calculate_carbon_credits(Decimal('10'), 'carpool')
+
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(credits, Decimal('3.00'))
+
+    def test_save_and_delete_invalidate(self):
+        """Test that saving or deleting a config is visible on the next lookup."""
+        self.assertEqual(SystemConfig.get_value('base_credit_rate'), '0.2')
+
+        config = SystemConfig.objects.get(name='base_credit_rate')
+        config.value = '0.5'
+        config.save()
+        self.assertEqual(SystemConfig.get_value('base_credit_rate'), '0.5')
+
+        config.delete()
+        self.assertEqual(SystemConfig.get_value('base_credit_rate', 'missing'), 'missing')
+
+    def test_config_settings_change_drops_snapshot(self):
+        """Test that overriding the config cache settings starts from an empty snapshot."""
+        SystemConfig.get_value('base_credit_rate')
+        self.assertIsNotNone(_config_cache.values)
+
+        with self.settings(SYSTEM_CONFIG_CACHE_TTL=60):
+            self.assertIsNone(_config_cache.values)
+
+    @override_settings(
+        SYSTEM_CONFIG_CACHE='system_config',
+        SYSTEM_CONFIG_CACHE_TTL=0,
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'system_config': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'config-test'},
+        }
+    )
+    def test_shared_cache_serves_other_workers(self):
+        """Test that a worker with a cold local cache loads values from the shared cache."""
+        self.assertEqual(SystemConfig.get_value('base_credit_rate'), '0.2')
+
+        # Simulate another process: empty local snapshot, same shared cache
+        SystemConfig.invalidate_cache()
+        SystemConfig.get_value('base_credit_rate')
+        _config_cache.values = None
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(SystemConfig.get_value('base_credit_rate'), '0.2')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        SystemConfig.objects.filter(name='base_credit_rate').update(value='0.3')
+        SystemConfig.invalidate_cache()
+        self.assertEqual(SystemConfig.get_value('base_credit_rate'), '0.3')
+
+
+class BatchCreditCalculatorTestCase(SystemConfigTestMixin, TestCase):
+    """Tests for the vectorized credit/savings calculator."""
+
+    def assertMatchesScalar(self, distances, modes):
+        credits, savings = calculate_batch(distances, modes)
+        self.assertEqual(credits, [calculate_carbon_credits(d, m) for d, m in zip(distances, modes)])
+        self.assertEqual(savings, [calculate_carbon_savings(d, m) for d, m in zip(distances, modes)])
+
+    def test_matches_scalar_including_ties(self):
+        """Test that batch results equal the scalar path, half-even ties included."""
+        distances = [Decimal('10.10'), Decimal('0.05'), Decimal('12.34'), Decimal('0'), Decimal('99999.99')]
+        modes = ['carpool', 'public_transport', 'walking', 'bicycle', 'work_from_home']
+        self.assertMatchesScalar(distances * 3, modes + ['car', 'unknown', 'carpool'] + modes + modes[:2])
+
+    def test_matches_scalar_for_more_decimal_places(self):
+        """Test that distances with more than 2 decimal places (or floats) aren't rounded first."""
+        random = Random(6)
+        distances = [Decimal('703.5253'), 703.5253, '12.34567', 5] + [
+            Decimal(random.randrange(10 ** 8)).scaleb(-4) for _ in range(2000)
+        ]
+        modes = ['public_transport'] * 4 + [
+            random.choice(['carpool', 'public_transport', 'bicycle', 'walking']) for _ in range(2000)
+        ]
+        self.assertMatchesScalar(distances, modes)
+        self.assertEqual(calculate_batch([Decimal('703.5253')], ['public_transport'])[0], [Decimal('140.71')])
+
+    def test_uses_config_multipliers(self):
+        """Test that configured multipliers with many decimal places stay exact."""
+        SystemConfig.objects.create(name='multiplier_bicycle', value='1.123456789')
+        SystemConfig.objects.create(name='base_credit_rate', value='0.0333333')
+        self.assertMatchesScalar([Decimal('17.35'), Decimal('250.01')], ['bicycle', 'bicycle'])
+
+    def test_large_factors_fall_back_to_exact_integers(self):
+        """Test that products too large for int64 are still computed exactly."""
+        SystemConfig.objects.create(name='multiplier_walking', value='123456.123456789012')
+        self.assertMatchesScalar([Decimal('999999.99'), Decimal('0.01')], ['walking', 'walking'])
+
+    def test_none_distance_and_length_mismatch(self):
+        """Test that missing distances count as zero and mismatched inputs are rejected."""
+        self.assertEqual(calculate_batch([None], ['bicycle']), ([Decimal('0.00')], [Decimal('0.00')]))
+        self.assertEqual(calculate_batch([], []), ([], []))
+        with self.assertRaises(ValueError):
+            calculate_batch([Decimal('1')], [])
+
+
+class RecalculateTripsCommandTestCase(SystemConfigTestMixin, LedgerTestMixin, TestCase):
+    """Tests for the recalculate_trips management command."""
+
+    def setUp(self):
+        super().setUp()
+        self.trip = self.create_trip('9.99', with_pending_credit=False)
+        self.old_trip = self.create_trip('9.99', with_pending_credit=False)
+        Trip.objects.filter(pk=self.old_trip.pk).update(trip_date=timezone.now().date() - timedelta(days=60))
+
+    def test_dry_run_reports_without_writing(self):
+        """Test that --dry-run prints the diff and leaves trips untouched."""
+        out = StringIO()
+        call_command('recalculate_trips', '--dry-run', stdout=out)
+
+        self.assertIn(f'Trip #{self.trip.id}: credits 9.99 -> 1.50', out.getvalue())
+        self.assertIn('2 of 2 trips would change', out.getvalue())
+        self.assertEqual(Trip.objects.filter(credits_earned=Decimal('9.99')).count(), 2)
+
+    def test_recalculates_filtered_trips(self):
+        """Test that only trips inside the date filter are rewritten."""
+        start = (timezone.now().date() - timedelta(days=7)).isoformat()
+        call_command('recalculate_trips', '--start-date', start, '--batch-size', '1', stdout=StringIO())
+
+        self.trip.refresh_from_db()
+        self.old_trip.refresh_from_db()
+        self.assertEqual(self.trip.credits_earned, Decimal('1.50'))
+        self.assertEqual(self.trip.carbon_savings, Decimal('0.96'))
+        self.assertEqual(self.old_trip.credits_earned, Decimal('9.99'))
+
+    def test_skips_verified_trips_and_syncs_pending_credits(self):
+        """Test that paid trips keep their credits and pending credits follow the recalculation."""
+        Trip.objects.filter(pk=self.old_trip.pk).update(verification_status='verified')
+        pending_trip = self.create_trip('9.99')
+
+        out = StringIO()
+        call_command('recalculate_trips', stdout=out)
+
+        self.assertIn('Updated 2 of 2 trips', out.getvalue())
+        self.old_trip.refresh_from_db()
+        self.assertEqual(self.old_trip.credits_earned, Decimal('9.99'))
+        self.assertEqual(CarbonCredit.objects.get(source_trip=pending_trip).amount, Decimal('1.50'))
+        # A trip without a pending credit gets one, dated like those issued at trip end
+        credit = CarbonCredit.objects.get(source_trip=self.trip)
+        self.assertEqual((credit.status, credit.amount), ('pending', Decimal('1.50')))
+        self.assertIsNotNone(credit.expiry_date)
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id, 'pending'), Decimal('3.00'))
+
+    def test_multiplier_change_is_applied(self):
+        """Test that a changed SystemConfig multiplier is picked up by the recalculation."""
+        call_command('recalculate_trips', stdout=StringIO())
+        SystemConfig.objects.create(name='multiplier_carpool', value='2.5')
+        SystemConfig.objects.create(name='base_credit_rate', value='0.2')
+
+        out = StringIO()
+        call_command('recalculate_trips', stdout=out)
+
+        self.assertIn('Updated 2 of 2 trips', out.getvalue())
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.credits_earned, Decimal('5.00'))
+        self.assertEqual(self.trip.carbon_savings, Decimal('0.96'))
+        self.assertEqual(CarbonCredit.objects.get(source_trip=self.trip).amount, Decimal('5.00'))
+
+    def test_employer_filter(self):
+        """Test that --employer skips other employers' trips."""
+        out = StringIO()
+        call_command('recalculate_trips', '--employer', str(self.employer.id + 1), stdout=out)
+
+        self.assertIn('Updated 0 of 0 trips', out.getvalue())
+
+
+class DistanceCacheTestCase(TestCase):
+    """Tests for the route distance cache."""
+
+    def setUp(self):
+        self.cache = DistanceCache(maxsize=2, ttl=3600)
+        self.calls = 0
+
+    def resolve(self, distance='12.345'):
+        def resolver():
+            self.calls += 1
+            return Decimal(distance)
+        return resolver
+
+    def test_repeat_commute_resolves_once(self):
+        """Test that a repeated pair is served from memory, then from the table after a restart."""
+        home, office = (19.07601, 72.87771), (19.11762, 72.90603)
+        self.assertEqual(self.cache.get_or_resolve(home, office, 'driving', self.resolve()), Decimal('12.345'))
+
+        # Coordinates within the key precision share the entry
+        with CaptureQueriesContext(connection) as ctx:
+            self.cache.get_or_resolve((19.076012, 72.877708), office, 'driving', self.resolve())
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        fresh = DistanceCache(ttl=3600)
+        self.assertEqual(fresh.get_or_resolve(home, office, 'driving', self.resolve()), Decimal('12.345'))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+        self.assertEqual(fresh.stats()['db_hits'], 1)
+
+    def test_mode_is_part_of_key_and_lru_evicts(self):
+        """Test that modes are cached separately and the LRU keeps only maxsize entries."""
+        start, end = (1.0, 1.0), (2.0, 2.0)
+        for mode in ('driving', 'walking', 'transit'):
+            self.cache.get_or_resolve(start, end, mode, self.resolve())
+
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(DistanceCacheEntry.objects.count(), 3)
+
+    def test_expired_entries_are_refreshed(self):
+        """Test that entries older than the TTL count as misses and are overwritten."""
+        start, end = (1.0, 1.0), (2.0, 2.0)
+        self.cache.get_or_resolve(start, end, 'driving', self.resolve('5'))
+        DistanceCacheEntry.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        self.cache.clear()
+
+        self.assertEqual(self.cache.get_or_resolve(start, end, 'driving', self.resolve('6')), Decimal('6'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(DistanceCacheEntry.objects.get().distance_km, Decimal('6.000'))
+
+    def test_failed_resolution_is_not_cached(self):
+        """Test that a resolver error propagates and leaves nothing cached."""
+        def fail():
+            raise ValueError('no route')
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_resolve((1, 1), (2, 2), 'driving', fail)
+        self.assertFalse(DistanceCacheEntry.objects.exists())
+
+
+class DistanceMatrixStub(BaseHTTPRequestHandler):
+    """Local Distance Matrix stand-in: distance is 1 km per 0.01 degrees of latitude difference."""
+
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        origins = [tuple(map(float, point.split(','))) for point in query['origins'][0].split('|')]
+        destinations = [tuple(map(float, point.split(','))) for point in query['destinations'][0].split('|')]
+        self.requests.append((origins, destinations))
+
+        if (len(origins) > MAX_MATRIX_ORIGINS or len(destinations) > MAX_MATRIX_DESTINATIONS
+                or len(origins) * len(destinations) > MAX_MATRIX_ELEMENTS):
+            body = {'status': 'MAX_ELEMENTS_EXCEEDED', 'rows': []}
+        else:
+            body = {'status': 'OK', 'rows': [
+                {'elements': [
+                    {'status': 'ZERO_RESULTS'} if destination[0] < 0 else
+                    {'status': 'OK', 'distance': {'value': round(abs(origin[0] - destination[0]) * 100000)}}
+                    for destination in destinations
+                ]}
+                for origin in origins
+            ]}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class BatchDistanceResolverTestCase(TestCase):
+    """Tests for batched Distance Matrix resolution against a local stub server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), DistanceMatrixStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/maps/api/distancematrix/json'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        DistanceMatrixStub.requests = []
+        distance_cache.clear()
+
+    def resolve(self, pairs):
+        with override_settings(GOOGLE_MAPS_DISTANCE_MATRIX_URL=self.url):
+            return resolve_distances(pairs)
+
+    def test_commutes_are_grouped_into_few_requests(self):
+        """Test that 60 homes to one office and back cost 6 requests, then none once cached."""
+        office = (19.5, 72.8)
+        homes = [(19.0 + i * 0.001, 72.9) for i in range(60)]
+        pairs = [(home, office) for home in homes] + [(office, home) for home in homes]
+
+        distances = self.resolve(pairs)
+
+        self.assertEqual(len(DistanceMatrixStub.requests), 6)
+        self.assertEqual(distances[0], Decimal('50'))
+        self.assertEqual(distances[60], Decimal('50'))
+        self.assertEqual(distances[59], Decimal('44.1'))
+        for origins, destinations in DistanceMatrixStub.requests:
+            self.assertLessEqual(len(origins) * len(destinations), MAX_MATRIX_ELEMENTS)
+
+        self.assertEqual(self.billed_elements(), 120)
+
+        self.assertEqual(self.resolve(pairs), distances)
+        self.assertEqual(len(DistanceMatrixStub.requests), 6)
+
+    def billed_elements(self):
+        return sum(len(origins) * len(destinations) for origins, destinations in DistanceMatrixStub.requests)
+
+    def test_scattered_pairs_bill_only_their_elements(self):
+        """Test that unrelated pairs aren't packed into matrices billing elements nobody asked for."""
+        pairs = [((float(i), 1.0), (float(i) + 0.5, 2.0)) for i in range(40)]
+
+        distances = self.resolve(pairs)
+
+        self.assertTrue(all(distance == Decimal('50') for distance in distances))
+        self.assertEqual(self.billed_elements(), 40)
+
+    def test_pairs_sharing_points_share_requests(self):
+        """Test that two offices with the same homes are merged into one matrix with no waste."""
+        offices = [(19.5, 72.8), (19.6, 72.8)]
+        homes = [(19.0 + i * 0.001, 72.9) for i in range(10)]
+        pairs = [(home, office) for office in offices for home in homes] + [((1.0, 1.0), (2.0, 1.0))]
+
+        self.resolve(pairs)
+
+        self.assertEqual(len(DistanceMatrixStub.requests), 2)
+        self.assertEqual(self.billed_elements(), 21)
+
+    def test_unroutable_pairs_are_none(self):
+        """Test that element-level failures come back as None and are not cached."""
+        distances = self.resolve([((1.0, 1.0), (-1.0, 1.0)), ((1.0, 1.0), (2.0, 1.0))])
+
+        self.assertEqual(distances, [None, Decimal('100')])
+        self.assertEqual(DistanceCacheEntry.objects.count(), 1)
+
+
+class EmployerDashboardTestCase(LedgerTestMixin, TestCase):
+    """Tests for the cached employer dashboard snapshot."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_figures(self):
+        """Test the totals and that the leaderboard is ordered by this month's credits."""
+        self.add_employees(7)
+        self.create_trip('2.50', with_pending_credit=False)
+
+        stats = build_employer_dashboard(self.employer)
+
+        self.assertEqual(stats['total_employees'], 8)
+        self.assertEqual(stats['total_trips'], 8)
+        self.assertEqual(stats['pending_trips'], 1)
+        self.assertEqual(stats['total_credits'], Decimal('30.50'))
+        self.assertEqual(stats['co2_saved'], Decimal('9.50'))
+        self.assertEqual(
+            [row['total_credits'] for row in stats['top_employees']],
+            [Decimal('7'), Decimal('6'), Decimal('5'), Decimal('4'), Decimal('3')]
+        )
+
+    def assertDashboardQueries(self, warm_queries):
+        self.add_employees(1)
+        with CaptureQueriesContext(connection) as small:
+            build_employer_dashboard(self.employer)
+
+        self.add_employees(30)
+        with CaptureQueriesContext(connection) as large:
+            build_employer_dashboard(self.employer)
+
+        get_employer_dashboard(self.employer)
+        with CaptureQueriesContext(connection) as warm:
+            get_employer_dashboard(self.employer)
+
+        self.assertEqual(len(small.captured_queries), 3)
+        self.assertEqual(len(large.captured_queries), 3)
+        self.assertEqual(len(warm.captured_queries), warm_queries)
+
+    @override_settings(SHARED_CACHE='default')
+    def test_query_count_independent_of_workforce(self):
+        """Test that a cold snapshot costs the same queries for 1 or 30 employees, and a warm one none."""
+        self.assertDashboardQueries(warm_queries=0)
+
+    def test_version_stamp_in_database_without_shared_cache(self):
+        """Test that without a shared cache the version stamp is one indexed lookup in the database."""
+        self.assertDashboardQueries(warm_queries=1)
+        key = DASHBOARD_VERSION_KEY.format(employer_id=self.employer.id)
+        self.assertIsNone(cache.get(key))
+
+        version = CacheVersion.objects.get(key=key).version
+
+        # A write in another worker bumps the stamp that every worker reads
+        Trip.objects.update(verification_status='pending')
+        invalidate_employer_dashboard(self.employer.id)
+        self.assertEqual(CacheVersion.objects.get(key=key).version, version + 1)
+        self.assertEqual(get_employer_dashboard(self.employer)['pending_trips'], Trip.objects.count())
+
+    def test_verification_invalidates_snapshot(self):
+        """Test that approving trips refreshes the cached figures."""
+        self.give_credits('100.00')
+        self.create_trip('2.00')
+        self.assertEqual(get_employer_dashboard(self.employer)['pending_trips'], 1)
+
+        approve_trips(self.employer, Trip.objects.all())
+
+        self.assertEqual(get_employer_dashboard(self.employer)['pending_trips'], 0)
+
+    def test_employee_changes_and_bulk_writes_invalidate_snapshot(self):
+        """Test that employee approval/removal, trip deletes and recalculate_trips refresh the figures."""
+        trip = self.create_trip('9.99', with_pending_credit=False)
+        self.assertEqual(get_employer_dashboard(self.employer)['active_employees'], 1)
+
+        self.employee.approved = False
+        self.employee.save()
+        self.assertEqual(get_employer_dashboard(self.employer)['active_employees'], 0)
+
+        call_command('recalculate_trips', stdout=StringIO())
+        self.assertEqual(get_employer_dashboard(self.employer)['total_credits'], Decimal('1.50'))
+
+        trip.delete()
+        self.assertEqual(get_employer_dashboard(self.employer)['total_trips'], 0)
+
+        self.add_employees(1)
+        EmployeeProfile.objects.exclude(pk=self.employee.pk).get().delete()
+        self.assertEqual(get_employer_dashboard(self.employer)['total_employees'], 1)
+
+    def test_dashboard_view(self):
+        """Test that the dashboard renders from the snapshot."""
+        self.client.force_login(self.employer_user)
+        response = self.client.get(reverse('employer:employer_dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_employees'], 1)
+
+
+class EmployeesListTestCase(LedgerTestMixin, TestCase):
+    """Tests for the employer's employee directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.employer_user)
+
+    def test_query_count_independent_of_workforce(self):
+        """Test that listing 2 or 25 employees costs the same number of queries."""
+        self.add_employees(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('employer:employees'))
+
+        self.add_employees(24)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('employer:employees'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_sort_by_credits_and_paginate(self):
+        """Test that employees can be sorted by credits and are paginated."""
+        self.add_employees(24)
+
+        response = self.client.get(reverse('employer:employees'), {'sort': 'credits', 'dir': 'desc'})
+
+        page = response.context['employees']
+        self.assertEqual(page.paginator.count, 25)
+        self.assertEqual(len(page), 20)
+        self.assertEqual(page[0].total_credits, Decimal('24'))
+        self.assertEqual(page[0].trip_count, 1)
+        self.assertEqual(response.context['total_employees'], 25)
+
+        response = self.client.get(reverse('employer:employees'), {'sort': 'credits', 'dir': 'asc', 'page': 2})
+        self.assertEqual(response.context['employees'][4].total_credits, Decimal('24'))
+
+
+class DailyRollupTestCase(LedgerTestMixin, TestCase):
+    """Tests for the daily analytics rollups."""
+
+    def setUp(self):
+        super().setUp()
+        self.buyer = EmployerProfile.objects.create(
+            user=User.objects.create_user(
+                username='buyer', email='buyer@test.com', password='password123', is_employer=True
+            ),
+            company_name='Buyer Company'
+        )
+
+    def snapshot(self):
+        return (
+            sorted(DailyCreditRollup.objects.filter(credit_count__gt=0).values_list('day', 'credits_issued', 'credit_count')),
+            sorted(DailyTripRollup.objects.filter(trip_count__gt=0).values_list('day', 'transport_mode', 'trip_count')),
+            sorted(DailyTransactionRollup.objects.filter(transaction_count__gt=0).values_list(
+                'day', 'transaction_count', 'credit_volume', 'total_value'
+            )),
+        )
+
+    def make_activity(self):
+        self.give_credits('5.00')
+        old = self.give_credits('2.50', days_ago=3)
+        trip = self.create_trip('1.50')
+        Trip.objects.create(
+            employee=self.employee, transport_mode='public_transport', trip_date=timezone.localdate() - timedelta(days=2)
+        )
+        sale = MarketplaceTransaction.objects.create(
+            seller=self.employer, buyer=self.buyer, credit_amount=Decimal('4'), total_price=Decimal('100')
+        )
+        return old, trip, sale
+
+    def test_incremental_rollups_match_rebuild(self):
+        """Test that rollups maintained on write equal a rebuild from the raw tables."""
+        old, trip, sale = self.make_activity()
+
+        # Move a credit to another day, reprice through the queryset, retag a trip and edit a sale
+        old.timestamp = timezone.now() - timedelta(days=1)
+        old.save()
+        CarbonCredit.objects.filter(source_trip=trip).update(amount=Decimal('3.00'))
+        trip.transport_mode = 'public_transport'
+        trip.save()
+        sale.credit_amount = Decimal('6')
+        sale.status = 'completed'
+        sale.save()
+        CarbonCredit.objects.filter(amount=Decimal('5.00')).delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental[0], [
+            (timezone.localdate() - timedelta(days=1), Decimal('2.50'), 1),
+            (timezone.localdate(), Decimal('3.00'), 1),
+        ])
+        self.assertEqual(incremental[1], [
+            (timezone.localdate() - timedelta(days=2), 'public_transport', 1),
+            (timezone.localdate(), 'public_transport', 1),
+        ])
+        self.assertEqual(incremental[2], [(timezone.localdate(), 1, Decimal('6'), Decimal('100'))])
+
+        rebuild_daily_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_backfill_command_restores_cleared_rollups(self):
+        """Test that the backfill command rebuilds rollups that were lost."""
+        self.make_activity()
+        expected = self.snapshot()
+        DailyCreditRollup.objects.all().delete()
+        DailyTripRollup.objects.all().delete()
+
+        out = StringIO()
+        call_command('backfill_daily_rollups', stdout=out)
+
+        self.assertIn('Daily rollups rebuilt', out.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_apply_deltas_updates_and_creates_rows(self):
+        """Test that deltas add to existing rows, create missing ones and skip unknown or zero changes."""
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        DailyTransactionRollup.objects.create(day=today, transaction_count=2, credit_volume=Decimal('3'))
+
+        DailyTransactionRollup.apply_deltas({
+            (today,): {'transaction_count': 1, 'credit_volume': Decimal('1.5'), 'unknown': 7},
+            (yesterday,): {'transaction_count': 1, 'total_value': Decimal('0')},
+            (today - timedelta(days=2),): {'transaction_count': 0},
+        })
+
+        self.assertEqual(
+            sorted(DailyTransactionRollup.objects.values_list('day', 'transaction_count', 'credit_volume', 'total_value')),
+            [(yesterday, 1, Decimal('0'), Decimal('0')), (today, 3, Decimal('4.5'), Decimal('0'))]
+        )
+
+    def test_analytics_endpoint_reads_rollups(self):
+        """Test that the analytics endpoint serves rollup rows in a fixed number of queries."""
+        self.make_activity()
+        admin = User.objects.create_user(
+            username='bank', email='bank@test.com', password='password123', is_bank_admin=True
+        )
+        self.client.force_login(admin)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('bank:bank_dashboard_analytics'), {'days': 30})
+        with CaptureQueriesContext(connection) as long_window:
+            self.client.get(reverse('bank:bank_dashboard_analytics'), {'days': 365})
+
+        data = response.json()
+        self.assertEqual(len(data['credits_per_day']), 2)
+        self.assertEqual(data['trips_per_day'][0]['count'], 1)
+        self.assertEqual(
+            sorted((row['transport_mode'], row['count']) for row in data['transport_modes']),
+            [('carpool', 1), ('public_transport', 1)]
+        )
+        self.assertEqual(data['transactions_per_day'][0]['count'], 1)
+        self.assertEqual(len(queries.captured_queries), len(long_window.captured_queries))
+
+
+class StreamingExportTestCase(LedgerTestMixin, TestCase):
+    """Tests for the streamed CSV report exports."""
+
+    def setUp(self):
+        super().setUp()
+        self.employee_user.first_name, self.employee_user.last_name = 'Ada', 'Lovelace'
+        self.employee_user.save()
+        self.add_employees(3)
+        self.create_trip('2.00')
+        self.admin = User.objects.create_user(
+            username='root', email='root@test.com', password='password123', is_super_admin=True
+        )
+        self.client.force_login(self.admin)
+
+    def export(self, report_type, **params):
+        response = self.client.get(reverse('admin_export_reports'), {'report_type': report_type, **params})
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_trips_export_streams_all_rows(self):
+        """Test that the trips export streams a header plus one row per trip."""
+        rows = self.export('trips', date_range='7d')
+
+        self.assertEqual(rows[0][0], 'Trip ID')
+        self.assertEqual(len(rows), 1 + Trip.objects.count())
+        ada = next(row for row in rows[1:] if row[1] == 'Ada Lovelace')
+        self.assertEqual(ada[2:], [
+            'Test Company', timezone.localdate().isoformat(), 'Carpool', '10.00', '2.00', '2.00', 'Pending'
+        ])
+
+    def test_trips_export_query_count_independent_of_size(self):
+        """Test that the trips export costs the same number of queries for 5 or 30 trips."""
+        with CaptureQueriesContext(connection) as small:
+            self.export('trips')
+        self.add_employees(25)
+        with CaptureQueriesContext(connection) as large:
+            rows = self.export('trips')
+
+        self.assertEqual(len(rows), 1 + Trip.objects.count())
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_employers_export_query_count_independent_of_employers(self):
+        """Test that the employers export doesn't query per employer."""
+        self.give_credits('7.50')
+
+        with CaptureQueriesContext(connection) as one_employer:
+            rows = self.export('employers')
+        for i in range(3):
+            EmployerProfile.objects.create(
+                user=User.objects.create_user(username=f'co{i}', email=f'co{i}@test.com', password='password123'),
+                company_name=f'Company {i}'
+            )
+        with CaptureQueriesContext(connection) as four_employers:
+            self.export('employers')
+
+        self.assertEqual(rows[1][:3], ['Test Company', '4', '4'])
+        self.assertEqual([Decimal(value) for value in rows[1][3:]], [Decimal('5'), Decimal('7.5')])
+        self.assertEqual(len(one_employer.captured_queries), len(four_employers.captured_queries))
+
+    def test_bank_transactions_export(self):
+        """Test that the bank transactions export derives the price per credit."""
+        buyer = EmployerProfile.objects.create(
+            user=User.objects.create_user(
+                username='buyer', email='buyer@test.com', password='password123', is_employer=True
+            ),
+            company_name='Buyer Company'
+        )
+        MarketplaceTransaction.objects.create(
+            seller=self.employer, buyer=buyer, credit_amount=Decimal('4'), total_price=Decimal('100')
+        )
+        bank_admin = User.objects.create_user(
+            username='bank', email='bank@test.com', password='password123', is_bank_admin=True
+        )
+        request = RequestFactory().get('/', {'report_type': 'transactions'})
+        request.user = bank_admin
+
+        response = bank_views.export_reports(request)
+
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[1][1:7], ['Test Company', 'Buyer Company', '4.00', '25.00', '100.00', 'pending'])
+
+
+class CreditTotalsArchiveTestCase(LedgerTestMixin, TestCase):
+    """Tests that dashboard and report credit totals survive archiving."""
+
+    def setUp(self):
+        super().setUp()
+        self.give_credits('3.00')
+        self.give_credits('2.00', owner_type='employee', owner_id=self.employee.id, days_ago=2)
+        for owner_type, owner_id, status in (('employee', self.employee.id, 'used'), ('employer', None, 'expired')):
+            credit = self.give_credits('4.00', owner_type=owner_type, owner_id=owner_id, days_ago=400)
+            credit.status = status
+            credit.save()
+        self.bank_admin = User.objects.create_user(
+            username='bank', email='bank@test.com', password='password123', is_bank_admin=True
+        )
+        self.admin = User.objects.create_user(
+            username='root', email='root@test.com', password='password123', is_super_admin=True
+        )
+
+    def totals(self):
+        self.client.force_login(self.bank_admin)
+        bank = self.client.get(reverse('bank:bank_dashboard')).context
+        summary = dict(row for row in bank_views._summary_export_rows() if len(row) == 2)
+        self.client.force_login(self.admin)
+        admin = self.client.get(reverse('admin_dashboard')).context
+        admin_report = self.client.get(reverse('admin_reports'), {'type': 'summary'}).context
+        return (
+            bank['total_credits'], bank['recent_credits'], summary['Total Credits'],
+            admin['total_credits'], admin_report['total_credits']
+        )
+
+    def render_totals(self, view, template_name, user, *args):
+        """Render a page view with a stand-in template showing only its credit figures."""
+        request = RequestFactory().get('/')
+        request.user = user
+        templates = {template_name: (
+            '{{ total_credits }}{% for row in credit_history %} {{ row.month }}={{ row.total }}{% endfor %}'
+        )}
+        with self.settings(TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', templates)]},
+        }]):
+            return view(request, *args).content.decode()
+
+    def view_totals(self):
+        employer_detail = self.render_totals(
+            bank_views.employer_detail, 'bank/employer_detail.html', self.bank_admin, self.employer.id
+        )
+        credits_page = self.render_totals(employee_views.credits_list, 'employee/credits.html', self.employee_user)
+        employer_export = list(admin_views._employer_export_rows('all'))[1]
+
+        api = APIClient()
+        stats = []
+        for user in (self.bank_admin, self.employer_user):
+            api.force_authenticate(user)
+            data = api.get(reverse('trips:employer_credit_stats')).data
+            stats.append((data['total_credits_issued'], data['active_credits'], dict(data['credits_by_status'])))
+
+        return employer_detail, credits_page, employer_export[4], stats
+
+    def test_totals_unchanged_by_archive_credits(self):
+        """Test that archiving old settled credits doesn't shrink any credit total."""
+        before = self.totals()
+        self.assertEqual(before, (13.0, 5.0, Decimal('13'), 13.0, Decimal('13')))
+        views_before = self.view_totals()
+        by_status = {'active': '5.00', 'pending': '0.00', 'used': '4.00', 'expired': '4.00'}
+        self.assertEqual(Decimal(views_before[0]), Decimal('6'))
+        self.assertEqual(Decimal(views_before[1].split()[0]), Decimal('6'))
+        self.assertEqual(len(views_before[1].split()), 3)  # Total, then this month and the archived one
+        self.assertEqual(views_before[2:], (
+            Decimal('7'), [('13.00', '5.00', by_status), ('13.00', '5.00', by_status)]
+        ))
+
+        self.assertEqual(archive_credits(), 2)
+        self.assertEqual(CarbonCredit.objects.count(), 2)
+
+        self.assertEqual(self.totals(), before)
+        self.assertEqual(self.view_totals(), views_before)
+
+
+@override_settings(REPORT_JOBS_ASYNC=False)
+class ReportJobTestCase(LedgerTestMixin, TestCase):
+    """Tests for background PDF/XLSX report rendering."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+        buyer = EmployerProfile.objects.create(
+            user=User.objects.create_user(
+                username='buyer', email='buyer@test.com', password='password123', is_employer=True
+            ),
+            company_name='Buyer Company'
+        )
+        for amount, price in (('4', '100'), ('10', '200')):
+            MarketplaceTransaction.objects.create(
+                seller=self.employer, buyer=buyer, credit_amount=Decimal(amount), total_price=Decimal(price),
+                status='completed'
+            )
+        self.bank_admin = User.objects.create_user(
+            username='bank', email='bank@test.com', password='password123', is_bank_admin=True
+        )
+        self.client.force_login(self.bank_admin)
+
+    def request_report(self, report_type, format_type):
+        response = self.client.get(
+            reverse('bank:export_report'), {'report_type': report_type, 'date_range': '30d', 'format': format_type}
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        return response.json()
+
+    def test_xlsx_report_rendered_in_background(self):
+        """Test that an Excel report is queued, rendered by the worker, polled and downloaded."""
+        job = self.request_report('employer_activity', 'xlsx')
+        self.assertNotIn('download_url', self.client.get(job['status_url']).json())
+
+        call_command('run_report_jobs', stdout=StringIO())
+
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'completed')
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response.status_code, 200)
+
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook.active.values)
+        self.assertEqual(rows[1][:3], ('Employer', 'Purchases', 'Buy Volume'))
+        self.assertEqual(
+            {row[0]: row[1:] for row in rows[2:]},
+            {'Buyer Company': (2, 14, 300, 0, 0, 0), 'Test Company': (0, 0, 0, 2, 14, 300)}
+        )
+
+    def test_pdf_reports_for_every_type(self):
+        """Test that each report type renders to a PDF file in MEDIA_ROOT."""
+        for report_type, _ in ReportJob.REPORT_TYPES:
+            job_id = self.request_report(report_type, 'pdf')['job_id']
+            job = run_report_job(job_id)
+
+            self.assertEqual(job.status, 'completed', job.error)
+            with job.file.open('rb') as report:
+                self.assertEqual(report.read(4), b'%PDF')
+
+    def test_download_requires_finished_job_of_requester(self):
+        """Test that unfinished jobs and other admins' jobs can't be downloaded."""
+        job = self.request_report('summary', 'pdf')
+        self.assertEqual(self.client.get(reverse('bank:download_report', args=[job['job_id']])).status_code, 404)
+
+        run_report_job(job['job_id'])
+        other = User.objects.create_user(
+            username='bank2', email='bank2@test.com', password='password123', is_bank_admin=True
+        )
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(job['status_url']).status_code, 404)
+
+    def test_csv_price_history_streams(self):
+        """Test that CSV exports are streamed directly with real daily prices."""
+        response = self.client.get(
+            reverse('bank:export_report'), {'report_type': 'price', 'date_range': '7d', 'format': 'csv'}
+        )
+
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['Date', 'Transactions', 'Volume', 'Avg. Price', 'Low', 'High'])
+        self.assertEqual(rows[1][1:2], ['2'])
+        self.assertEqual([Decimal(value) for value in rows[1][3:]], [Decimal('22.50'), Decimal('20.00'), Decimal('25.00')])
+
+
+    def test_csv_rows_keep_every_table(self):
+        """Test that multi-table reports keep every table in CSV, separated by a blank row and heading."""
+        tables = [('First', ['A'], iter([[1], [2]])), ('Second', ['B', 'C'], iter([[3, 4]]))]
+
+        self.assertEqual(list(csv_rows(tables)), [['A'], [1], [2], [], ['Second'], ['B', 'C'], [3, 4]])
+
+
+class ReportSnapshotCacheTestCase(LedgerTestMixin, TestCase):
+    """Tests for the cached bank report snapshots."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.buyer = EmployerProfile.objects.create(
+            user=User.objects.create_user(
+                username='buyer', email='buyer@test.com', password='password123', is_employer=True
+            ),
+            company_name='Buyer Company'
+        )
+        self.sale = self.trade('4', '100')
+        self.trade('10', '200')
+        self.client.force_login(User.objects.create_user(
+            username='bank', email='bank@test.com', password='password123', is_bank_admin=True
+        ))
+
+    def trade(self, amount, price):
+        return MarketplaceTransaction.objects.create(
+            seller=self.employer, buyer=self.buyer, credit_amount=Decimal(amount), total_price=Decimal(price)
+        )
+
+    def report(self, report_type):
+        return self.client.post(reverse('bank:bank_reports'), {'report_type': report_type, 'date_range': '30d'})
+
+    def test_each_report_in_one_query_then_cached(self):
+        """Test that every report type costs one query to build and none when cached."""
+        for report_type in ('summary', 'transactions', 'price', 'employer_activity'):
+            start = timezone.now() - timedelta(days=30)
+            with CaptureQueriesContext(connection) as build:
+                build_report_snapshot(report_type, start)
+            self.assertEqual(len(build.captured_queries), 1, report_type)
+
+            self.report(report_type)
+            with CaptureQueriesContext(connection) as cached:
+                response = self.report(report_type)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(
+                [query for query in cached.captured_queries if 'marketplace_marketplacetransaction' in query['sql']],
+                report_type
+            )
+
+    def test_snapshot_values(self):
+        """Test the figures computed for each report."""
+        start = timezone.now() - timedelta(days=30)
+
+        summary = build_report_snapshot('summary', start)
+        self.assertEqual(summary['total_transactions'], 2)
+        self.assertEqual(summary['total_volume'], Decimal('14'))
+        self.assertEqual(summary['avg_price'], Decimal('22.5'))
+
+        price = build_report_snapshot('price', start)
+        self.assertEqual((price['current_price'], price['highest_price'], price['lowest_price']), (20, 25, 20))
+        self.assertEqual(price['price_changes'][0]['price_change'], -5)
+
+        activity = build_report_snapshot('employer_activity', start)
+        self.assertEqual(activity['top_buyers'], [
+            {'employer_name': 'Buyer Company', 'transaction_count': 2, 'volume': 14, 'total_value': 300}
+        ])
+        self.assertEqual(activity['top_sellers'][0]['employer_name'], 'Test Company')
+
+    def test_page_and_exports_share_figures(self):
+        """Test that snapshots and export tables come from the same builders, with per-day open/close in SQL."""
+        MarketplaceTransaction.objects.filter(pk=self.sale.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.trade('5', '150')
+        start = timezone.now() - timedelta(days=30)
+
+        price = build_report_snapshot('price', start)
+        self.assertEqual(
+            [(change['open_price'], change['close_price']) for change in price['price_changes']],
+            [(20, 30), (25, 25)]
+        )
+        self.assertEqual((price['current_price'], price['avg_price']), (30, 25))
+
+        summary = build_report_snapshot('summary', start)
+        exported = dict(report_tables('summary', start, timezone.now())[0][2])
+        self.assertEqual(exported['Total Volume'], summary['total_volume'])
+        self.assertEqual(exported['Average Price'], round(summary['avg_price'], 2))
+
+        activity = build_report_snapshot('employer_activity', start)
+        exported = {row[0]: row for row in report_tables('employer_activity', start, timezone.now())[0][2]}
+        self.assertEqual(exported['Buyer Company'][1:4], [
+            activity['top_buyers'][0]['transaction_count'], activity['top_buyers'][0]['volume'],
+            activity['top_buyers'][0]['total_value']
+        ])
+
+    def test_status_change_invalidates_snapshot(self):
+        """Test that a transaction status change bumps the data version."""
+        self.report('summary')
+        self.sale.status = 'completed'
+        self.sale.save()
+        self.trade('1', '30')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.report('summary')
+
+        self.assertEqual(response.context['total_transactions'], 3)
+        self.assertTrue(
+            [query for query in queries.captured_queries if 'marketplace_marketplacetransaction' in query['sql']]
+        )
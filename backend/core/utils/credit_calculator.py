@@ -5,6 +5,7 @@ distance traveled and transport mode.
 
 import logging
 from decimal import Decimal
+import numpy as np
 from core.models import SystemConfig
 
 logger = logging.getLogger(__name__)
@@ -22,11 +23,24 @@ DEFAULT_MODE_MULTIPLIERS = {
 # Default base rate (credits per km)
 DEFAULT_BASE_RATE = 0.1
 
+# Average car emissions per km (in kg of CO2)
+CAR_EMISSIONS_PER_KM = Decimal('0.192')
+
+# Emissions by transport mode (in kg of CO2 per km)
+MODE_EMISSIONS = {
+    'car': CAR_EMISSIONS_PER_KM,
+    'carpool': CAR_EMISSIONS_PER_KM / 2,  # Assumes 2 people in carpool
+    'public_transport': Decimal('0.041'),
+    'bicycle': Decimal('0'),
+    'walking': Decimal('0'),
+    'work_from_home': CAR_EMISSIONS_PER_KM  # Savings from not driving at all
+}
+
 
 def get_mode_multiplier(transport_mode):
     """
     Get the multiplier for a specific transport mode.
-    Attempts to get from database config, falls back to defaults.
+    Attempts to get from the cached database config, falls back to defaults.
     
     Args:
         transport_mode: String representing the transport mode
@@ -35,7 +49,7 @@ def get_mode_multiplier(transport_mode):
         Decimal multiplier value
     """
     try:
-        # Try to get from database
+        # Try to get from database config (cached, no query in steady state)
         config_key = f"multiplier_{transport_mode}"
         db_value = SystemConfig.get_value(config_key)
         
@@ -43,32 +57,32 @@ def get_mode_multiplier(transport_mode):
             return Decimal(db_value)
         
         # Fall back to defaults
-        return Decimal(DEFAULT_MODE_MULTIPLIERS.get(transport_mode, 0))
+        return Decimal(str(DEFAULT_MODE_MULTIPLIERS.get(transport_mode, 0)))
     except Exception as e:
         logger.warning(f"Error getting mode multiplier: {str(e)}")
-        return Decimal(DEFAULT_MODE_MULTIPLIERS.get(transport_mode, 0))
+        return Decimal(str(DEFAULT_MODE_MULTIPLIERS.get(transport_mode, 0)))
 
 
 def get_base_rate():
     """
     Get the base rate for credit calculation.
-    Attempts to get from database config, falls back to default.
+    Attempts to get from the cached database config, falls back to default.
     
     Returns:
         Decimal base rate value
     """
     try:
-        # Try to get from database
+        # Try to get from database config (cached, no query in steady state)
         db_value = SystemConfig.get_value("base_credit_rate")
         
         if db_value:
             return Decimal(db_value)
         
         # Fall back to default
-        return Decimal(DEFAULT_BASE_RATE)
+        return Decimal(str(DEFAULT_BASE_RATE))
     except Exception as e:
         logger.warning(f"Error getting base rate: {str(e)}")
-        return Decimal(DEFAULT_BASE_RATE)
+        return Decimal(str(DEFAULT_BASE_RATE))
 
 
 def calculate_carbon_credits(distance_km, transport_mode):
@@ -107,27 +121,108 @@ def calculate_carbon_savings(distance_km, transport_mode):
     Returns:
         Decimal amount of carbon savings in kg of CO2
     """
-    # Average car emissions per km (in kg of CO2)
-    car_emissions_per_km = Decimal('0.192')
-    
-    # Emissions by transport mode (in kg of CO2 per km)
-    emissions_by_mode = {
-        'car': car_emissions_per_km,
-        'carpool': car_emissions_per_km / 2,  # Assumes 2 people in carpool
-        'public_transport': Decimal('0.041'),
-        'bicycle': Decimal('0'),
-        'walking': Decimal('0'),
-        'work_from_home': car_emissions_per_km  # Savings from not driving at all
-    }
-    
     # Get emissions for selected mode
-    mode_emissions = emissions_by_mode.get(transport_mode, Decimal('0'))
+    mode_emissions = MODE_EMISSIONS.get(transport_mode, Decimal('0'))
     
     # Calculate savings (car emissions minus mode emissions)
     if transport_mode == 'car':
         savings = Decimal('0')
     else:
-        savings = (car_emissions_per_km - mode_emissions) * Decimal(distance_km)
+        savings = (CAR_EMISSIONS_PER_KM - mode_emissions) * Decimal(distance_km)
     
     # Round to 2 decimal places
-    return round(savings, 2) 
\ No newline at end of file
+    return round(savings, 2)
+
+
+def get_savings_per_km(transport_mode):
+    """
+    Get the carbon savings per km for a transport mode, relative to driving alone.
+    
+    Args:
+        transport_mode: String representing the transport mode
+        
+    Returns:
+        Decimal kg of CO2 saved per km
+    """
+    if transport_mode == 'car':
+        return Decimal('0')
+    return CAR_EMISSIONS_PER_KM - MODE_EMISSIONS.get(transport_mode, Decimal('0'))
+
+
+def calculate_batch(distances_km, transport_modes):
+    """
+    Calculate carbon credits and carbon savings for many trips at once.
+    
+    Distances are converted with Decimal, like the scalar functions, then
+    scaled to fixed-point integers by the most decimal places any of them
+    has, and multiplied by exact per-mode factors with NumPy, so config is
+    read once per mode rather than once per trip. Results are rounded to 2
+    decimal places half-even only when they are converted back to Decimal,
+    so every result equals the scalar function's for the same input.
+    
+    Args:
+        distances_km: Sequence of distances in kilometers (Decimal, float or str; None counts as 0)
+        transport_modes: Sequence of transport mode strings, one per distance
+        
+    Returns:
+        Tuple (credits, savings) of lists of Decimal, in input order
+    """
+    modes = list(transport_modes)
+    count = len(modes)
+    if len(distances_km) != count:
+        raise ValueError("distances_km and transport_modes must have the same length")
+    if not count:
+        return [], []
+    
+    # Map each distinct mode to a small integer code
+    mode_codes = {}
+    codes = np.fromiter(
+        (mode_codes.setdefault(mode, len(mode_codes)) for mode in modes),
+        dtype=np.intp,
+        count=count
+    )
+    distances = [Decimal(distance) if distance is not None else Decimal('0') for distance in distances_km]
+    distance_places = max(max(-distance.as_tuple().exponent, 0) for distance in distances)
+    scaled_distances = [int(distance.scaleb(distance_places)) for distance in distances]
+    # Keep int64 when every distance fits, otherwise exact Python integers
+    dtype = np.int64 if max(map(abs, scaled_distances)) < 2 ** 62 else object
+    distances = np.array(scaled_distances, dtype=dtype)
+    
+    base_rate = get_base_rate()
+    credit_factors = [get_mode_multiplier(mode) * base_rate for mode in mode_codes]
+    savings_factors = [get_savings_per_km(mode) for mode in mode_codes]
+    
+    return (
+        _apply_factors(distances, distance_places, codes, credit_factors),
+        _apply_factors(distances, distance_places, codes, savings_factors)
+    )
+
+
+def _apply_factors(distances, distance_places, codes, factors):
+    """Multiply fixed-point distances by per-mode Decimal factors and round to Decimal(2 dp)."""
+    # Scale every factor to an integer with a shared number of decimal places,
+    # at least enough for the products to carry hundredths
+    places = max(max(-factor.normalize().as_tuple().exponent, 0) for factor in factors)
+    places = max(places, 2 - distance_places)
+    scaled = [int(factor.scaleb(places)) for factor in factors]
+    divisor = 10 ** (distance_places + places - 2)
+    
+    # Fall back to exact Python integers if the products could overflow int64
+    largest = int(np.abs(distances).max()) * max(abs(factor) for factor in scaled)
+    if largest < 2 ** 62 and divisor < 2 ** 62:
+        values = distances * np.array(scaled, dtype=np.int64)[codes]
+    else:
+        values = distances.astype(object) * np.array(scaled, dtype=object)[codes]
+    
+    # Round half-even to hundredths
+    quotient = values // divisor
+    twice_remainder = (values % divisor) * 2
+    round_up = (twice_remainder > divisor) | ((twice_remainder == divisor) & (quotient % 2 == 1))
+    hundredths = quotient + round_up
+    
+    # Results repeat heavily across a batch, so build each Decimal once
+    decimals = {}
+    return [
+        decimals[value] if value in decimals else decimals.setdefault(value, Decimal(value).scaleb(-2))
+        for value in hundredths.tolist()
+    ]
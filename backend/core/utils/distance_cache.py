@@ -0,0 +1,246 @@
+"""
+Cache for route distances between coordinate pairs.
+
+Most trips repeat the same commute every day, so route distances are
+cached on (start, end, mode) with coordinates rounded to
+DISTANCE_CACHE_PLACES decimal places (~11 m). A process-local LRU sits in
+front of the DistanceCacheEntry table; entries older than
+DISTANCE_CACHE_TTL seconds are treated as missing and refreshed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from core.models import DistanceCacheEntry
+
+# Coordinate precision of the cache key (4 places is ~11 m)
+DISTANCE_CACHE_PLACES = 4
+
+# Keys per database lookup in get_many
+LOOKUP_BATCH_SIZE = 200
+
+# Defaults, overridable in settings
+DEFAULT_DISTANCE_CACHE_TTL = 30 * 24 * 3600  # 30 days
+DEFAULT_DISTANCE_CACHE_SIZE = 10000
+
+
+def quantize_coordinate(value):
+    """Round a latitude/longitude to the cache key precision."""
+    return Decimal(str(value)).quantize(Decimal(1).scaleb(-DISTANCE_CACHE_PLACES), rounding=ROUND_HALF_EVEN)
+
+
+def cache_key(start_coords, end_coords, mode):
+    """
+    Build the cache key for a trip.
+
+    Args:
+        start_coords: Tuple (latitude, longitude) for starting point
+        end_coords: Tuple (latitude, longitude) for ending point
+        mode: Travel mode the distance was resolved for
+
+    Returns:
+        Tuple (start_lat, start_lng, end_lat, end_lng, mode) with quantized Decimal coordinates
+    """
+    return (
+        quantize_coordinate(start_coords[0]),
+        quantize_coordinate(start_coords[1]),
+        quantize_coordinate(end_coords[0]),
+        quantize_coordinate(end_coords[1]),
+        mode,
+    )
+
+
+class DistanceCache:
+    """Process-local LRU of route distances backed by the DistanceCacheEntry table."""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, 'DISTANCE_CACHE_SIZE', DEFAULT_DISTANCE_CACHE_SIZE)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'DISTANCE_CACHE_TTL', DEFAULT_DISTANCE_CACHE_TTL)
+
+    def get(self, start_coords, end_coords, mode):
+        """
+        Look up a cached distance, checking memory first and then the database.
+
+        Returns:
+            Distance in kilometers (Decimal), or None on a miss
+        """
+        key = cache_key(start_coords, end_coords, mode)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                distance, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return distance
+                del self._entries[key]
+
+        row = DistanceCacheEntry.objects.filter(
+            start_latitude=key[0],
+            start_longitude=key[1],
+            end_latitude=key[2],
+            end_longitude=key[3],
+            mode=mode,
+            updated_at__gt=timezone.now() - timedelta(seconds=self.ttl)
+        ).values_list('distance_km', 'updated_at').first()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            distance, updated_at = row
+            self._remember(key, distance, updated_at.timestamp() + self.ttl)
+            return distance
+
+    def set(self, start_coords, end_coords, mode, distance_km):
+        """Store a resolved distance in memory and in the database."""
+        key = cache_key(start_coords, end_coords, mode)
+        distance_km = Decimal(str(distance_km)).quantize(Decimal('0.001'))
+
+        DistanceCacheEntry.objects.update_or_create(
+            start_latitude=key[0],
+            start_longitude=key[1],
+            end_latitude=key[2],
+            end_longitude=key[3],
+            mode=mode,
+            defaults={'distance_km': distance_km, 'updated_at': timezone.now()}
+        )
+        with self._lock:
+            self._remember(key, distance_km, time.time() + self.ttl)
+
+    def get_many(self, keys):
+        """
+        Look up many cache keys (from cache_key) with one query per LOOKUP_BATCH_SIZE database lookups.
+
+        Returns:
+            Dict mapping each found key to its distance in kilometers (Decimal)
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        missing = []
+        now = time.time()
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            condition = Q()
+            for key in missing[start:start + LOOKUP_BATCH_SIZE]:
+                condition |= Q(
+                    start_latitude=key[0], start_longitude=key[1],
+                    end_latitude=key[2], end_longitude=key[3], mode=key[4]
+                )
+            rows = DistanceCacheEntry.objects.filter(condition, updated_at__gt=cutoff).values_list(
+                'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude', 'mode',
+                'distance_km', 'updated_at'
+            )
+            with self._lock:
+                for *key, distance, updated_at in rows:
+                    key = tuple(key)
+                    found[key] = distance
+                    self._remember(key, distance, updated_at.timestamp() + self.ttl)
+
+        with self._lock:
+            self.db_hits += len(found) - (len(keys) - len(missing))
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, distances):
+        """Store many resolved distances ({cache key: distance_km}) with one upsert."""
+        now = timezone.now()
+        entries = []
+        for key, distance_km in distances.items():
+            distance_km = Decimal(str(distance_km)).quantize(Decimal('0.001'))
+            entries.append(DistanceCacheEntry(
+                start_latitude=key[0],
+                start_longitude=key[1],
+                end_latitude=key[2],
+                end_longitude=key[3],
+                mode=key[4],
+                distance_km=distance_km,
+                updated_at=now
+            ))
+        DistanceCacheEntry.objects.bulk_create(
+            entries,
+            batch_size=LOOKUP_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['start_latitude', 'start_longitude', 'end_latitude', 'end_longitude', 'mode'],
+            update_fields=['distance_km', 'updated_at']
+        )
+        with self._lock:
+            for entry in entries:
+                key = (entry.start_latitude, entry.start_longitude, entry.end_latitude, entry.end_longitude, entry.mode)
+                self._remember(key, entry.distance_km, time.time() + self.ttl)
+
+    def get_or_resolve(self, start_coords, end_coords, mode, resolve):
+        """
+        Return the cached distance, calling resolve() and caching its result on a miss.
+
+        Exceptions from resolve() propagate and nothing is cached.
+        """
+        distance = self.get(start_coords, end_coords, mode)
+        if distance is None:
+            distance = resolve()
+            self.set(start_coords, end_coords, mode, distance)
+        return distance
+
+    def stats(self):
+        """Return hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+    def clear(self):
+        """Empty the in-memory LRU and reset the counters (the table is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_hits = self.db_hits = self.misses = 0
+
+    def _remember(self, key, distance, expires_at):
+        self._entries[key] = (distance, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Shared per-process cache used by the distance utilities
+distance_cache = DistanceCache()
@@ -10,10 +10,72 @@ import logging
 import requests
 from decimal import Decimal
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from core.models import SystemConfig
+from core.utils.distance_cache import cache_key, distance_cache
 
 logger = logging.getLogger(__name__)
 
+# Distance Matrix API endpoint (overridable with GOOGLE_MAPS_DISTANCE_MATRIX_URL)
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# Distance Matrix per-request limits
+MAX_MATRIX_ORIGINS = 25
+MAX_MATRIX_DESTINATIONS = 25
+MAX_MATRIX_ELEMENTS = 100
+
+# Elements a request may bill beyond the pairs it was planned for. The API
+# bills every origin x destination element, so merging groups that don't
+# share points is only worth it while the cross elements stay under this.
+MAX_WASTED_MATRIX_ELEMENTS = 0
+
+# Default HTTP timeout for Maps API calls, in seconds
+DEFAULT_MAPS_TIMEOUT = 10
+
+_http_session = None
+
+
+def get_http_session():
+    """
+    Get the shared requests session for Maps API calls.
+    
+    The session keeps connections alive in a pool and retries transient
+    server errors, so repeated calls don't pay for a new TLS handshake.
+    
+    Returns:
+        requests.Session
+    """
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _http_session = session
+    return _http_session
+
+
+def _matrix_request(origins, destinations, mode, api_key):
+    """Send one Distance Matrix request and return the decoded JSON."""
+    params = {
+        "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+        "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+        "mode": mode,
+        "key": api_key
+    }
+    response = get_http_session().get(
+        getattr(settings, 'GOOGLE_MAPS_DISTANCE_MATRIX_URL', DISTANCE_MATRIX_URL),
+        params=params,
+        timeout=getattr(settings, 'GOOGLE_MAPS_TIMEOUT', DEFAULT_MAPS_TIMEOUT)
+    )
+    response.raise_for_status()
+    return response.json()
+
 def calculate_distance(start_coords, end_coords):
     """
     Calculate distance between two geographical points.
@@ -32,7 +94,11 @@ def calculate_distance(start_coords, end_coords):
     
     if google_maps_api_key:
         try:
-            return google_maps_distance_api(start_coords, end_coords, google_maps_api_key)
+            # Repeat commutes are served from the distance cache
+            return distance_cache.get_or_resolve(
+                start_coords, end_coords, 'driving',
+                lambda: google_maps_distance_api(start_coords, end_coords, google_maps_api_key)
+            )
         except Exception as e:
             logger.warning(f"Google Maps API failed: {str(e)}. Falling back to Haversine.")
     
@@ -52,21 +118,7 @@ def google_maps_distance_api(start_coords, end_coords, api_key):
     Returns:
         Distance in kilometers (decimal)
     """
-    base_url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    
-    # Format coordinates for the API
-    origins = f"{start_coords[0]},{start_coords[1]}"
-    destinations = f"{end_coords[0]},{end_coords[1]}"
-    
-    params = {
-        "origins": origins,
-        "destinations": destinations,
-        "mode": "driving",  # Default to driving mode
-        "key": api_key
-    }
-    
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    data = _matrix_request([start_coords], [end_coords], "driving", api_key)  # Default to driving mode
     
     if data["status"] != "OK":
         raise Exception(f"Google Maps API error: {data['status']}")
@@ -104,4 +156,104 @@ def haversine_distance(start_coords, end_coords):
     c = 2 * math.asin(math.sqrt(a))
     r = 6371  # Radius of earth in kilometers
     
-    return Decimal(c * r) 
\ No newline at end of file
+    return Decimal(c * r)
+
+
+def resolve_distances(pairs, mode='driving', api_key=None):
+    """
+    Resolve route distances for many coordinate pairs at once.
+    
+    Pairs already in the distance cache are served from it. The rest are
+    de-duplicated and grouped into Distance Matrix requests within the
+    API's origin/destination/element limits, so a batch of commutes to the
+    same office costs one request per 25 employees instead of one each.
+    
+    Args:
+        pairs: Iterable of (start_coords, end_coords) tuples of (latitude, longitude)
+        mode: Google Maps travel mode (driving, walking, bicycling, transit)
+        api_key: Google Maps API key (defaults to settings.GOOGLE_MAPS_API_KEY)
+        
+    Returns:
+        List of distances in kilometers (Decimal), in input order; None where no route was found
+    """
+    api_key = api_key or settings.GOOGLE_MAPS_API_KEY
+    keys = [cache_key(start, end, mode) for start, end in pairs]
+    found = distance_cache.get_many(keys)
+    
+    pending = [key for key in dict.fromkeys(keys) if key not in found]
+    if pending:
+        resolved = {}
+        wanted = set(pending)
+        for origins, destinations in plan_matrix_requests([(key[:2], key[2:4]) for key in pending]):
+            try:
+                data = _matrix_request(origins, destinations, mode, api_key)
+                if data["status"] != "OK":
+                    raise Exception(f"Google Maps API error: {data['status']}")
+            except Exception as e:
+                logger.warning(f"Distance Matrix request failed: {str(e)}")
+                continue
+            
+            for origin, row in zip(origins, data["rows"]):
+                for destination, element in zip(destinations, row["elements"]):
+                    key = (*origin, *destination, mode)
+                    if key in wanted and element.get("status") == "OK":
+                        resolved[key] = Decimal(element["distance"]["value"]) / 1000
+        
+        if resolved:
+            distance_cache.set_many(resolved)
+            found.update(resolved)
+    
+    return [found.get(key) for key in keys]
+
+
+def plan_matrix_requests(pairs):
+    """
+    Group (origin, destination) pairs into Distance Matrix requests.
+    
+    Pairs are grouped around whichever side has fewer distinct points (the
+    shared office, typically), and those groups are packed into requests
+    while they stay within the API limits and bill at most
+    MAX_WASTED_MATRIX_ELEMENTS elements nobody asked for. Groups with the
+    same spokes (every home going to one office) share a request for free;
+    unrelated pairs get requests of their own rather than paying for a
+    mostly unused matrix.
+    
+    Args:
+        pairs: List of distinct (origin, destination) point pairs
+        
+    Returns:
+        List of (origins, destinations) point lists, one per request
+    """
+    hub_is_origin = len({origin for origin, _ in pairs}) < len({destination for _, destination in pairs})
+    groups = {}
+    for origin, destination in pairs:
+        hub, spoke = (origin, destination) if hub_is_origin else (destination, origin)
+        groups.setdefault(hub, []).append(spoke)
+    
+    max_hubs = MAX_MATRIX_ORIGINS if hub_is_origin else MAX_MATRIX_DESTINATIONS
+    max_spokes = MAX_MATRIX_DESTINATIONS if hub_is_origin else MAX_MATRIX_ORIGINS
+    
+    planned = []
+    hubs, spokes, wanted = [], {}, 0
+    for hub, hub_spokes in groups.items():
+        for start in range(0, len(hub_spokes), max_spokes):
+            chunk = hub_spokes[start:start + max_spokes]
+            merged = {**spokes, **dict.fromkeys(chunk)}
+            billed = len(merged) * (len(hubs) + 1)
+            if hubs and (
+                len(hubs) >= max_hubs
+                or len(merged) > max_spokes
+                or billed > MAX_MATRIX_ELEMENTS
+                or billed - (wanted + len(chunk)) > MAX_WASTED_MATRIX_ELEMENTS
+            ):
+                planned.append((hubs, list(spokes)))
+                hubs, merged, wanted = [], dict.fromkeys(chunk), 0
+            hubs.append(hub)
+            spokes = merged
+            wanted += len(chunk)
+    if hubs:
+        planned.append((hubs, list(spokes)))
+    
+    if hub_is_origin:
+        return planned
+    return [(origins, destinations) for destinations, origins in planned]
@@ -0,0 +1,76 @@
+"""
+Version stamps for cached snapshots.
+
+A snapshot is cached under a key that includes a version stamp, so
+bumping the stamp makes every older snapshot unreachable: invalidation is
+one write however many snapshots exist, and the stale ones simply expire.
+
+The stamps must be seen by every worker, so they live in the cache named
+by settings.SHARED_CACHE, or in the database (core.CacheVersion) when no
+cache is shared; the default cache is per process.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def shared_cache():
+    """Return the cache shared by every worker (settings.SHARED_CACHE), or None if there is none."""
+    alias = getattr(settings, 'SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def get_version(cache, key):
+    """
+    Get the version stamp stored under key, starting it at 1 if missing.
+
+    Args:
+        cache: Shared cache holding the stamp, or None to read it from the database
+        key: Version key
+    """
+    if cache is None:
+        from core.models import CacheVersion
+        version = CacheVersion.objects.filter(key=key).values_list('version', flat=True).first()
+        return 1 if version is None else version
+
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(cache, key):
+    """Advance the version stamp stored under key (in the database if cache is None)."""
+    if cache is None:
+        from core.models import CacheVersion
+        if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    CacheVersion.objects.create(key=key, version=2)
+            except IntegrityError:
+                # Created concurrently
+                CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
+        return
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Version key missing or evicted; any fresh value invalidates old snapshots
+        cache.set(key, int(time.time() * 1000), timeout=None)
+
+
+def bump_version_on_commit(cache, key):
+    """
+    Bump a version stamp now and again once the current transaction commits.
+
+    The first bump stops this request reading the old snapshot; the second
+    drops any snapshot another request built from data read before the commit.
+    A database stamp commits with the write itself, so it is bumped once.
+    """
+    bump_version(cache, key)
+    if cache is not None:
+        transaction.on_commit(lambda: bump_version(cache, key))
@@ -0,0 +1,34 @@
+"""
+In-process worker pools for background jobs.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+
+class LazyExecutor:
+    """
+    A thread pool that is only created when the first job is submitted.
+
+    Processes that never queue work (management commands, most tests)
+    start no threads. The pool size is read from a setting at that point.
+    """
+
+    def __init__(self, workers_setting, default_workers, thread_name_prefix):
+        self.workers_setting = workers_setting
+        self.default_workers = default_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, creating it if needed."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, self.workers_setting, self.default_workers),
+                        thread_name_prefix=self.thread_name_prefix
+                    )
+        return self._executor.submit(fn, *args, **kwargs)
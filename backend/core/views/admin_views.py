@@ -1,17 +1,18 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum, Count, F, Q, OuterRef, Subquery
 from django.core.paginator import Paginator
 from django.contrib import messages
 from users.models import CustomUser, EmployerProfile, EmployeeProfile, Location
-from trips.models import Trip, CarbonCredit
+from trips.models import Trip, CarbonCredit, CreditBalance
 from django.utils import timezone
-import csv
-import io
 from django.urls import reverse
 from decimal import Decimal
 from datetime import datetime, timedelta
+from core.utils.export import (
+    EXPORT_CHUNK_SIZE, format_datetime, streaming_csv_response, streaming_text_response
+)
 
 # Import marketplace models if needed
 from marketplace.models import MarketOffer, MarketplaceTransaction
@@ -45,7 +46,7 @@ def dashboard(request):
     recent_trip_count = Trip.objects.filter(trip_date__gte=seven_days_ago.date()).count()
     
     # Get carbon credits with proper formatting
-    total_credits_raw = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+    total_credits_raw = CreditBalance.grand_total()
     total_credits = round(float(total_credits_raw), 2)
     
     # Get pending employers for approval
@@ -205,7 +206,7 @@ def user_detail(request, user_id):
     # Get carbon credits for this user
     credits = None
     if user.is_employee and hasattr(user, 'employee_profile'):
-        credits = CarbonCredit.objects.filter(owner_type='employee', owner_id=user.employee_profile.id)
+        credits = CarbonCredit.objects.owned_by(user.employee_profile)
     
     context = {
         'user_detail': user,
@@ -489,7 +490,7 @@ def reports(request):
             avg_trips_per_user = total_trips / total_employees
             
         # Credit statistics
-        total_credits = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+        total_credits = CreditBalance.grand_total()
         redeemed_credits = CarbonCredit.objects.filter(status='redeemed').aggregate(Sum('amount'))['amount__sum'] or 0
         
         # Add stats to context
@@ -516,158 +517,141 @@ def export_reports(request):
     date_range = request.GET.get('date_range', 'all')
     format = request.GET.get('format', 'csv')
     
-    # Get data based on report type
-    data = []
-    
-    if report_type == 'summary':
-        # User statistics
-        total_users = CustomUser.objects.count()
-        total_employees = EmployeeProfile.objects.count()
-        total_employers = EmployerProfile.objects.count()
-        
-        # Trip statistics
-        total_trips = Trip.objects.count()
-        total_carbon_saved = Trip.objects.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
-        
-        # Calculate average trips per employee
-        avg_trips_per_user = 0
-        if total_employees > 0:
-            avg_trips_per_user = total_trips / total_employees
-            
-        # Credit statistics
-        total_credits = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
-        redeemed_credits = CarbonCredit.objects.filter(status='redeemed').aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        # Summary data
-        data = [
-            ['Metric', 'Value'],
-            ['Total Users', total_users],
-            ['Total Employees', total_employees],
-            ['Total Employers', total_employers],
-            ['Total Trips', total_trips],
-            ['Total Carbon Saved (kg)', total_carbon_saved],
-            ['Average Trips per User', round(avg_trips_per_user, 2)],
-            ['Total Credits', total_credits],
-            ['Redeemed Credits', redeemed_credits]
-        ]
-    
-    elif report_type == 'trips':
-        # Get trips based on date range
-        trips = Trip.objects.all().select_related('employee', 'employee__user').order_by('-trip_date')
-        
-        # Apply date filter if needed
-        if date_range == '7d':
-            trips = trips.filter(trip_date__gte=(timezone.now() - timezone.timedelta(days=7)).date())
-        elif date_range == '30d':
-            trips = trips.filter(trip_date__gte=(timezone.now() - timezone.timedelta(days=30)).date())
-        elif date_range == '90d':
-            trips = trips.filter(trip_date__gte=(timezone.now() - timezone.timedelta(days=90)).date())
-        
-        # Headers
-        data.append(['Trip ID', 'Employee', 'Employer', 'Start Time', 'End Time', 'Transport Mode', 'Distance (km)', 'Carbon Savings (kg)', 'Credits Earned', 'Status'])
-        
-        # Trip data
-        for trip in trips:
-            data.append([
-                trip.id,
-                trip.employee.user.get_full_name(),
-                trip.employee.employer.company_name,
-                trip.trip_date.strftime('%Y-%m-%d %H:%M'),
-                trip.end_time.strftime('%Y-%m-%d %H:%M') if trip.end_time else 'N/A',
-                trip.get_transport_mode_display(),
-                trip.distance,
-                trip.carbon_savings,
-                trip.carbon_credits,
-                'Verified' if trip.is_verified else 'Pending'
-            ])
-    
-    elif report_type == 'credits':
-        # Get credits based on date range
-        credits = CarbonCredit.objects.all().order_by('-timestamp')
-        
-        # Apply date filter if needed
-        if date_range == '7d':
-            credits = credits.filter(timestamp__gte=(timezone.now() - timezone.timedelta(days=7)).date())
-        elif date_range == '30d':
-            credits = credits.filter(timestamp__gte=(timezone.now() - timezone.timedelta(days=30)).date())
-        elif date_range == '90d':
-            credits = credits.filter(timestamp__gte=(timezone.now() - timezone.timedelta(days=90)).date())
-        
-        # Headers
-        data.append(['Credit ID', 'Amount', 'Source Type', 'Owner Type', 'Owner ID', 'Status', 'Timestamp', 'Expiry Date'])
-        
-        # Credit data
-        for credit in credits:
-            data.append([
-                credit.id,
-                credit.amount,
-                'Trip' if credit.source_trip else 'System',
-                credit.owner_type,
-                credit.owner_id,
-                credit.status,
-                credit.timestamp.strftime('%Y-%m-%d %H:%M'),
-                credit.expiry_date.strftime('%Y-%m-%d') if credit.expiry_date else 'N/A'
-            ])
-    
-    elif report_type == 'employers':
-        # Get all employers
-        employers = EmployerProfile.objects.all().order_by('company_name')
-        
-        # Headers
-        data.append(['Company Name', 'Industry', 'Total Employees', 'Total Trips', 'Total Carbon Saved (kg)', 'Total Credits'])
-        
-        # Employer data
-        for employer in employers:
-            employee_count = employer.employees.count()
-            
-            # Get trips for this employer's employees
-            employee_ids = employer.employees.values_list('id', flat=True)
-            trips = Trip.objects.filter(employee__id__in=employee_ids)
-            trip_count = trips.count()
-            carbon_saved = trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
-            
-            # Get credits for this employer
-            credits = CarbonCredit.objects.filter(owner_type='employer', owner_id=employer.id)
-            total_credits = credits.aggregate(Sum('amount'))['amount__sum'] or 0
-            
-            data.append([
-                employer.company_name,
-                employer.industry,
-                employee_count,
-                trip_count,
-                carbon_saved,
-                total_credits
-            ])
+    # Rows are generated lazily so large exports stream in constant memory
+    report_rows = {
+        'summary': _summary_export_rows,
+        'trips': _trip_export_rows,
+        'credits': _credit_export_rows,
+        'employers': _employer_export_rows,
+    }.get(report_type)
+    rows = report_rows(date_range) if report_rows else iter(())
     
     # Generate export based on format
     if format == 'csv':
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="carbon_credits_{report_type}_report.csv"'
-        
-        # Write CSV data
-        writer = csv.writer(response)
-        for row in data:
-            writer.writerow(row)
-        
-        return response
+        return streaming_csv_response(rows, f'carbon_credits_{report_type}_report.csv')
     
     elif format == 'pdf':
         # For PDF, a more complex implementation would be needed with a PDF library
         # This is a simplified version that returns a text response
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="carbon_credits_{report_type}_report.txt"'
-        
-        # Write data as text
-        output = io.StringIO()
-        for row in data:
-            output.write('\t'.join([str(item) for item in row]) + '\n')
-        
-        response.write(output.getvalue())
-        return response
+        return streaming_text_response(rows, f'carbon_credits_{report_type}_report.txt')
     
     # Default fallback - return JSON
-    return JsonResponse({'data': data})
+    return JsonResponse({'data': list(rows)})
+
+
+def _export_since(date_range):
+    """Start date for a 7d/30d/90d export window, or None for all time."""
+    days = {'7d': 7, '30d': 30, '90d': 90}.get(date_range)
+    return (timezone.now() - timedelta(days=days)).date() if days else None
+
+
+def _summary_export_rows(date_range):
+    """Rows for the summary export."""
+    # User statistics
+    total_users = CustomUser.objects.count()
+    total_employees = EmployeeProfile.objects.count()
+    total_employers = EmployerProfile.objects.count()
+    
+    # Trip statistics
+    trip_stats = Trip.objects.aggregate(total_trips=Count('id'), total_carbon_saved=Sum('carbon_savings'))
+    total_trips = trip_stats['total_trips']
+    
+    # Calculate average trips per employee
+    avg_trips_per_user = total_trips / total_employees if total_employees > 0 else 0
+    
+    # Credit statistics, from the balances so archived credits still count
+    credit_totals = CreditBalance.totals_for(None)
+    
+    yield ['Metric', 'Value']
+    yield ['Total Users', total_users]
+    yield ['Total Employees', total_employees]
+    yield ['Total Employers', total_employers]
+    yield ['Total Trips', total_trips]
+    yield ['Total Carbon Saved (kg)', trip_stats['total_carbon_saved'] or 0]
+    yield ['Average Trips per User', round(avg_trips_per_user, 2)]
+    yield ['Total Credits', sum(credit_totals.values())]
+    yield ['Redeemed Credits', credit_totals['used']]
+
+
+def _trip_export_rows(date_range):
+    """Rows for the trips export, streamed from the database in chunks."""
+    yield ['Trip ID', 'Employee', 'Employer', 'Trip Date', 'Transport Mode', 'Distance (km)', 'Carbon Savings (kg)', 'Credits Earned', 'Status']
+    
+    trips = Trip.objects.order_by('-trip_date', '-id')
+    since = _export_since(date_range)
+    if since:
+        trips = trips.filter(trip_date__gte=since)
+    
+    mode_labels = dict(Trip.TRANSPORT_MODES)
+    status_labels = dict(Trip.VERIFICATION_STATUS)
+    rows = trips.values_list(
+        'id', 'employee__user__first_name', 'employee__user__last_name', 'employee__employer__company_name',
+        'trip_date', 'transport_mode', 'distance_km', 'carbon_savings', 'credits_earned', 'verification_status'
+    )
+    for trip_id, first_name, last_name, company, trip_date, mode, distance, savings, credits, status in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            trip_id,
+            f'{first_name} {last_name}'.strip(),
+            company or 'N/A',
+            format_datetime(trip_date, '%Y-%m-%d'),
+            mode_labels.get(mode, mode),
+            distance,
+            savings,
+            credits,
+            status_labels.get(status, status),
+        ]
+
+
+def _credit_export_rows(date_range):
+    """Rows for the credits export, streamed from the database in chunks."""
+    yield ['Credit ID', 'Amount', 'Source Type', 'Owner Type', 'Owner ID', 'Status', 'Timestamp', 'Expiry Date']
+    
+    credits = CarbonCredit.objects.order_by('-timestamp')
+    since = _export_since(date_range)
+    if since:
+        credits = credits.filter(timestamp__date__gte=since)
+    
+    rows = credits.values_list(
+        'id', 'amount', 'source_trip_id', 'owner_type', 'owner_id', 'status', 'timestamp', 'expiry_date'
+    )
+    for credit_id, amount, source_trip_id, owner_type, owner_id, status, timestamp, expiry_date in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            credit_id,
+            amount,
+            'Trip' if source_trip_id else 'System',
+            owner_type,
+            owner_id,
+            status,
+            format_datetime(timestamp),
+            format_datetime(expiry_date, '%Y-%m-%d'),
+        ]
+
+
+def _employer_export_rows(date_range):
+    """Rows for the employers export, one annotated query instead of four per employer."""
+    yield ['Company Name', 'Total Employees', 'Total Trips', 'Total Carbon Saved (kg)', 'Total Credits']
+    
+    # From the balance row, so credits compacted by archive_credits still count
+    employer_credits = CreditBalance.objects.filter(
+        owner_type='employer', owner_id=OuterRef('pk')
+    ).values(total=F('active') + F('pending') + F('used') + F('expired'))
+    
+    employers = EmployerProfile.objects.annotate(
+        employee_count=Count('employees', distinct=True),
+        trip_count=Count('employees__trips'),
+        carbon_saved=Sum('employees__trips__carbon_savings'),
+        total_credits=Subquery(employer_credits)
+    ).order_by('company_name').values_list(
+        'company_name', 'employee_count', 'trip_count', 'carbon_saved', 'total_credits'
+    )
+    for company_name, employee_count, trip_count, carbon_saved, total_credits in employers.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield [company_name, employee_count, trip_count, carbon_saved or 0, total_credits or 0]
 
 # Profile views
 @login_required
@@ -859,7 +843,7 @@ def generate_report(request):
             avg_trips_per_user = total_trips / total_employees
             
         # Credit statistics
-        total_credits = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+        total_credits = CreditBalance.grand_total()
         redeemed_credits = CarbonCredit.objects.filter(status='redeemed').aggregate(Sum('amount'))['amount__sum'] or 0
         
         context.update({
@@ -909,8 +893,7 @@ def generate_report(request):
             carbon_saved = trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
             
             # Get credits for this employer
-            credits = CarbonCredit.objects.filter(owner_type='employer', owner_id=employer.id)
-            total_credits = credits.aggregate(Sum('amount'))['amount__sum'] or 0
+            total_credits = CreditBalance.for_owner('employer', employer.id).total
             
             employer_stats.append({
                 'employer': employer,
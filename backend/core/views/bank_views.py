@@ -1,21 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse
+from django.urls import reverse
 from users.models import CustomUser, EmployerProfile, Location
-from trips.models import Trip, CarbonCredit
+from trips.models import Trip, CarbonCredit, CreditBalance
 from marketplace.models import MarketplaceTransaction, MarketOffer
+from marketplace import orderbook
 from django.db.models import Sum, Count, Avg, Case, When, Value, IntegerField, F, Q, Max, Min
 from django.utils import timezone
 from datetime import timedelta, datetime
+from decimal import Decimal, InvalidOperation
 from django.contrib import messages
 from django.core.paginator import Paginator
-import csv
-import io
+import os
 from django.utils.decorators import method_decorator
 from users.decorators import bank_required
 from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.db import models
+from core.analytics import get_daily_analytics
+from core.models import DailyCreditRollup, ReportJob
+from core.reports import (
+    CONTENT_TYPES as REPORT_CONTENT_TYPES, DATE_RANGE_DAYS, csv_rows, get_report_snapshot, report_tables, report_window,
+    summary_stats
+)
+from core.tasks import enqueue_report_job
+from core.utils.export import (
+    EXPORT_CHUNK_SIZE, format_datetime, streaming_csv_response, streaming_text_response
+)
 
 @login_required
 @user_passes_test(lambda u: u.is_bank_admin)
@@ -29,12 +41,14 @@ def dashboard(request):
     pending_approvals = EmployerProfile.objects.filter(approved=False).count()
     
     # Credit statistics
-    total_credits_raw = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
+    total_credits_raw = CreditBalance.grand_total()
     total_credits = round(float(total_credits_raw), 2)  # Round to 2 decimal places
     
     # Recent credits (last 7 days)
     seven_days_ago = timezone.now() - timedelta(days=7)
-    recent_credits = CarbonCredit.objects.filter(timestamp__gte=seven_days_ago).aggregate(Sum('amount'))['amount__sum'] or 0
+    recent_credits = DailyCreditRollup.objects.filter(
+        day__gte=timezone.localdate(seven_days_ago)
+    ).aggregate(Sum('credits_issued'))['credits_issued__sum'] or 0
     recent_credits = round(float(recent_credits), 2)
     
     # Trip statistics
@@ -88,18 +102,11 @@ def dashboard_analytics(request):
     days = int(request.GET.get('days', 30))
     start_date = timezone.now() - timedelta(days=days)
     
-    # Credits issued per day
-    credits_per_day = (
-        CarbonCredit.objects
-        .filter(timestamp__gte=start_date)
-        .extra(select={'day': "DATE(timestamp)"})
-        .values('day')
-        .annotate(total=Sum('amount'))
-        .order_by('day')
-    )
+    # Pre-summed per-day rows, maintained on write (see core.analytics)
+    analytics = get_daily_analytics(timezone.localdate(start_date))
     
     # If no data, create sample data points
-    if not credits_per_day:
+    if not analytics['credits_per_day']:
         # Generate sample data for the requested date range
         sample_credits = []
         for i in range(days):
@@ -109,30 +116,11 @@ def dashboard_analytics(request):
                 'day': current_date,
                 'total': round(float(i % 5) + 0.5 + (i % 3), 2)  # Simple pattern with some variation
             })
-        credits_per_day = sample_credits
-    
-    # Trips logged per day
-    trips_per_day = (
-        Trip.objects
-        .filter(trip_date__gte=start_date)
-        .extra(select={'day': "DATE(trip_date)"})
-        .values('day')
-        .annotate(count=Count('id'))
-        .order_by('day')
-    )
-    
-    # Transport modes distribution
-    transport_modes = (
-        Trip.objects
-        .filter(trip_date__gte=start_date)
-        .values('transport_mode')
-        .annotate(count=Count('id'))
-        .order_by('-count')
-    )
+        analytics['credits_per_day'] = sample_credits
     
     # If no transport modes data, create sample data
-    if not transport_modes:
-        transport_modes = [
+    if not analytics['transport_modes']:
+        analytics['transport_modes'] = [
             {'transport_mode': 'bicycle', 'count': 12},
             {'transport_mode': 'work_from_home', 'count': 8},
             {'transport_mode': 'walking', 'count': 6},
@@ -140,22 +128,7 @@ def dashboard_analytics(request):
             {'transport_mode': 'car', 'count': 3},
         ]
     
-    # Transaction volume per day
-    transactions_per_day = (
-        MarketplaceTransaction.objects
-        .filter(created_at__gte=start_date)
-        .extra(select={'day': "DATE(created_at)"})
-        .values('day')
-        .annotate(count=Count('id'), volume=Sum('credit_amount'))
-        .order_by('day')
-    )
-    
-    return JsonResponse({
-        'credits_per_day': list(credits_per_day),
-        'trips_per_day': list(trips_per_day),
-        'transport_modes': list(transport_modes),
-        'transactions_per_day': list(transactions_per_day),
-    })
+    return JsonResponse(analytics)
 
 @login_required
 @user_passes_test(lambda u: u.is_bank_admin)
@@ -190,17 +163,17 @@ def employer_detail(request, employer_id):
     employer = get_object_or_404(EmployerProfile, id=employer_id)
     
     # Get employer statistics
-    total_employees = employer.user.employee_set.count()
+    total_employees = employer.employees.count()
     total_trips = Trip.objects.filter(employee__employer=employer).count()
     verified_trips = Trip.objects.filter(
         employee__employer=employer,
         verification_status='verified'
     ).count()
     
-    # Calculate total credits earned by employer's employees
-    total_credits = CarbonCredit.objects.filter(
-        trip__employee__employer=employer
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    # Calculate total credits held by employer's employees (balances include archived credits)
+    total_credits = CreditBalance.grand_total(
+        Q(owner_type='employee', owner_id__in=employer.employees.values('id'))
+    )
     
     # Get recent trips
     recent_trips = Trip.objects.filter(
@@ -416,11 +389,10 @@ def transaction_approval(request, transaction_id):
         action = request.GET.get('action', '')  # Get action from query parameter
         
         if action == 'approve':
-            # Update transaction status
-            transaction.status = 'completed'
-            transaction.approved_by = request.user
-            transaction.completed_at = timezone.now()
-            transaction.save()
+            # Update transaction status, if no one settled it first
+            if not orderbook.settle(transaction, 'completed', approved_by=request.user, completed_at=timezone.now()):
+                messages.error(request, f"Transaction #{transaction.id} is no longer pending.")
+                return redirect('bank:bank_trading')
             
             # Add the carbon credits to the buyer's account
             CarbonCredit.objects.create(
@@ -438,18 +410,10 @@ def transaction_approval(request, transaction_id):
             return redirect('bank:bank_trading')
             
         elif action == 'reject':
-            transaction.status = 'rejected'
-            transaction.save()
-            
-            # Return the credits to the seller's offer
-            offer = transaction.offer
-            if offer.status != 'cancelled' and offer.status != 'expired':
-                offer.credit_amount += transaction.credit_amount
-                offer.total_price = offer.credit_amount * offer.price_per_credit
-                # If the offer was completed, set it back to active
-                if offer.status == 'completed':
-                    offer.status = 'active'
-                offer.save()
+            # Reject and return the credits to the seller's offer, if no one settled it first
+            if not orderbook.reject(transaction):
+                messages.error(request, f"Transaction #{transaction.id} is no longer pending.")
+                return redirect('bank:bank_trading')
             
             messages.success(request, f"Transaction #{transaction.id} rejected. Credits returned to the marketplace.")
             return redirect('bank:bank_trading')
@@ -468,46 +432,17 @@ def buy_credits(request):
     if request.method == 'POST':
         offer_id = request.POST.get('buyOfferId')
         credit_amount = request.POST.get('creditAmount')
-        price_per_credit = request.POST.get('pricePerCredit')
-        total_price = request.POST.get('totalPrice')
         
         try:
-            # Get the offer
-            offer = MarketOffer.objects.get(id=offer_id)
-            
-            # Check if offer is active
-            if offer.status != 'active':
-                messages.error(request, "This offer is no longer active")
-                return redirect('bank:bank_trading')
-                
-            # Check if enough credits available
-            if int(credit_amount) > offer.credit_amount:
-                messages.error(request, "Not enough credits available in this offer")
-                return redirect('bank:bank_trading')
-            
-            # Create the transaction
-            transaction = MarketplaceTransaction.objects.create(
-                offer=offer,
-                seller=offer.seller,
-                buyer=request.user.employer_profile,
-                credit_amount=int(credit_amount),
-                price_per_credit=float(price_per_credit),
-                total_price=float(total_price),
-                status='pending'
-            )
-            
-            # If this purchase uses all remaining credits, mark offer as completed
-            if int(credit_amount) == offer.credit_amount:
-                offer.status = 'completed'
-                offer.save()
-            # Otherwise, reduce the available credits
-            else:
-                offer.credit_amount -= int(credit_amount)
-                offer.total_price = offer.credit_amount * offer.price_per_credit
-                offer.save()
-                
+            # Lock the offer, check it and reduce it in one transaction; the price
+            # always comes from the offer, not from the submitted form
+            orderbook.buy_from_offer(request.user.employer_profile, offer_id, Decimal(credit_amount))
             messages.success(request, f"Successfully placed order for {credit_amount} credits")
             
+        except orderbook.OrderError as e:
+            messages.error(request, str(e))
+        except (InvalidOperation, TypeError):
+            messages.error(request, "Invalid amount specified")
         except MarketOffer.DoesNotExist:
             messages.error(request, "The selected offer no longer exists")
         except Exception as e:
@@ -614,32 +549,20 @@ def reports(request):
     
     # Additional data for summary report
     if report_type == 'summary':
-        # Transaction statistics
-        total_transactions = MarketplaceTransaction.objects.count()
-        total_volume = MarketplaceTransaction.objects.aggregate(Sum('credit_amount'))['credit_amount__sum'] or 0
+        # Transaction statistics, shared with the report exports
+        stats = summary_stats(MarketplaceTransaction.objects.all())
         
         # Credits statistics
-        total_credits = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        # Get the average price per credit from completed transactions
-        avg_price_per_credit = (
-            MarketplaceTransaction.objects
-            .filter(status='completed')
-            .aggregate(avg_price=Avg('price_per_credit'))['avg_price'] or 0
-        )
-        
-        # Count transactions by status
-        completed_transactions = MarketplaceTransaction.objects.filter(status='completed').count()
-        pending_transactions = MarketplaceTransaction.objects.filter(status='pending').count()
+        total_credits = CreditBalance.grand_total()
         
         # Add stats to context
         context.update({
-            'total_transactions': total_transactions,
-            'total_volume': total_volume,
+            'total_transactions': stats['total_transactions'],
+            'total_volume': stats['total_volume'],
             'total_credits': total_credits,
-            'avg_price_per_credit': round(avg_price_per_credit, 2),
-            'completed_transactions': completed_transactions,
-            'pending_transactions': pending_transactions,
+            'avg_price_per_credit': round(stats['avg_price'], 2),
+            'completed_transactions': stats['completed'],
+            'pending_transactions': stats['pending'],
         })
     
     return render(request, 'bank/reports.html', context)
@@ -654,97 +577,73 @@ def export_reports(request):
     date_range = request.GET.get('date_range', 'all')
     format = request.GET.get('format', 'csv')
     
-    # Get data based on report type
-    data = []
-    
-    if report_type == 'summary':
-        # Transaction statistics
-        total_transactions = MarketplaceTransaction.objects.count()
-        total_volume = MarketplaceTransaction.objects.aggregate(Sum('credit_amount'))['credit_amount__sum'] or 0
-        
-        # Credits statistics
-        total_credits = CarbonCredit.objects.aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        # Get the average price per credit from completed transactions
-        avg_price_per_credit = (
-            MarketplaceTransaction.objects
-            .filter(status='completed')
-            .aggregate(avg_price=Avg('price_per_credit'))['avg_price'] or 0
-        )
-        
-        # Count transactions by status
-        completed_transactions = MarketplaceTransaction.objects.filter(status='completed').count()
-        pending_transactions = MarketplaceTransaction.objects.filter(status='pending').count()
-        
-        # Summary data
-        data = [
-            ['Metric', 'Value'],
-            ['Total Transactions', total_transactions],
-            ['Total Trading Volume', total_volume],
-            ['Total Credits', total_credits],
-            ['Average Price per Credit', round(avg_price_per_credit, 2)],
-            ['Completed Transactions', completed_transactions],
-            ['Pending Transactions', pending_transactions]
-        ]
-    
-    elif report_type == 'transactions':
-        # Get transactions based on date range
-        transactions = MarketplaceTransaction.objects.all().order_by('-created_at')
-        
-        # Apply date filter if needed
-        if date_range == '7d':
-            transactions = transactions.filter(created_at__gte=timezone.now() - timedelta(days=7))
-        elif date_range == '30d':
-            transactions = transactions.filter(created_at__gte=timezone.now() - timedelta(days=30))
-        elif date_range == '90d':
-            transactions = transactions.filter(created_at__gte=timezone.now() - timedelta(days=90))
-        
-        # Headers
-        data.append(['Transaction ID', 'Seller', 'Buyer', 'Credits', 'Price per Credit', 'Total Price', 'Status', 'Created', 'Completed'])
-        
-        # Transaction data
-        for transaction in transactions:
-            data.append([
-                transaction.id,
-                transaction.seller.company_name if transaction.seller else 'N/A',
-                transaction.buyer.company_name if transaction.buyer else 'N/A',
-                transaction.credit_amount,
-                transaction.price_per_credit,
-                transaction.total_price,
-                transaction.status,
-                transaction.created_at.strftime('%Y-%m-%d %H:%M') if transaction.created_at else 'N/A',
-                transaction.completed_at.strftime('%Y-%m-%d %H:%M') if transaction.completed_at else 'N/A'
-            ])
+    # Rows are generated lazily so large exports stream in constant memory
+    if report_type == 'transactions':
+        rows = _transaction_export_rows(date_range)
+    elif report_type == 'summary':
+        rows = _summary_export_rows()
+    else:
+        rows = iter(())
     
     # Generate export based on format
     if format == 'csv':
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="carbon_trading_{report_type}_report.csv"'
-        
-        # Write CSV data
-        writer = csv.writer(response)
-        for row in data:
-            writer.writerow(row)
-        
-        return response
+        return streaming_csv_response(rows, f'carbon_trading_{report_type}_report.csv')
     
     elif format == 'pdf':
         # For PDF, a more complex implementation would be needed with a PDF library
         # This is a simplified version that returns a text response
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="carbon_trading_{report_type}_report.txt"'
-        
-        # Write data as text
-        output = io.StringIO()
-        for row in data:
-            output.write('\t'.join([str(item) for item in row]) + '\n')
-        
-        response.write(output.getvalue())
-        return response
+        return streaming_text_response(rows, f'carbon_trading_{report_type}_report.txt')
     
     # Default fallback - return JSON
-    return JsonResponse({'data': data})
+    return JsonResponse({'data': list(rows)})
+
+
+def _summary_export_rows():
+    """Rows for the summary export."""
+    # Transaction statistics, shared with the report exports
+    stats = summary_stats(MarketplaceTransaction.objects.all())
+    
+    # Credits statistics
+    total_credits = CreditBalance.grand_total()
+    
+    yield ['Metric', 'Value']
+    yield ['Total Transactions', stats['total_transactions']]
+    yield ['Total Trading Volume', stats['total_volume']]
+    yield ['Total Credits', total_credits]
+    yield ['Average Price per Credit', round(stats['avg_price'], 2)]
+    yield ['Completed Transactions', stats['completed']]
+    yield ['Pending Transactions', stats['pending']]
+
+
+def _transaction_export_rows(date_range):
+    """Rows for the transactions export, streamed from the database in chunks."""
+    yield ['Transaction ID', 'Seller', 'Buyer', 'Credits', 'Price per Credit', 'Total Price', 'Status', 'Created', 'Completed']
+    
+    transactions = MarketplaceTransaction.objects.order_by('-created_at')
+    
+    # Apply date filter if needed
+    days = {'7d': 7, '30d': 30, '90d': 90}.get(date_range)
+    if days:
+        transactions = transactions.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    
+    rows = transactions.values_list(
+        'id', 'seller__company_name', 'buyer__company_name', 'credit_amount',
+        'total_price', 'status', 'created_at', 'completed_at'
+    )
+    for tx_id, seller, buyer, credit_amount, total_price, status, created_at, completed_at in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield [
+            tx_id,
+            seller or 'N/A',
+            buyer or 'N/A',
+            credit_amount,
+            round(total_price / credit_amount, 2) if credit_amount else 'N/A',
+            total_price,
+            status,
+            format_datetime(created_at),
+            format_datetime(completed_at),
+        ]
 
 # Transactions view
 @login_required
@@ -817,22 +716,16 @@ class BankReportsView(View):
         report_type = request.POST.get('report_type', '')
         date_range = request.POST.get('date_range', '7d')
         
-        # Calculate the date range
-        end_date = timezone.now()
-        if date_range == '7d':
-            start_date = end_date - timedelta(days=7)
-        elif date_range == '30d':
-            start_date = end_date - timedelta(days=30)
-        elif date_range == '90d':
-            start_date = end_date - timedelta(days=90)
-        elif date_range == '1y':
-            start_date = end_date - timedelta(days=365)
-        else:
+        # Calculate the date range, open-ended so snapshots can be shared; the start is
+        # truncated to the minute so concurrent viewers hit the same cache key
+        if date_range not in DATE_RANGE_DAYS:
             # Default to 7 days
-            start_date = end_date - timedelta(days=7)
+            date_range = '7d'
+        start_date, _ = report_window(date_range)
+        start_date = start_date.replace(second=0, microsecond=0)
         
         # Get report data based on type
-        context = self._get_report_data(report_type, start_date, end_date)
+        context = self._get_report_data(report_type, start_date, None)
         
         # Add report type to context
         context['report_type'] = report_type
@@ -841,204 +734,8 @@ class BankReportsView(View):
         return render(request, 'bank/partials/report_content.html', context)
     
     def _get_report_data(self, report_type, start_date, end_date):
-        """Get data for the specified report type and date range"""
-        context = {}
-        
-        # Filter transactions by date range
-        transactions = MarketplaceTransaction.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date
-        )
-        
-        if report_type == 'summary':
-            # Summary report data
-            total_transactions = transactions.count()
-            total_volume = transactions.aggregate(total=Sum('credit_amount'))['total'] or 0
-            total_value = transactions.aggregate(total=Sum('total_price'))['total'] or 0
-            avg_price = transactions.aggregate(avg=Avg(F('total_price') / F('credit_amount')))['avg'] or 0
-            buy_count = transactions.count()
-            sell_count = transactions.count()
-            
-            context.update({
-                'total_transactions': total_transactions,
-                'total_volume': total_volume,
-                'total_value': total_value,
-                'avg_price': avg_price,
-                'buy_count': buy_count,
-                'sell_count': sell_count,
-            })
-            
-        elif report_type == 'transactions':
-            # Transaction report data - list all transactions
-            context['transactions'] = transactions.order_by('-created_at')
-            
-        elif report_type == 'price':
-            # Price analytics report
-            latest_transaction = transactions.order_by('-created_at').first()
-            current_price = latest_transaction.total_price / latest_transaction.credit_amount if latest_transaction else 0
-            avg_price = transactions.aggregate(avg=Avg(F('total_price') / F('credit_amount')))['avg'] or 0
-            highest_price = transactions.annotate(price=F('total_price') / F('credit_amount')).aggregate(max=Max('price'))['max'] or 0
-            lowest_price = transactions.annotate(price=F('total_price') / F('credit_amount')).aggregate(min=Min('price'))['min'] or 0
-            
-            # Group by day for price changes
-            daily_prices = []
-            # Implementation of daily price changes would go here
-            # This would typically involve more complex queries with aggregation by date
-            
-            context.update({
-                'current_price': current_price,
-                'avg_price': avg_price,
-                'highest_price': highest_price,
-                'lowest_price': lowest_price,
-                'price_changes': daily_prices,
-            })
-            
-        elif report_type == 'employer_activity':
-            # Employer activity report
-            # Get top buyers and sellers by volume
-            top_buyers = transactions.values('buyer__company_name').annotate(
-                transaction_count=Count('id'),
-                volume=Sum('credit_amount'),
-                total_value=Sum('total_price')
-            ).order_by('-volume')[:5]
-            
-            top_sellers = transactions.values('seller__company_name').annotate(
-                transaction_count=Count('id'),
-                volume=Sum('credit_amount'),
-                total_value=Sum('total_price')
-            ).order_by('-volume')[:5]
-            
-            context.update({
-                'top_buyers': top_buyers,
-                'top_sellers': top_sellers,
-            })
-            
-        return context
-
-@login_required
-@bank_required
-def export_report(request, report_type, date_range, format_type):
-    """Export a report in the specified format"""
-    # Calculate the date range
-    end_date = timezone.now()
-    if date_range == '7d':
-        start_date = end_date - timedelta(days=7)
-    elif date_range == '30d':
-        start_date = end_date - timedelta(days=30)
-    elif date_range == '90d':
-        start_date = end_date - timedelta(days=90)
-    elif date_range == '1y':
-        start_date = end_date - timedelta(days=365)
-    else:
-        # Default to 7 days
-        start_date = end_date - timedelta(days=7)
-    
-    # Get transactions for the specified date range
-    transactions = MarketplaceTransaction.objects.filter(
-        created_at__gte=start_date,
-        created_at__lte=end_date
-    ).order_by('-created_at')
-    
-    if format_type == 'csv':
-        # Generate CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{report_type}_report_{date_range}.csv"'
-        
-        writer = csv.writer(response)
-        
-        if report_type == 'summary':
-            # Summary report CSV
-            writer.writerow(['Report Type', 'Date Range', 'Generated At'])
-            writer.writerow(['Summary Report', date_range, timezone.now().strftime('%Y-%m-%d %H:%M:%S')])
-            writer.writerow([])
-            
-            total_transactions = transactions.count()
-            total_volume = transactions.aggregate(total=Sum('credit_amount'))['total'] or 0
-            total_value = transactions.aggregate(total=Sum('total_price'))['total'] or 0
-            avg_price = transactions.aggregate(avg=Avg(F('total_price') / F('credit_amount')))['avg'] or 0
-            buy_count = transactions.count()
-            sell_count = transactions.count()
-            
-            writer.writerow(['Total Transactions', 'Total Volume', 'Total Value', 'Avg. Price', 'Buy Transactions', 'Sell Transactions'])
-            writer.writerow([total_transactions, total_volume, total_value, avg_price, buy_count, sell_count])
-            
-        elif report_type == 'transactions':
-            # Transaction report CSV
-            writer.writerow(['Date', 'Transaction ID', 'Buyer', 'Seller', 'Volume', 'Price', 'Total Value', 'Status'])
-            
-            for transaction in transactions:
-                # Calculate price per credit from total price and credit amount
-                price_per_credit = transaction.total_price / transaction.credit_amount if transaction.credit_amount > 0 else 0
-                
-                writer.writerow([
-                    transaction.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    transaction.id,
-                    transaction.buyer.company_name if transaction.buyer else 'N/A',
-                    transaction.seller.company_name if transaction.seller else 'N/A',
-                    transaction.credit_amount,
-                    round(price_per_credit, 2),
-                    transaction.total_price,
-                    transaction.status
-                ])
-                
-        elif report_type == 'price':
-            # Price report CSV
-            writer.writerow(['Date', 'Price'])
-            
-            # Group by day for price data
-            # This is a simplified example - in a real application, you would aggregate by day
-            for transaction in transactions:
-                if transaction.credit_amount > 0:
-                    price_per_credit = transaction.total_price / transaction.credit_amount
-                    writer.writerow([
-                        transaction.created_at.strftime('%Y-%m-%d'),
-                        round(price_per_credit, 2)
-                    ])
-                
-        elif report_type == 'employer_activity':
-            # Employer activity CSV
-            writer.writerow(['Employer', 'Total Buy Volume', 'Total Sell Volume'])
-            
-            # This is a simplified example - in a real application, you would 
-            # aggregate by employer with more complex queries
-            employers = {}
-            
-            # Get buy data
-            buyer_data = transactions.values('buyer__company_name').annotate(
-                buy_volume=Sum('credit_amount')
-            )
-            for item in buyer_data:
-                company_name = item['buyer__company_name']
-                if company_name not in employers:
-                    employers[company_name] = {'buy': 0, 'sell': 0}
-                employers[company_name]['buy'] = item['buy_volume']
-            
-            # Get sell data
-            seller_data = transactions.values('seller__company_name').annotate(
-                sell_volume=Sum('credit_amount')
-            )
-            for item in seller_data:
-                company_name = item['seller__company_name']
-                if company_name not in employers:
-                    employers[company_name] = {'buy': 0, 'sell': 0}
-                employers[company_name]['sell'] = item['sell_volume']
-            
-            for employer, data in employers.items():
-                writer.writerow([
-                    employer,
-                    data['buy'],
-                    data['sell']
-                ])
-        
-        return response
-        
-    elif format_type == 'pdf':
-        # In a real application, you would use a PDF library like ReportLab or WeasyPrint
-        # For this example, we'll return a simple message
-        return HttpResponse("PDF export would be implemented here with a PDF generation library.")
-    
-    # Default response if format isn't supported
-    return redirect('bank:bank_reports')
+        """Get data for the specified report type and date range (end_date None means up to now)"""
+        return dict(get_report_snapshot(report_type, start_date, end_date))
 
 @login_required
 @user_passes_test(lambda u: u.is_bank_admin)
@@ -1077,49 +774,68 @@ def generate_report(request):
 @user_passes_test(lambda u: u.is_bank_admin)
 def export_report(request):
     """
-    API endpoint for exporting reports as CSV, PDF, or Excel
+    API endpoint for exporting reports as CSV, PDF, or Excel.
+    
+    CSV is streamed straight back. PDF and Excel reports are rendered by a
+    background job; the response is a 202 with the job's status URL to poll
+    until it gives a download URL.
     """
     report_type = request.GET.get('report_type', 'summary')
     date_range = request.GET.get('date_range', '7d')
     format_type = request.GET.get('format', 'csv')
     
-    # Get date range in actual dates
-    today = datetime.now().date()
-    if date_range == '7d':
-        start_date = today - timedelta(days=7)
-    elif date_range == '30d':
-        start_date = today - timedelta(days=30)
-    elif date_range == '90d':
-        start_date = today - timedelta(days=90)
-    elif date_range == '1y':
-        start_date = today - timedelta(days=365)
-    else:  # All time
-        start_date = None
+    if report_type not in dict(ReportJob.REPORT_TYPES):
+        return JsonResponse({'error': f'Unknown report type: {report_type}'}, status=400)
     
-    # Example for CSV export - you would implement other formats similarly
     if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{report_type}_report_{date_range}.csv"'
-        
-        writer = csv.writer(response)
-        
-        # Write headers based on report type
-        if report_type == 'summary':
-            writer.writerow(['Metric', 'Value', 'Change'])
-            writer.writerow(['Total Credits Managed', '45,678', '+12.5%'])
-            writer.writerow(['Transaction Volume', '893', '+5.2%'])
-            writer.writerow(['Average Price', '$65', '+3.8%'])
-        elif report_type == 'transactions':
-            writer.writerow(['Date', 'Transaction ID', 'Type', 'Counterparty', 'Credits', 'Price', 'Total Value', 'Status'])
-            writer.writerow(['2023-05-10', 'TX-1025478', 'Purchase', 'EcoTech Inc.', '500', '$62.50', '$31,250', 'Completed'])
-            writer.writerow(['2023-05-08', 'TX-1025477', 'Sale', 'GreenLife Co.', '750', '$63.25', '$47,437.50', 'Completed'])
-        # Add more report types as needed
-        
-        return response
+        start_date, end_date = report_window(date_range)
+        return streaming_csv_response(
+            csv_rows(report_tables(report_type, start_date, end_date)),
+            f'{report_type}_report_{date_range}.csv'
+        )
+    
+    if format_type not in dict(ReportJob.FORMATS):
+        return JsonResponse({'error': f'Unsupported format: {format_type}'}, status=400)
     
-    # For other format types, you would implement appropriate export functionality
-    # For now, just return a placeholder response
-    return HttpResponse(f"Export {report_type} as {format_type} not implemented yet")
+    job = ReportJob.objects.create(
+        requested_by=request.user,
+        report_type=report_type,
+        date_range=date_range,
+        format=format_type
+    )
+    enqueue_report_job(job.id)
+    return JsonResponse(_report_job_payload(job), status=202)
+
+@login_required
+@user_passes_test(lambda u: u.is_bank_admin)
+def report_job_status(request, job_id):
+    """Poll a background report job"""
+    job = get_object_or_404(ReportJob, id=job_id, requested_by=request.user)
+    return JsonResponse(_report_job_payload(job))
+
+@login_required
+@user_passes_test(lambda u: u.is_bank_admin)
+def download_report(request, job_id):
+    """Download a finished report"""
+    job = get_object_or_404(ReportJob, id=job_id, requested_by=request.user, status='completed')
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(job.file.name),
+        content_type=REPORT_CONTENT_TYPES[job.format]
+    )
+
+def _report_job_payload(job):
+    payload = {
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('bank:report_job_status', args=[job.id]),
+    }
+    if job.status == 'completed':
+        payload['download_url'] = reverse('bank:download_report', args=[job.id])
+    elif job.status == 'failed':
+        payload['error'] = job.error
+    return payload
 
 @login_required
 @user_passes_test(lambda u: u.is_bank_admin)
@@ -1182,16 +898,10 @@ def approve_transaction(request, transaction_id):
     transaction = get_object_or_404(MarketplaceTransaction, id=transaction_id)
     
     # Only allow approving pending transactions
-    if transaction.status != 'pending':
+    if not orderbook.settle(transaction, 'completed', approved_by=request.user, completed_at=timezone.now()):
         messages.error(request, f"Transaction #{transaction_id} cannot be approved because it is not pending.")
         return redirect('bank:bank_approvals')
     
-    # Update transaction status
-    transaction.status = 'completed'
-    transaction.approved_by = request.user
-    transaction.completed_at = timezone.now()
-    transaction.save()
-    
     # Add the carbon credits to the buyer's account
     CarbonCredit.objects.create(
         amount=transaction.credit_amount,
@@ -1216,25 +926,11 @@ def reject_transaction(request, transaction_id):
     """
     transaction = get_object_or_404(MarketplaceTransaction, id=transaction_id)
     
-    # Only allow rejecting pending transactions
-    if transaction.status != 'pending':
+    # Only allow rejecting pending transactions; the credits go back to the seller's offer
+    if not orderbook.reject(transaction):
         messages.error(request, f"Transaction #{transaction_id} cannot be rejected because it is not pending.")
         return redirect('bank:bank_approvals')
     
-    # Update transaction status
-    transaction.status = 'rejected'
-    transaction.save()
-    
-    # Return the credits to the seller's offer
-    offer = transaction.offer
-    if offer and offer.status != 'cancelled' and offer.status != 'expired':
-        offer.credit_amount += transaction.credit_amount
-        offer.total_price = offer.credit_amount * offer.price_per_credit
-        # If the offer was completed, set it back to active
-        if offer.status == 'completed':
-            offer.status = 'active'
-        offer.save()
-    
     # Notify the user
     messages.success(request, f"Transaction #{transaction_id} rejected. Credits returned to the marketplace.")
     
@@ -8,7 +8,7 @@ from users.models import Location
 from .trips_views import create_trip
 from django.core.paginator import Paginator
 from django.db.models import Q
-from trips.models import CarbonCredit, Trip
+from trips.models import CarbonCredit, CreditArchive, CreditBalance, Trip
 from django.conf import settings
 from users.models import CustomUser
 from django.urls import reverse
@@ -307,16 +307,9 @@ def profile(request):
         total_trips = trips.count()
         
         # Carbon credits
-        total_credits = CarbonCredit.objects.filter(
-            owner_type='employee',
-            owner_id=employee_profile.id
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        redeemed_credits = CarbonCredit.objects.filter(
-            owner_type='employee',
-            owner_id=employee_profile.id,
-            status='redeemed'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        credit_balance = CreditBalance.for_owner('employee', employee_profile.id)
+        total_credits = credit_balance.total
+        redeemed_credits = credit_balance.used
         
         # CO2 saved
         co2_saved = trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
@@ -487,11 +480,7 @@ def marketplace(request):
     employer = employee.employer
     
     # Get employee's active credits
-    employee_credits = CarbonCredit.objects.filter(
-        owner_type='employee',
-        owner_id=employee.id,
-        status='active'
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    employee_credits = CreditBalance.get_balance('employee', employee.id)
     
     # Get current market rate (average price from active market offers)
     market_rate = MarketOffer.objects.filter(
@@ -602,25 +591,27 @@ def credits_list(request):
     credits = CarbonCredit.objects.filter(
         owner_type='employee',
         owner_id=employee.id
-    ).order_by('-created_at')
+    ).order_by('-timestamp')
     
-    # Calculate total credits
-    total_credits = credits.aggregate(total=Sum('amount'))['total'] or 0
+    # Calculate total credits (the balance includes credits compacted by archive_credits)
+    total_credits = CreditBalance.for_owner('employee', employee.id).total
     
-    # Get credit history grouped by month
-    credit_history = credits.annotate(
-        month=TruncMonth('created_at')
-    ).values('month').annotate(
-        total=Sum('amount')
-    ).order_by('-month')
+    # Get credit history grouped by month, adding back the archived credits
+    monthly_totals = {}
+    for history in (
+        credits.annotate(month=TruncMonth('timestamp', output_field=models.DateField())),
+        CreditArchive.objects.filter(owner_type='employee', owner_id=employee.id).annotate(month=TruncMonth('day')),
+    ):
+        for item in history.order_by().values('month').annotate(total=Sum('amount')):
+            monthly_totals[item['month']] = monthly_totals.get(item['month'], 0) + item['total']
     
     # Convert credit history to list for JSON serialization
     credit_history_list = [
         {
-            'month': item['month'].strftime('%Y-%m-%d'),
-            'total': float(item['total'])
+            'month': month.strftime('%Y-%m-%d'),
+            'total': float(total)
         }
-        for item in credit_history
+        for month, total in sorted(monthly_totals.items(), reverse=True)
     ]
     
     context = {
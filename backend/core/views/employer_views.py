@@ -2,15 +2,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.urls import reverse
 from users.models import EmployeeProfile, CustomUser, EmployeeInvitation, Location
-from trips.models import Trip, CarbonCredit
+from trips.models import Trip, CarbonCredit, CreditBalance
 from django.db.models import Count, Sum, Avg, Q
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib import messages
 
 # Import marketplace models
 from marketplace.models import MarketOffer, MarketplaceTransaction, TransactionNotification, EmployeeCreditOffer
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from marketplace import notifications as inbox, orderbook
+from core.ledger import approve_trips, debit, pay, transfer, InsufficientCreditsError, InsufficientFundsError
+from core.employer_stats import get_employer_dashboard
+from django.db import transaction
 
 @login_required
 @user_passes_test(lambda u: u.is_employer)
@@ -20,70 +26,10 @@ def dashboard(request):
     """
     employer_profile = request.user.employer_profile
     
-    # Get basic statistics
-    total_employees = employer_profile.employees.count()
-    active_employees = employer_profile.employees.filter(approved=True).count()
-    
-    # Get trip statistics for this employer's employees
-    employee_ids = employer_profile.employees.values_list('id', flat=True)
-    
-    # Trip statistics
-    all_trips = Trip.objects.filter(employee__in=employee_ids)
-    total_trips = all_trips.count()
-    pending_trips = all_trips.filter(verification_status='pending').count()
-    
-    # Carbon credit statistics
-    total_credits = all_trips.aggregate(Sum('credits_earned'))['credits_earned__sum'] or 0
-    
-    # Calculate credits growth (this month vs last month)
-    now = timezone.now()
-    this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
-    
-    this_month_credits = all_trips.filter(trip_date__gte=this_month_start).aggregate(Sum('credits_earned'))['credits_earned__sum'] or 0
-    last_month_credits = all_trips.filter(trip_date__gte=last_month_start, trip_date__lt=this_month_start).aggregate(Sum('credits_earned'))['credits_earned__sum'] or 1  # Avoid division by zero
-    
-    credits_growth = ((this_month_credits - last_month_credits) / last_month_credits) * 100 if last_month_credits > 0 else 0
-    
-    # CO2 saved statistics
-    co2_saved = all_trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
-    tree_equivalent = int(co2_saved / 21)  # Rough estimate: 1 tree absorbs ~21kg CO2 per year
-    
-    # Get top employees for this month
-    top_employees = []
-    employee_profiles = employer_profile.employees.filter(approved=True)
-    
-    for profile in employee_profiles[:5]:  # Limit to top 5
-        employee_trips = all_trips.filter(employee=profile, trip_date__gte=this_month_start)
-        trip_count = employee_trips.count()
-        total_distance = employee_trips.aggregate(Sum('distance_km'))['distance_km__sum'] or 0
-        total_credits = employee_trips.aggregate(Sum('credits_earned'))['credits_earned__sum'] or 0
-        co2_saved = employee_trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
-        
-        if trip_count > 0:
-            top_employees.append({
-                'user': profile.user,
-                'department': getattr(profile, 'department', 'N/A'),
-                'trip_count': trip_count,
-                'total_distance': total_distance,
-                'total_credits': total_credits,
-                'co2_saved': co2_saved
-            })
-    
-    # Sort by credits earned
-    top_employees = sorted(top_employees, key=lambda x: x['total_credits'], reverse=True)
-    
+    # Aggregates and leaderboard come from a cached per-employer snapshot
     context = {
         'page_title': 'Employer Dashboard',
-        'total_employees': total_employees,
-        'active_employees': active_employees,
-        'total_trips': total_trips,
-        'pending_trips': pending_trips,
-        'total_credits': total_credits,
-        'credits_growth': credits_growth,
-        'co2_saved': co2_saved,
-        'tree_equivalent': tree_equivalent,
-        'top_employees': top_employees,
+        **get_employer_dashboard(employer_profile),
     }
     
     return render(request, 'employer/dashboard.html', context)
@@ -94,35 +40,53 @@ def employees_list(request):
     """
     View for listing and managing employees.
     """
-    # Get employees for this employer
-    employees = request.user.employer_profile.employees.all().order_by('-created_at')
+    sort_by = request.GET.get('sort', 'date')
+    sort_dir = request.GET.get('dir', 'desc')
+    
+    employees = request.user.employer_profile.employees.all()
     
     # Get employee counts by status
-    total_employees = employees.count()
-    approved_employees = employees.filter(approved=True).count()
-    pending_employees = employees.filter(approved=False).count()
+    counts = employees.aggregate(
+        total_employees=Count('id'),
+        approved_employees=Count('id', filter=Q(approved=True)),
+        pending_employees=Count('id', filter=Q(approved=False))
+    )
+    total_employees = counts['total_employees']
+    approved_employees = counts['approved_employees']
+    pending_employees = counts['pending_employees']
     
     # Calculate active employees count (active in the last week)
     one_week_ago = timezone.now() - timedelta(days=7)
-    employee_ids = employees.filter(approved=True).values_list('id', flat=True)
     active_employees_count = Trip.objects.filter(
-        employee__in=employee_ids,
+        employee__employer=request.user.employer_profile,
+        employee__approved=True,
         trip_date__gte=one_week_ago
     ).values('employee').distinct().count()
     
-    # For each employee, get their carbon credit statistics
-    for employee in employees:
-        # Get trips for this employee
-        employee_trips = Trip.objects.filter(employee=employee)
-        
-        # Calculate total credits earned
-        employee.total_credits = employee_trips.aggregate(Sum('credits_earned'))['credits_earned__sum'] or 0
-        
-        # Calculate trip count
-        employee.trip_count = employee_trips.count()
-        
-        # Calculate total CO2 saved
-        employee.total_co2_saved = employee_trips.aggregate(Sum('carbon_savings'))['carbon_savings__sum'] or 0
+    # Carbon credit statistics for every employee in the same query as the list
+    employees = employees.select_related('user').annotate(
+        total_credits=Coalesce(Sum('trips__credits_earned'), Decimal('0')),
+        trip_count=Count('trips'),
+        total_co2_saved=Coalesce(Sum('trips__carbon_savings'), Decimal('0'))
+    )
+    
+    # Apply sorting
+    sort_fields = {
+        'credits': 'total_credits',
+        'co2': 'total_co2_saved',
+        'trips': 'trip_count',
+        'name': 'user__first_name',
+        'date': 'created_at',
+    }
+    order_field = sort_fields.get(sort_by, 'created_at')
+    if sort_dir != 'asc':
+        order_field = f'-{order_field}'
+    employees = employees.order_by(order_field, 'id')
+    
+    # Pagination
+    page_number = request.GET.get('page', 1)
+    paginator = Paginator(employees, 20)  # 20 employees per page
+    employees = paginator.get_page(page_number)
     
     context = {
         'employees': employees,
@@ -130,6 +94,8 @@ def employees_list(request):
         'approved_employees': approved_employees,
         'pending_employees': pending_employees,
         'active_employees_count': active_employees_count,
+        'sort_by': sort_by,
+        'sort_dir': sort_dir,
         'page_title': 'Manage Employees',
     }
     
@@ -323,14 +289,8 @@ def trading(request):
     employer_profile = request.user.employer_profile
     
     # Get the employer's current carbon credit balance
-    # This would typically be fetched from a balance system
-    # For now, let's use a placeholder value or calculate from trips
     try:
-        total_credits = CarbonCredit.objects.filter(
-            owner_type='employer', 
-            owner_id=employer_profile.id,
-            status='active'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        total_credits = CreditBalance.get_balance('employer', employer_profile.id)
     except:
         total_credits = 0
     
@@ -357,10 +317,8 @@ def trading(request):
         status='active'
     ).aggregate(Avg('price_per_credit'))['price_per_credit__avg'] or 0
     
-    # Get user's transaction notifications
-    notifications = TransactionNotification.objects.filter(
-        user=request.user
-    ).order_by('-created_at')[:10]  # Show latest 10 notifications
+    # Get user's transaction notifications (latest 10) and the cached unread count
+    notifications, _ = inbox.inbox_page(request.user, limit=10)
     
     context = {
         'page_title': 'Carbon Credit Trading',
@@ -370,6 +328,7 @@ def trading(request):
         'total_purchased': total_purchased,
         'avg_price': avg_price,
         'notifications': notifications,
+        'unread_notification_count': inbox.unread_count(request.user.id),
     }
     
     return render(request, 'employer/trading.html', context)
@@ -409,93 +368,18 @@ def trip_approval(request, trip_id):
         action = request.POST.get('action')
         
         if action == 'approve':
-            # Check if trip already has credits assigned
-            if trip.credits_earned and trip.credits_earned > 0 and trip.verification_status != 'verified':
-                # Check if employer has enough credits in their wallet
-                employer_credits = CarbonCredit.objects.filter(
-                    owner_type='employer',
-                    owner_id=employer_profile.id,
-                    status='active'
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-                
-                credits_to_award = trip.credits_earned
-                
-                if employer_credits >= credits_to_award:
-                    # Update trip status
-                    trip.verification_status = 'verified'
-                    trip.verified_by = request.user
-                    trip.save()
-                    
-                    # Find any pending credits for this trip and activate them
-                    pending_credits = CarbonCredit.objects.filter(
-                        source_trip=trip,
-                        owner_type='employee',
-                        owner_id=trip.employee.id,
-                        status='pending'
-                    )
-                    
-                    if pending_credits.exists():
-                        for credit in pending_credits:
-                            credit.status = 'active'
-                            credit.save()
-                    else:
-                        # Create new credits for employee if none exist
-                        CarbonCredit.objects.create(
-                            amount=credits_to_award,
-                            source_trip=trip,
-                            owner_type='employee',
-                            owner_id=trip.employee.id,
-                            status='active',
-                            expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                        )
-                    
-                    # Deduct credits from employer's wallet
-                    remaining_to_deduct = credits_to_award
-                    employer_active_credits = CarbonCredit.objects.filter(
-                        owner_type='employer',
-                        owner_id=employer_profile.id,
-                        status='active'
-                    ).order_by('timestamp')  # Use oldest credits first
-                    
-                    for credit in employer_active_credits:
-                        if remaining_to_deduct <= 0:
-                            break
-                            
-                        if credit.amount <= remaining_to_deduct:
-                            # Use the entire credit
-                            credit.status = 'used'
-                            credit.save()
-                            remaining_to_deduct -= credit.amount
-                        else:
-                            # Split the credit
-                            new_amount = credit.amount - remaining_to_deduct
-                            
-                            # Update the original credit
-                            credit.amount = new_amount
-                            credit.save()
-                            
-                            # Create a record of the used portion
-                            CarbonCredit.objects.create(
-                                amount=remaining_to_deduct,
-                                source_trip=trip,
-                                owner_type='employer',
-                                owner_id=employer_profile.id,
-                                timestamp=timezone.now(),
-                                status='used',
-                                expiry_date=credit.expiry_date
-                            )
-                            
-                            remaining_to_deduct = 0
-                    
-                    messages.success(request, f"Trip approved and {credits_to_award} credits awarded to the employee.")
-                else:
-                    messages.error(request, f"Not enough credits in your wallet. You need {credits_to_award} credits but only have {employer_credits}.")
-                    return redirect('employer:pending_trips')
+            credits_to_award = trip.credits_earned or 0
+            
+            # Activate the employee's credits and pay for them from the employer's wallet
+            try:
+                approve_trips(employer_profile, [trip])
+            except InsufficientCreditsError as e:
+                messages.error(request, f"Not enough credits in your wallet. You need {e.required} credits but only have {e.available}.")
+                return redirect('employer:pending_trips')
+            
+            if credits_to_award > 0:
+                messages.success(request, f"Trip approved and {credits_to_award} credits awarded to the employee.")
             else:
-                # Update trip status if no credits involved or already verified
-                trip.verification_status = 'verified'
-                trip.verified_by = request.user
-                trip.save()
                 messages.success(request, "Trip approved successfully.")
                 
         elif action == 'reject':
@@ -503,15 +387,11 @@ def trip_approval(request, trip_id):
             trip.save()
             
             # Cancel any pending credits for this trip
-            pending_credits = CarbonCredit.objects.filter(
+            CarbonCredit.objects.filter(
                 source_trip=trip,
                 owner_type='employee',
                 status='pending'
-            )
-            
-            for credit in pending_credits:
-                credit.status = 'expired'
-                credit.save()
+            ).update(status='expired')
             
             messages.success(request, "Trip rejected successfully.")
             
@@ -537,97 +417,16 @@ def approve_all_trips(request):
         verification_status='pending'
     )
     
-    # Calculate total credits needed
-    total_credits_needed = pending_trips.aggregate(total=Sum('credits_earned'))['total'] or 0
-    
-    # Check if employer has enough credits
-    employer_credits = CarbonCredit.objects.filter(
-        owner_type='employer',
-        owner_id=employer_profile.id,
-        status='active'
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    if employer_credits < total_credits_needed:
+    # Approve the whole batch in one transaction; the FIFO draw-down is computed in memory
+    try:
+        approved_count = approve_trips(employer_profile, pending_trips)
+    except InsufficientCreditsError as e:
         messages.error(
             request, 
-            f"Not enough credits in your wallet. You need {total_credits_needed} credits but only have {employer_credits}."
+            f"Not enough credits in your wallet. You need {e.required} credits but only have {e.available}."
         )
         return redirect('employer:pending_trips')
     
-    # Process each trip
-    approved_count = 0
-    for trip in pending_trips:
-        credits_to_award = trip.credits_earned or 0
-        
-        # Update trip status
-        trip.verification_status = 'verified'
-        trip.verified_by = request.user
-        trip.save()
-        
-        if credits_to_award > 0:
-            # Find any pending credits for this trip and activate them
-            pending_credits = CarbonCredit.objects.filter(
-                source_trip=trip,
-                owner_type='employee',
-                owner_id=trip.employee.id,
-                status='pending'
-            )
-            
-            if pending_credits.exists():
-                for credit in pending_credits:
-                    credit.status = 'active'
-                    credit.save()
-            else:
-                # Create new credits for employee if none exist
-                CarbonCredit.objects.create(
-                    amount=credits_to_award,
-                    source_trip=trip,
-                    owner_type='employee',
-                    owner_id=trip.employee.id,
-                    status='active',
-                    expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                )
-            
-            # Deduct credits from employer's wallet
-            remaining_to_deduct = credits_to_award
-            employer_active_credits = CarbonCredit.objects.filter(
-                owner_type='employer',
-                owner_id=employer_profile.id,
-                status='active'
-            ).order_by('timestamp')  # Use oldest credits first
-            
-            for credit in employer_active_credits:
-                if remaining_to_deduct <= 0:
-                    break
-                    
-                if credit.amount <= remaining_to_deduct:
-                    # Use the entire credit
-                    credit.status = 'used'
-                    credit.save()
-                    remaining_to_deduct -= credit.amount
-                else:
-                    # Split the credit
-                    new_amount = credit.amount - remaining_to_deduct
-                    
-                    # Update the original credit
-                    credit.amount = new_amount
-                    credit.save()
-                    
-                    # Create a record of the used portion
-                    CarbonCredit.objects.create(
-                        amount=remaining_to_deduct,
-                        source_trip=trip,
-                        owner_type='employer',
-                        owner_id=employer_profile.id,
-                        timestamp=timezone.now(),
-                        status='used',
-                        expiry_date=credit.expiry_date
-                    )
-                    
-                    remaining_to_deduct = 0
-        
-        approved_count += 1
-    
     if approved_count > 0:
         messages.success(request, f"Successfully approved {approved_count} trips.")
     else:
@@ -652,46 +451,11 @@ def create_transaction(request):
     
     try:
         # Convert amount to decimal
-        credit_amount = float(amount)
+        credit_amount = Decimal(amount)
         
-        # Get the offer
-        offer = get_object_or_404(MarketOffer, pk=offer_id, status='active')
-        
-        # Check if trying to buy from self
-        if offer.seller == employer_profile:
-            messages.error(request, "You cannot buy your own credits")
-            return redirect('employer:trading')
-            
-        # Check if enough credits available
-        if credit_amount > offer.credit_amount:
-            messages.error(request, "Not enough credits available in this offer")
-            return redirect('employer:trading')
-        
-        # Convert to Decimal for database operations
-        credit_amount_decimal = Decimal(str(credit_amount))
-        price_decimal = Decimal(str(offer.price_per_credit))
-        total_price_decimal = credit_amount_decimal * price_decimal
-            
-        # Create the transaction
-        transaction = MarketplaceTransaction.objects.create(
-            offer=offer,
-            seller=offer.seller,
-            buyer=employer_profile,
-            credit_amount=credit_amount_decimal,
-            total_price=total_price_decimal,
-            status='pending',
-            admin_approval_required=True  # Require bank approval for all transactions
-        )
-        
-        # If this purchase uses all remaining credits, mark offer as completed
-        if credit_amount_decimal == offer.credit_amount:
-            offer.status = 'completed'
-            offer.save()
-        # Otherwise, reduce the available credits
-        else:
-            offer.credit_amount -= credit_amount_decimal
-            offer.total_price = offer.credit_amount * offer.price_per_credit
-            offer.save()
+        # Lock the offer, check it and reduce it in one transaction
+        transaction = orderbook.buy_from_offer(employer_profile, offer_id, credit_amount)
+        total_price_decimal = transaction.total_price
         
         messages.success(
             request, 
@@ -700,10 +464,12 @@ def create_transaction(request):
             f"Credits will be added to your account once approved."
         )
         
-    except ValueError:
+    except (InvalidOperation, TypeError):
         messages.error(request, "Invalid amount specified")
     except MarketOffer.DoesNotExist:
         messages.error(request, "The selected offer is no longer available")
+    except orderbook.OrderError as e:
+        messages.error(request, str(e))
     except Exception as e:
         messages.error(request, f"Error processing transaction: {str(e)}")
     
@@ -738,17 +504,6 @@ def create_offer(request):
             messages.error(request, "Price per credit must be positive")
             return redirect('employer:trading')
         
-        # Check if employer has enough credits
-        available_credits = CarbonCredit.objects.filter(
-            owner_type='employer', 
-            owner_id=employer_profile.id,
-            status='active'
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        
-        if credit_amount > available_credits:
-            messages.error(request, f"You don't have enough credits. Available: {available_credits}")
-            return redirect('employer:trading')
-        
         # Calculate total price
         total_price = credit_amount * price_per_credit
         
@@ -760,56 +515,23 @@ def create_offer(request):
         price_per_credit_decimal = Decimal(str(price_per_credit))
         total_price_decimal = Decimal(str(total_price))
         
-        # Create the offer
-        offer = MarketOffer.objects.create(
-            seller=employer_profile,
-            credit_amount=credit_amount_decimal,
-            price_per_credit=price_per_credit_decimal,
-            total_price=total_price_decimal,
-            expiry_date=expiry_date,
-            status='active'
-        )
-        
-        # Reserve (deduct) the carbon credits from the user's account
-        # Find available credits to deduct
-        active_credits = CarbonCredit.objects.filter(
-            owner_type='employer',
-            owner_id=employer_profile.id,
-            status='active'
-        ).order_by('timestamp')  # Use oldest credits first (timestamp instead of created_at)
-        
-        remaining_to_deduct = credit_amount_decimal
-        
-        for credit in active_credits:
-            if remaining_to_deduct <= 0:
-                break
-                
-            if credit.amount <= remaining_to_deduct:
-                # Use the entire credit
-                credit.status = 'used'
-                credit.save()
-                remaining_to_deduct -= credit.amount
-            else:
-                # Split the credit
-                # Use part of it and keep the rest active
-                new_amount = credit.amount - remaining_to_deduct
-                
-                # Update the original credit
-                credit.amount = new_amount
-                credit.save()
-                
-                # Create a record of the used portion
-                CarbonCredit.objects.create(
-                    amount=remaining_to_deduct,
-                    source_trip=credit.source_trip,
-                    owner_type='employer',
-                    owner_id=employer_profile.id,
-                    timestamp=timezone.now(),
-                    status='used',
-                    expiry_date=credit.expiry_date
+        try:
+            with transaction.atomic():
+                # Create the offer
+                offer = MarketOffer.objects.create(
+                    seller=employer_profile,
+                    credit_amount=credit_amount_decimal,
+                    price_per_credit=price_per_credit_decimal,
+                    total_price=total_price_decimal,
+                    expiry_date=expiry_date,
+                    status='active'
                 )
                 
-                remaining_to_deduct = Decimal('0')
+                # Reserve (deduct) the carbon credits from the employer's wallet
+                debit(employer_profile, credit_amount_decimal)
+        except InsufficientCreditsError as e:
+            messages.error(request, f"You don't have enough credits. Available: {e.available}")
+            return redirect('employer:trading')
                 
         messages.success(request, f"Successfully listed {credit_amount} credits for sale at ${price_per_credit} each.")
         return redirect('employer:trading')
@@ -828,13 +550,14 @@ def mark_notification_read(request, notification_id):
         return redirect('employer:trading')
     
     try:
-        notification = TransactionNotification.objects.get(id=notification_id, user=request.user)
+        is_read = not TransactionNotification.objects.values_list('is_read', flat=True).get(
+            id=notification_id, user=request.user
+        )
         
-        # Toggle read status
-        notification.is_read = not notification.is_read
-        notification.save()
+        # Toggle read status (keeps the cached unread count in step)
+        inbox.set_read(request.user, notification_id, is_read=is_read)
         
-        if notification.is_read:
+        if is_read:
             messages.success(request, "Notification marked as read.")
         else:
             messages.success(request, "Notification marked as unread.")
@@ -844,6 +567,18 @@ def mark_notification_read(request, notification_id):
     
     return redirect('employer:trading')
 
+@login_required
+@user_passes_test(lambda u: u.is_employer)
+def mark_all_notifications_read(request):
+    """
+    Mark all of the user's notifications as read.
+    """
+    if request.method == 'POST':
+        marked = inbox.mark_all_read(request.user)
+        messages.success(request, f"{marked} notification{'s' if marked != 1 else ''} marked as read.")
+    
+    return redirect('employer:trading')
+
 @login_required
 @user_passes_test(lambda u: u.is_employer)
 def employee_approval(request, employee_id):
@@ -1065,11 +800,7 @@ def employee_marketplace(request):
     ).order_by('-processed_at')
     
     # Get employer credit balance
-    employer_credits = CarbonCredit.objects.filter(
-        owner_type='employer',
-        owner_id=employer_profile.id,
-        status='active'
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    employer_credits = CreditBalance.get_balance('employer', employer_profile.id)
     
     # Get current market rate
     market_rate = MarketOffer.objects.filter(
@@ -1087,6 +818,16 @@ def employee_marketplace(request):
     
     return render(request, 'employer/employee_marketplace.html', context)
 
+def _lock_pending_offer(offer):
+    """
+    Lock an employee credit offer for the current transaction and check it is still pending.
+    
+    Raises:
+        EmployeeCreditOffer.DoesNotExist: if another request already processed it
+    """
+    if not EmployeeCreditOffer.objects.select_for_update().filter(pk=offer.pk, status='pending').exists():
+        raise EmployeeCreditOffer.DoesNotExist
+
 @login_required
 @user_passes_test(lambda u: u.is_employer)
 def process_employee_offer(request, offer_id):
@@ -1114,191 +855,63 @@ def process_employee_offer(request, offer_id):
         if action == 'approve':
             # For employee selling credits to employer
             if offer.offer_type == 'sell':
-                # Check if employee has enough credits
-                employee_credits = CarbonCredit.objects.filter(
-                    owner_type='employee',
-                    owner_id=employee.id,
-                    status='active'
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-                
-                if employee_credits < credit_amount:
-                    messages.error(request, f"Employee doesn't have enough credits. Required: {credit_amount}, Available: {employee_credits}")
-                    return redirect('employer:employee_marketplace')
-                
-                # Check if employer has enough wallet balance
-                if employer_profile.wallet_balance < total_amount:
-                    messages.error(request, f"Not enough balance in your wallet. Required: ${total_amount}, Available: ${employer_profile.wallet_balance}")
-                    return redirect('employer:employee_marketplace')
-                
-                # Transfer credits from employee to employer
-                remaining_to_transfer = credit_amount
-                employee_active_credits = CarbonCredit.objects.filter(
-                    owner_type='employee',
-                    owner_id=employee.id,
-                    status='active'
-                ).order_by('timestamp')  # Use oldest credits first
-                
-                for credit in employee_active_credits:
-                    if remaining_to_transfer <= 0:
-                        break
-                        
-                    if credit.amount <= remaining_to_transfer:
-                        # Use the entire credit
-                        credit.status = 'used'
-                        credit.save()
-                        
-                        # Create a new credit for the employer
-                        CarbonCredit.objects.create(
-                            amount=credit.amount,
-                            source_trip=credit.source_trip,
-                            owner_type='employer',
-                            owner_id=employer_profile.id,
-                            timestamp=timezone.now(),
-                            status='active',
-                            expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                        )
-                        
-                        remaining_to_transfer -= credit.amount
-                    else:
-                        # Split the credit
-                        new_amount = credit.amount - remaining_to_transfer
+                try:
+                    with transaction.atomic():
+                        # Lock the offer and re-check it so two approvals can't both settle it
+                        _lock_pending_offer(offer)
                         
-                        # Update the original credit
-                        credit.amount = new_amount
-                        credit.save()
+                        # Transfer credits from employee to employer
+                        transfer(employee, employer_profile, credit_amount)
                         
-                        # Create a used credit record for the employee
-                        CarbonCredit.objects.create(
-                            amount=remaining_to_transfer,
-                            source_trip=credit.source_trip,
-                            owner_type='employee',
-                            owner_id=employee.id,
-                            timestamp=timezone.now(),
-                            status='used',
-                            expiry_date=credit.expiry_date
-                        )
+                        # Transfer money from employer's wallet to employee's
+                        pay(employer_profile, employee, total_amount)
                         
-                        # Create a new credit for the employer
-                        CarbonCredit.objects.create(
-                            amount=remaining_to_transfer,
-                            source_trip=credit.source_trip,
-                            owner_type='employer',
-                            owner_id=employer_profile.id,
-                            timestamp=timezone.now(),
-                            status='active',
-                            expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                        )
-                        
-                        remaining_to_transfer = 0
-                
-                # Transfer money to employee's wallet
-                employee.wallet_balance += total_amount
-                employee.save()
-                
-                # Deduct from employer's wallet
-                employer_profile.wallet_balance -= total_amount
-                employer_profile.save()
+                        # Update offer status
+                        offer.status = 'approved'
+                        offer.processed_at = timezone.now()
+                        offer.save()
+                except InsufficientFundsError as e:
+                    messages.error(request, f"Not enough balance in your wallet. Required: ${total_amount}, Available: ${e.available}")
+                    return redirect('employer:employee_marketplace')
+                except InsufficientCreditsError as e:
+                    messages.error(request, f"Employee doesn't have enough credits. Required: {credit_amount}, Available: {e.available}")
+                    return redirect('employer:employee_marketplace')
                 
                 messages.success(request, f"Successfully bought {credit_amount} credits from {employee.user.get_full_name()} for ${total_amount}.")
                 
             # For employee buying credits from employer
             else:
-                # Check if employer has enough credits
-                employer_credits = CarbonCredit.objects.filter(
-                    owner_type='employer',
-                    owner_id=employer_profile.id,
-                    status='active'
-                ).aggregate(Sum('amount'))['amount__sum'] or 0
-                
-                if employer_credits < credit_amount:
-                    messages.error(request, f"You don't have enough credits. Required: {credit_amount}, Available: {employer_credits}")
-                    return redirect('employer:employee_marketplace')
-                
-                # Check if employee has enough wallet balance
-                if employee.wallet_balance < total_amount:
-                    messages.error(request, f"Employee doesn't have enough balance in their wallet. Required: ${total_amount}, Available: ${employee.wallet_balance}")
-                    return redirect('employer:employee_marketplace')
-                
-                # Transfer credits from employer to employee
-                remaining_to_transfer = credit_amount
-                employer_active_credits = CarbonCredit.objects.filter(
-                    owner_type='employer',
-                    owner_id=employer_profile.id,
-                    status='active'
-                ).order_by('timestamp')  # Use oldest credits first
-                
-                for credit in employer_active_credits:
-                    if remaining_to_transfer <= 0:
-                        break
-                        
-                    if credit.amount <= remaining_to_transfer:
-                        # Use the entire credit
-                        credit.status = 'used'
-                        credit.save()
-                        
-                        # Create a new credit for the employee
-                        CarbonCredit.objects.create(
-                            amount=credit.amount,
-                            source_trip=credit.source_trip,
-                            owner_type='employee',
-                            owner_id=employee.id,
-                            timestamp=timezone.now(),
-                            status='active',
-                            expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                        )
+                try:
+                    with transaction.atomic():
+                        # Lock the offer and re-check it so two approvals can't both settle it
+                        _lock_pending_offer(offer)
                         
-                        remaining_to_transfer -= credit.amount
-                    else:
-                        # Split the credit
-                        new_amount = credit.amount - remaining_to_transfer
+                        # Transfer credits from employer to employee
+                        transfer(employer_profile, employee, credit_amount)
                         
-                        # Update the original credit
-                        credit.amount = new_amount
-                        credit.save()
+                        # Transfer money from employee's wallet to employer's
+                        pay(employee, employer_profile, total_amount)
                         
-                        # Create a used credit record for the employer
-                        CarbonCredit.objects.create(
-                            amount=remaining_to_transfer,
-                            source_trip=credit.source_trip,
-                            owner_type='employer',
-                            owner_id=employer_profile.id,
-                            timestamp=timezone.now(),
-                            status='used',
-                            expiry_date=credit.expiry_date
-                        )
-                        
-                        # Create a new credit for the employee
-                        CarbonCredit.objects.create(
-                            amount=remaining_to_transfer,
-                            source_trip=credit.source_trip,
-                            owner_type='employee',
-                            owner_id=employee.id,
-                            timestamp=timezone.now(),
-                            status='active',
-                            expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-                        )
-                        
-                        remaining_to_transfer = 0
-                
-                # Transfer money from employee's wallet to employer's
-                employee.wallet_balance -= total_amount
-                employee.save()
-                
-                # Add to employer's wallet
-                employer_profile.wallet_balance += total_amount
-                employer_profile.save()
+                        # Update offer status
+                        offer.status = 'approved'
+                        offer.processed_at = timezone.now()
+                        offer.save()
+                except InsufficientFundsError as e:
+                    messages.error(request, f"Employee doesn't have enough balance in their wallet. Required: ${total_amount}, Available: ${e.available}")
+                    return redirect('employer:employee_marketplace')
+                except InsufficientCreditsError as e:
+                    messages.error(request, f"You don't have enough credits. Required: {credit_amount}, Available: {e.available}")
+                    return redirect('employer:employee_marketplace')
                 
                 messages.success(request, f"Successfully sold {credit_amount} credits to {employee.user.get_full_name()} for ${total_amount}.")
             
-            # Update offer status
-            offer.status = 'approved'
-            offer.processed_at = timezone.now()
-            offer.save()
-            
         elif action == 'reject':
-            offer.status = 'rejected'
-            offer.processed_at = timezone.now()
-            offer.save()
+            # Only reject the offer if no one processed it in the meantime
+            if not EmployeeCreditOffer.objects.filter(pk=offer.pk, status='pending').update(
+                status='rejected',
+                processed_at=timezone.now()
+            ):
+                raise EmployeeCreditOffer.DoesNotExist
             
             messages.success(request, f"Offer from {employee.user.get_full_name()} rejected.")
             
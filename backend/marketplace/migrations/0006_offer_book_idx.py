@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0005_remove_marketplacetransaction_approved_by_and_more'),
+        ('users', '0007_employerprofile_phone_employerprofile_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketoffer',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['price_per_credit', 'created_at', 'id'], name='offer_book_idx'),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.utils import timezone
-from users.models import CustomUser, EmployerProfile, EmployeeProfile
+from users.models import EmployerProfile, EmployeeProfile
 
 
 class MarketOffer(models.Model):
@@ -26,6 +26,16 @@ class MarketOffer(models.Model):
     expiry_date = models.DateTimeField()
     status = models.CharField(max_length=10, choices=OFFER_STATUS, default='active')
     
+    class Meta:
+        indexes = [
+            # Order book: active offers in price-time priority
+            models.Index(
+                fields=['price_per_credit', 'created_at', 'id'],
+                name='offer_book_idx',
+                condition=models.Q(status='active')
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.credit_amount} credits at ${self.price_per_credit}/credit by {self.seller.company_name}"
 
@@ -97,6 +107,12 @@ class TransactionNotification(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Inbox and unread count per user, newest first
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_inbox_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.notification_type} notification for {self.user.email}"
 
@@ -145,37 +161,13 @@ from django.dispatch import receiver
 
 @receiver(post_save, sender=MarketplaceTransaction)
 def create_transaction_notifications(sender, instance, created, **kwargs):
-    """Create notifications when transaction status changes."""
+    """Queue notifications when a transaction is created or its status changes (see marketplace.tasks)."""
+    from .tasks import enqueue_transaction_notifications
+
     if created:
-        # New transaction created
-        # Notify seller about new pending transaction
-        TransactionNotification.objects.create(
-            transaction=instance,
-            user=instance.seller.user,
-            message=f"New transaction #{instance.id}: {instance.buyer.company_name} wants to buy {instance.credit_amount} credits for ${instance.total_price}."
-        )
-        
-        # Notify bank admins about pending approval
-        bank_admins = CustomUser.objects.filter(is_bank_admin=True)
-        for admin in bank_admins:
-            TransactionNotification.objects.create(
-                transaction=instance,
-                user=admin,
-                message=f"Transaction #{instance.id} requires your approval: {instance.buyer.company_name} buying {instance.credit_amount} credits from {instance.seller.company_name}."
-            )
-    
-    elif not created and instance.status in ['completed', 'rejected', 'cancelled']:
-        # Status changed to completed, rejected or cancelled
-        # Notify buyer
-        TransactionNotification.objects.create(
-            transaction=instance,
-            user=instance.buyer.user,
-            message=f"Transaction #{instance.id} has been {instance.status}. {instance.credit_amount} credits purchase from {instance.seller.company_name} for ${instance.total_price}."
-        )
-        
-        # Notify seller
-        TransactionNotification.objects.create(
-            transaction=instance,
-            user=instance.seller.user,
-            message=f"Transaction #{instance.id} has been {instance.status}. Sale of {instance.credit_amount} credits to {instance.buyer.company_name} for ${instance.total_price}."
-        )
+        # Seller and bank admins hear about the new pending transaction
+        enqueue_transaction_notifications(instance.pk)
+    
+    elif instance.status in ['completed', 'rejected', 'cancelled']:
+        # Buyer and seller hear about the outcome
+        enqueue_transaction_notifications(instance.pk, instance.status)
@@ -0,0 +1,150 @@
+"""
+Notification inbox for marketplace users.
+
+Each user's unread count lives in the shared cache (settings.SHARED_CACHE):
+it is counted once, then incremented as notifications are written
+(marketplace.tasks) and decremented as they are read, so showing the badge
+costs no query. Without a shared cache the count is queried on every read,
+as a per-process counter would miss other workers' changes. Every
+change to is_read goes through the helpers below, which flip only rows
+whose state actually changes and adjust the counter by the number of rows
+updated. The inbox itself is paged newest first with a keyset on
+(created_at, id) (see core.pagination), served by the
+(user, is_read, created_at) index.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from core.pagination import keyset_page
+from core.utils.versioning import shared_cache
+from .models import TransactionNotification
+
+# Default lifetime of a cached unread count, in seconds; bounds any drift
+DEFAULT_UNREAD_CACHE_TTL = 300
+
+# Inbox order (newest first) and default page size
+INBOX_ORDERING = ('-created_at', '-id')
+DEFAULT_PAGE_SIZE = 20
+
+UNREAD_COUNT_KEY = 'marketplace_notifications:{user_id}:unread'
+
+
+def _unread_ttl():
+    return getattr(settings, 'NOTIFICATION_UNREAD_CACHE_TTL', DEFAULT_UNREAD_CACHE_TTL)
+
+
+def _adjust_unread(user_id, delta):
+    """Shift a cached unread count; a missing count is left to be recounted on next read."""
+    cache = shared_cache()
+    if not delta or cache is None:
+        return
+    key = UNREAD_COUNT_KEY.format(user_id=user_id)
+    try:
+        if delta > 0:
+            cache.incr(key, delta)
+        else:
+            cache.decr(key, -delta)
+    except ValueError:
+        pass
+
+
+def adjust_unread_counts(deltas):
+    """
+    Adjust cached unread counts once the current transaction commits.
+
+    Args:
+        deltas: Dict mapping user id to the change in their unread count
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: [_adjust_unread(user_id, delta) for user_id, delta in deltas.items()])
+
+
+def record_new_notifications(notifications):
+    """Count freshly written unread notifications towards their users' badges."""
+    adjust_unread_counts(Counter(
+        notification.user_id for notification in notifications if not notification.is_read
+    ))
+
+
+def unread_count(user_id):
+    """
+    Number of unread notifications for a user, from the shared cache when possible.
+
+    Args:
+        user_id: Id of the user
+
+    Returns:
+        Non-negative int
+    """
+    cache = shared_cache()
+    if cache is None:
+        return TransactionNotification.objects.filter(user_id=user_id, is_read=False).count()
+
+    key = UNREAD_COUNT_KEY.format(user_id=user_id)
+    count = cache.get(key)
+    if count is None:
+        count = TransactionNotification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.add(key, count, _unread_ttl())
+    return max(count, 0)
+
+
+def set_read(user, notification_id, is_read=True):
+    """
+    Mark one of a user's notifications read or unread.
+
+    Returns:
+        True if its state changed, False if it already had it
+
+    Raises:
+        TransactionNotification.DoesNotExist: if the user has no such notification
+    """
+    changed = TransactionNotification.objects.filter(
+        pk=notification_id, user=user, is_read=not is_read
+    ).update(is_read=is_read)
+    if not changed and not TransactionNotification.objects.filter(pk=notification_id, user=user).exists():
+        raise TransactionNotification.DoesNotExist("Notification not found.")
+    adjust_unread_counts({user.id: changed if not is_read else -changed})
+    return bool(changed)
+
+
+def mark_all_read(user):
+    """
+    Mark every unread notification of a user read with one UPDATE.
+
+    Returns:
+        Number of notifications marked read
+    """
+    marked = TransactionNotification.objects.filter(user=user, is_read=False).update(is_read=True)
+    adjust_unread_counts({user.id: -marked})
+    return marked
+
+
+def inbox_queryset(user, unread_only=False):
+    """A user's notifications, optionally only the unread ones (unordered; page with INBOX_ORDERING)."""
+    notifications = TransactionNotification.objects.filter(user=user)
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+    return notifications
+
+
+def inbox_page(user, cursor=None, limit=DEFAULT_PAGE_SIZE, unread_only=False):
+    """
+    One page of a user's notifications, newest first.
+
+    Args:
+        user: User whose inbox to read
+        cursor: Optional cursor from a previous page's next_cursor
+        limit: Page size (capped at core.pagination.MAX_PAGE_SIZE)
+        unread_only: Only include unread notifications
+
+    Returns:
+        (notifications, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        core.pagination.InvalidCursor: if cursor is malformed
+    """
+    return keyset_page(inbox_queryset(user, unread_only), INBOX_ORDERING, cursor=cursor, page_size=limit)
@@ -0,0 +1,348 @@
+"""
+Order book and matching engine for marketplace offers.
+
+Active, unexpired MarketOffers form the ask side of the book in
+price-time priority: cheapest first, oldest first within a price. A buy
+order walks the book from the best price up to an optional limit and
+fills across as many offers as it needs. Offers are locked
+(select_for_update) a batch at a time in book order, so concurrent buyers
+queue on the same rows instead of both selling the same credits, and each
+decrement is a conditional UPDATE that can't take more credits than the
+offer holds. The whole order commits or rolls back as one transaction.
+
+Settling works the same way: a transaction only leaves 'pending' through
+a conditional UPDATE, and credits go back to (or are taken off) an offer
+with F() arithmetic, so a double click or two admins acting at once can't
+reject twice or overwrite a concurrent claim with a stale offer row.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+from core.reports import invalidate_report_snapshots
+from .models import MarketOffer, MarketplaceTransaction
+from .tasks import enqueue_transaction_notifications
+
+# Offers locked per round trip while sweeping the book
+MATCH_BATCH_SIZE = 50
+
+# Ordering that defines priority in the book
+BOOK_ORDER = ('price_per_credit', 'created_at', 'id')
+
+CENT = Decimal('0.01')
+
+
+class OrderError(Exception):
+    """Raised when a buy order can't be placed."""
+
+
+class InsufficientLiquidityError(OrderError):
+    """Raised when the book can't fill an all-or-nothing order within its limit price."""
+
+    def __init__(self, requested, available):
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Only {available} of {requested} credits available at the requested price")
+
+
+class Fill:
+    """One offer's contribution to a buy order."""
+
+    def __init__(self, offer, credit_amount, price_per_credit):
+        self.offer = offer
+        self.credit_amount = credit_amount
+        self.price_per_credit = price_per_credit
+
+    @property
+    def total_price(self):
+        return (self.credit_amount * self.price_per_credit).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def book_queryset(exclude_seller=None, limit_price=None, now=None):
+    """
+    Active, unexpired offers in book order.
+
+    Args:
+        exclude_seller: Optional EmployerProfile whose own offers are skipped
+        limit_price: Optional highest price per credit to include
+        now: Optional time to check expiry against (defaults to now)
+    """
+    offers = MarketOffer.objects.filter(
+        status='active',
+        credit_amount__gt=0,
+        expiry_date__gt=now or timezone.now()
+    )
+    if exclude_seller is not None:
+        offers = offers.exclude(seller=exclude_seller)
+    if limit_price is not None:
+        offers = offers.filter(price_per_credit__lte=limit_price)
+    return offers.order_by(*BOOK_ORDER)
+
+
+def book_depth(levels=None, exclude_seller=None):
+    """
+    Aggregate the book by price level.
+
+    Args:
+        levels: Optional maximum number of price levels to return
+        exclude_seller: Optional EmployerProfile whose own offers are skipped
+
+    Returns:
+        List of dicts with price_per_credit, credit_amount and offer_count, best price first
+    """
+    depth = book_queryset(exclude_seller=exclude_seller).order_by('price_per_credit').values(
+        'price_per_credit'
+    ).annotate(credit_amount=Sum('credit_amount'), offer_count=Count('id'))
+    return list(depth[:levels] if levels else depth)
+
+
+def match(offers, amount):
+    """
+    Plan fills for amount against offers already in book order.
+
+    Returns:
+        List of Fill, cheapest first; their credit_amounts sum to at most amount
+    """
+    remaining = Decimal(str(amount))
+    fills = []
+    for offer in offers:
+        if remaining <= 0:
+            break
+        take = min(offer.credit_amount, remaining)
+        fills.append(Fill(offer=offer, credit_amount=take, price_per_credit=offer.price_per_credit))
+        remaining -= take
+    return fills
+
+
+def quote(amount, limit_price=None, buyer=None):
+    """
+    Price a buy order against the current book without locking or writing anything.
+
+    Returns:
+        Dict with the fillable credit_amount, total_price, average_price and the fills
+    """
+    fills = match(book_queryset(exclude_seller=buyer, limit_price=limit_price).iterator(), amount)
+    filled = sum((fill.credit_amount for fill in fills), Decimal('0'))
+    total = sum((fill.total_price for fill in fills), Decimal('0'))
+    return {
+        'credit_amount': filled,
+        'total_price': total,
+        'average_price': (total / filled).quantize(CENT) if filled else None,
+        'fills': fills,
+    }
+
+
+def _after(offer):
+    """Filter for offers strictly after offer in book order."""
+    return (
+        Q(price_per_credit__gt=offer.price_per_credit)
+        | Q(price_per_credit=offer.price_per_credit, created_at__gt=offer.created_at)
+        | Q(price_per_credit=offer.price_per_credit, created_at=offer.created_at, id__gt=offer.id)
+    )
+
+
+def buy(buyer, amount, limit_price=None, allow_partial=False):
+    """
+    Buy credits at the best available prices, filling across offers.
+
+    Offers are locked in book order a batch at a time until the order is
+    filled or the limit price is reached. Each filled offer produces one
+    pending MarketplaceTransaction; each offer is reduced, and marked
+    completed when emptied, by a conditional UPDATE (see _claim).
+
+    Args:
+        buyer: EmployerProfile placing the order (its own offers are skipped)
+        amount: Decimal number of credits to buy
+        limit_price: Optional highest price per credit the buyer accepts
+        allow_partial: Fill what is available instead of failing when the book is too thin
+
+    Returns:
+        List of created MarketplaceTransactions, cheapest first (empty if nothing matched)
+
+    Raises:
+        OrderError: for a non-positive amount
+        InsufficientLiquidityError: if not allow_partial and the book can't fill the order; nothing is written
+    """
+    amount = Decimal(str(amount))
+    if amount <= 0:
+        raise OrderError("Credit amount must be positive")
+
+    now = timezone.now()
+    with transaction.atomic():
+        offers = book_queryset(exclude_seller=buyer, limit_price=limit_price, now=now).select_for_update()
+        fills = []
+        remaining = amount
+        last = None
+        while remaining > 0:
+            batch = list((offers.filter(_after(last)) if last else offers)[:MATCH_BATCH_SIZE])
+            if not batch:
+                break
+            batch_fills = match(batch, remaining)
+            fills += batch_fills
+            remaining -= sum((fill.credit_amount for fill in batch_fills), Decimal('0'))
+            last = batch[-1]
+
+        if remaining > 0 and not allow_partial:
+            raise InsufficientLiquidityError(amount, amount - remaining)
+
+        return _execute(buyer, fills)
+
+
+def buy_from_offer(buyer, offer_id, amount):
+    """
+    Buy credits from one specific offer, locking it for the check and the decrement.
+
+    Returns:
+        The created MarketplaceTransaction
+
+    Raises:
+        MarketOffer.DoesNotExist: if the offer doesn't exist
+        OrderError: if the offer isn't active, is the buyer's own, or holds fewer credits than amount
+    """
+    amount = Decimal(str(amount))
+    if amount <= 0:
+        raise OrderError("Credit amount must be positive")
+
+    with transaction.atomic():
+        offer = MarketOffer.objects.select_for_update().get(pk=offer_id)
+        if offer.status != 'active' or offer.expiry_date <= timezone.now():
+            raise OrderError("This offer is no longer active")
+        if buyer is not None and offer.seller_id == buyer.id:
+            raise OrderError("You cannot buy your own credits")
+        if amount > offer.credit_amount:
+            raise OrderError("Not enough credits available in this offer")
+
+        return _execute(buyer, [Fill(offer=offer, credit_amount=amount, price_per_credit=offer.price_per_credit)])[0]
+
+
+def _claim(fill):
+    """
+    Take fill.credit_amount off its offer with one conditional UPDATE.
+
+    The WHERE clause re-checks the offer is active and still holds enough
+    credits, so even without row locks (e.g. SQLite) two buyers can never
+    both take the same credits: the second update matches no row.
+
+    Returns:
+        True if the credits were taken
+    """
+    amount = fill.credit_amount
+    claimed = MarketOffer.objects.filter(
+        pk=fill.offer.pk,
+        status='active',
+        credit_amount__gte=amount
+    ).update(
+        credit_amount=F('credit_amount') - amount,
+        total_price=(F('credit_amount') - amount) * F('price_per_credit'),
+        status=Case(When(credit_amount=amount, then=Value('completed')), default=F('status'))
+    )
+    if claimed:
+        fill.offer.credit_amount -= amount
+        fill.offer.total_price = (fill.offer.credit_amount * fill.offer.price_per_credit).quantize(
+            CENT, rounding=ROUND_HALF_UP
+        )
+        if fill.offer.credit_amount <= 0:
+            fill.offer.status = 'completed'
+    return bool(claimed)
+
+
+def _execute(buyer, fills):
+    """
+    Record the fills of a locked order: claim each offer's credits, then create its transaction.
+
+    Raises:
+        OrderError: if an offer no longer holds the credits planned for it (rolls back the order)
+    """
+    created = []
+    for fill in fills:
+        if not _claim(fill):
+            raise OrderError("Not enough credits available in this offer")
+        created.append(MarketplaceTransaction.objects.create(
+            offer=fill.offer,
+            seller_id=fill.offer.seller_id,
+            buyer=buyer,
+            credit_amount=fill.credit_amount,
+            total_price=fill.total_price,
+            status='pending'
+        ))
+    return created
+
+
+def settle(marketplace_transaction, status, **fields):
+    """
+    Move a pending transaction to status with one conditional UPDATE.
+
+    Queryset updates skip post_save, so the outcome notifications and the
+    report snapshot invalidation that save() would trigger are done here.
+
+    Args:
+        marketplace_transaction: MarketplaceTransaction to settle; updated in place on success
+        status: New status
+        **fields: Other fields to set with it (approved_by, completed_at, ...)
+
+    Returns:
+        True if the transaction was still pending and is now settled
+    """
+    settled = MarketplaceTransaction.objects.filter(
+        pk=marketplace_transaction.pk,
+        status='pending'
+    ).update(status=status, **fields)
+    if not settled:
+        return False
+    marketplace_transaction.status = status
+    for name, value in fields.items():
+        setattr(marketplace_transaction, name, value)
+    if status in ('completed', 'rejected', 'cancelled'):
+        enqueue_transaction_notifications(marketplace_transaction.pk, status)
+    invalidate_report_snapshots()
+    return True
+
+
+def reject(marketplace_transaction):
+    """
+    Reject a pending transaction and return its credits to the offer.
+
+    The credits go back only if this call did the rejecting, and only to an
+    offer that is still active or completed (emptied); a completed offer is
+    reactivated. Cancelled and expired offers keep what they have.
+
+    Returns:
+        True if the transaction was rejected, False if it was no longer pending
+    """
+    with transaction.atomic():
+        if not settle(marketplace_transaction, 'rejected'):
+            return False
+        amount = marketplace_transaction.credit_amount
+        MarketOffer.objects.filter(
+            pk=marketplace_transaction.offer_id,
+            status__in=('active', 'completed')
+        ).update(
+            credit_amount=F('credit_amount') + amount,
+            total_price=(F('credit_amount') + amount) * F('price_per_credit'),
+            status='active'
+        )
+    return True
+
+
+def complete_offer_if_empty(offer_id):
+    """Mark an active offer completed once every credit has been claimed."""
+    return bool(MarketOffer.objects.filter(pk=offer_id, status='active', credit_amount__lte=0).update(
+        status='completed'
+    ))
+
+
+def cancel_offer(offer):
+    """
+    Cancel an active offer and every transaction still pending against it.
+
+    Returns:
+        True if the offer was active and is now cancelled
+    """
+    with transaction.atomic():
+        if not MarketOffer.objects.filter(pk=offer.pk, status='active').update(status='cancelled'):
+            return False
+        offer.status = 'cancelled'
+        for pending in MarketplaceTransaction.objects.filter(offer_id=offer.pk, status='pending').only('pk'):
+            settle(pending, 'cancelled')
+    return True
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import MarketOffer, MarketplaceTransaction
+from .models import MarketOffer, MarketplaceTransaction, TransactionNotification
 from users.models import EmployerProfile
 
 
@@ -88,6 +88,36 @@ class TransactionCreateSerializer(serializers.Serializer):
         return data
 
 
+class MarketOrderSerializer(serializers.Serializer):
+    credit_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    limit_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    allow_partial = serializers.BooleanField(default=False)
+    
+    def validate(self, data):
+        # Ensure credit amount is positive
+        if data.get('credit_amount', 0) <= 0:
+            raise serializers.ValidationError({"credit_amount": "Credit amount must be positive"})
+        
+        # Ensure limit price is positive
+        if data.get('limit_price') is not None and data['limit_price'] <= 0:
+            raise serializers.ValidationError({"limit_price": "Limit price must be positive"})
+            
+        return data
+
+
+class OrderBookLevelSerializer(serializers.Serializer):
+    price_per_credit = serializers.DecimalField(max_digits=10, decimal_places=2)
+    credit_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    offer_count = serializers.IntegerField()
+
+
+class TransactionNotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransactionNotification
+        fields = ['id', 'transaction', 'notification_type', 'message', 'created_at', 'is_read']
+        read_only_fields = fields
+
+
 class TransactionApprovalSerializer(serializers.Serializer):
     approved = serializers.BooleanField()
     rejection_reason = serializers.CharField(required=False, allow_blank=True)
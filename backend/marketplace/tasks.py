@@ -0,0 +1,113 @@
+"""
+Background marketplace notifications.
+
+Creating or settling a transaction only queues its notifications. Once the
+request's transaction commits, the in-process worker pool loads the
+transaction with its buyer and seller in one query and writes every
+notification (seller, buyer, each bank admin) with a single bulk_create,
+bumping each recipient's cached unread count, so the request never pays
+for the fan-out. With
+MARKETPLACE_NOTIFICATIONS_ASYNC disabled they are still written on commit,
+but in the committing thread.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from core.utils.workers import LazyExecutor
+from users.models import CustomUser
+from .models import MarketplaceTransaction, TransactionNotification
+from .notifications import record_new_notifications
+
+logger = logging.getLogger(__name__)
+
+# Notifications written per INSERT
+NOTIFICATION_BATCH_SIZE = 500
+
+_executor = LazyExecutor('MARKETPLACE_NOTIFICATION_WORKERS', 1, 'marketplace-notify')
+
+
+def enqueue_transaction_notifications(transaction_id, status=None):
+    """
+    Queue the notifications for a transaction once the current transaction commits.
+
+    Args:
+        transaction_id: MarketplaceTransaction to notify about
+        status: None for a new transaction, otherwise the status it was settled with
+    """
+    if getattr(settings, 'MARKETPLACE_NOTIFICATIONS_ASYNC', True):
+        transaction.on_commit(lambda: _executor.submit(_run_notifications, transaction_id, status))
+    else:
+        transaction.on_commit(lambda: send_transaction_notifications(transaction_id, status))
+
+
+def _run_notifications(transaction_id, status):
+    """Worker-thread entry point: own database connection, errors logged not raised."""
+    close_old_connections()
+    try:
+        send_transaction_notifications(transaction_id, status)
+    except Exception:
+        logger.exception(f"Notifications for transaction {transaction_id} failed")
+    finally:
+        close_old_connections()
+
+
+def send_transaction_notifications(transaction_id, status=None):
+    """
+    Write the notifications for a transaction in one bulk INSERT.
+
+    A new transaction notifies its seller and every bank admin; a settled
+    one (completed, rejected or cancelled) notifies its buyer and seller.
+
+    Args:
+        transaction_id: MarketplaceTransaction to notify about
+        status: None for a new transaction, otherwise the status it was settled with
+
+    Returns:
+        Number of notifications created
+    """
+    instance = MarketplaceTransaction.objects.select_related(
+        'buyer__user', 'seller__user'
+    ).filter(pk=transaction_id).first()
+    if instance is None:
+        return 0
+    buyer, seller = instance.buyer, instance.seller
+
+    if status is None:
+        notifications = [TransactionNotification(
+            transaction=instance,
+            user=seller.user,
+            notification_type='sale',
+            message=f"New transaction #{instance.id}: {buyer.company_name} wants to buy {instance.credit_amount} credits for ${instance.total_price}."
+        )]
+        admin_message = f"Transaction #{instance.id} requires your approval: {buyer.company_name} buying {instance.credit_amount} credits from {seller.company_name}."
+        notifications += [
+            TransactionNotification(
+                transaction=instance,
+                user_id=admin_id,
+                notification_type='purchase',
+                message=admin_message
+            )
+            for admin_id in CustomUser.objects.filter(is_bank_admin=True).values_list('id', flat=True)
+        ]
+    else:
+        notifications = [
+            TransactionNotification(
+                transaction=instance,
+                user=buyer.user,
+                notification_type='status_change',
+                message=f"Transaction #{instance.id} has been {status}. {instance.credit_amount} credits purchase from {seller.company_name} for ${instance.total_price}."
+            ),
+            TransactionNotification(
+                transaction=instance,
+                user=seller.user,
+                notification_type='status_change',
+                message=f"Transaction #{instance.id} has been {status}. Sale of {instance.credit_amount} credits to {buyer.company_name} for ${instance.total_price}."
+            ),
+        ]
+
+    TransactionNotification.objects.bulk_create(notifications, batch_size=NOTIFICATION_BATCH_SIZE)
+    record_new_notifications(notifications)
+    return len(notifications)
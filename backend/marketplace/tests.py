@@ -1,3 +1,437 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.models import EmployerProfile
+from .models import MarketOffer, MarketplaceTransaction, TransactionNotification
+from .tasks import send_transaction_notifications
+from . import notifications, orderbook
+
+User = get_user_model()
+
+
+class MarketplaceTestMixin:
+    """Shared seller/buyer setup for marketplace tests."""
+
+    def setUp(self):
+        self.seller = self.make_employer('seller')
+        self.other_seller = self.make_employer('other_seller')
+        self.buyer = self.make_employer('buyer')
+
+    def make_employer(self, username):
+        user = User.objects.create_user(
+            username=username,
+            email=f'{username}@test.com',
+            password='password123',
+            is_employer=True
+        )
+        return EmployerProfile.objects.create(user=user, company_name=f'{username} Inc')
+
+    def make_offer(self, seller, credit_amount, price_per_credit, minutes_ago=0, **kwargs):
+        credit_amount = Decimal(credit_amount)
+        price_per_credit = Decimal(price_per_credit)
+        fields = {
+            'seller': seller,
+            'credit_amount': credit_amount,
+            'price_per_credit': price_per_credit,
+            'total_price': credit_amount * price_per_credit,
+            'created_at': timezone.now() - timedelta(minutes=minutes_ago),
+            'expiry_date': timezone.now() + timedelta(days=30),
+            'status': 'active',
+        }
+        fields.update(kwargs)
+        return MarketOffer.objects.create(**fields)
+
+
+class OrderBookTestCase(MarketplaceTestMixin, TestCase):
+    """Price-time matching across offers."""
+
+    def test_buy_fills_best_price_then_oldest_first(self):
+        newer_cheap = self.make_offer(self.seller, '10', '5.00', minutes_ago=1)
+        older_cheap = self.make_offer(self.other_seller, '10', '5.00', minutes_ago=10)
+        dear = self.make_offer(self.seller, '50', '7.00')
+        too_dear = self.make_offer(self.other_seller, '50', '9.00')
+
+        transactions = orderbook.buy(self.buyer, Decimal('25'), limit_price=Decimal('8.00'))
+
+        self.assertEqual([t.offer_id for t in transactions], [older_cheap.id, newer_cheap.id, dear.id])
+        self.assertEqual([t.credit_amount for t in transactions], [Decimal('10'), Decimal('10'), Decimal('5')])
+        self.assertEqual(sum(t.total_price for t in transactions), Decimal('135.00'))
+        self.assertTrue(all(t.status == 'pending' and t.buyer_id == self.buyer.id for t in transactions))
+
+        older_cheap.refresh_from_db()
+        dear.refresh_from_db()
+        too_dear.refresh_from_db()
+        self.assertEqual(older_cheap.status, 'completed')
+        self.assertEqual(older_cheap.credit_amount, 0)
+        self.assertEqual(dear.credit_amount, Decimal('45'))
+        self.assertEqual(dear.total_price, Decimal('315.00'))
+        self.assertEqual(too_dear.credit_amount, Decimal('50'))
+
+    def test_thin_book_writes_nothing_unless_partial_allowed(self):
+        offer = self.make_offer(self.seller, '10', '5.00')
+        self.make_offer(self.other_seller, '10', '9.00')
+
+        with self.assertRaises(orderbook.InsufficientLiquidityError) as raised:
+            orderbook.buy(self.buyer, Decimal('15'), limit_price=Decimal('6.00'))
+        self.assertEqual(raised.exception.available, Decimal('10'))
+        self.assertFalse(MarketplaceTransaction.objects.exists())
+        offer.refresh_from_db()
+        self.assertEqual(offer.credit_amount, Decimal('10'))
+
+        transactions = orderbook.buy(self.buyer, Decimal('15'), limit_price=Decimal('6.00'), allow_partial=True)
+        self.assertEqual([t.credit_amount for t in transactions], [Decimal('10')])
+
+    def test_buy_skips_own_expired_and_inactive_offers(self):
+        self.make_offer(self.buyer, '10', '1.00')
+        self.make_offer(self.seller, '10', '2.00', expiry_date=timezone.now() - timedelta(days=1))
+        self.make_offer(self.seller, '10', '3.00', status='cancelled')
+        offer = self.make_offer(self.other_seller, '10', '4.00')
+
+        transactions = orderbook.buy(self.buyer, Decimal('5'))
+
+        self.assertEqual([t.offer_id for t in transactions], [offer.id])
+
+    def test_buy_walks_the_book_in_batches(self):
+        for minutes_ago in range(orderbook.MATCH_BATCH_SIZE + 5):
+            self.make_offer(self.seller, '1', '2.00', minutes_ago=minutes_ago)
+
+        transactions = orderbook.buy(self.buyer, Decimal(orderbook.MATCH_BATCH_SIZE + 3))
+
+        self.assertEqual(len(transactions), orderbook.MATCH_BATCH_SIZE + 3)
+        self.assertEqual(MarketOffer.objects.filter(status='active').count(), 2)
+
+    def test_buy_from_offer_checks_the_locked_offer(self):
+        offer = self.make_offer(self.seller, '10', '5.00')
+
+        with self.assertRaisesMessage(orderbook.OrderError, "Not enough credits available in this offer"):
+            orderbook.buy_from_offer(self.buyer, offer.id, Decimal('11'))
+        with self.assertRaisesMessage(orderbook.OrderError, "You cannot buy your own credits"):
+            orderbook.buy_from_offer(self.seller, offer.id, Decimal('1'))
+
+        transaction = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('10'))
+        self.assertEqual(transaction.total_price, Decimal('50.00'))
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, 'completed')
+
+        with self.assertRaisesMessage(orderbook.OrderError, "This offer is no longer active"):
+            orderbook.buy_from_offer(self.buyer, offer.id, Decimal('1'))
+
+    def test_order_book_and_market_order_endpoints(self):
+        self.make_offer(self.seller, '10', '5.00')
+        self.make_offer(self.other_seller, '5', '5.00')
+        self.make_offer(self.seller, '20', '6.00')
+        client = APIClient()
+        client.force_authenticate(self.buyer.user)
+
+        response = client.get(reverse('marketplace:order_book'), {'levels': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['best_price']), Decimal('5.00'))
+        self.assertEqual(len(response.data['levels']), 1)
+        self.assertEqual(Decimal(response.data['levels'][0]['credit_amount']), Decimal('15'))
+        self.assertEqual(response.data['levels'][0]['offer_count'], 2)
+
+        response = client.post(
+            reverse('marketplace:market_order'),
+            {'credit_amount': '20', 'limit_price': '6.00'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], Decimal('105.00'))
+        self.assertEqual(len(response.data['transactions']), 3)
+
+        response = client.post(
+            reverse('marketplace:market_order'),
+            {'credit_amount': '100', 'limit_price': '6.00'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Decimal(response.data['available']), Decimal('15'))
+
+
+@override_settings(MARKETPLACE_NOTIFICATIONS_ASYNC=False)
+class ConcurrentPurchaseTestCase(MarketplaceTestMixin, TransactionTestCase):
+    """Hundreds of buyers racing for one offer."""
+
+    BUYERS = 8
+    PURCHASES = 300
+
+    def purchase(self, buyer, offer_id):
+        """Buy one credit, retrying while the database is busy; returns True if a purchase went through."""
+        try:
+            for attempt in range(100):
+                try:
+                    orderbook.buy_from_offer(buyer, offer_id, Decimal('1'))
+                    return True
+                except orderbook.OrderError:
+                    return False
+                except OperationalError:
+                    # Table locked in the in-memory test database; retry like a client would
+                    time.sleep(0.005 * (attempt + 1))
+            raise AssertionError("purchase never got the database")
+        finally:
+            connection.close()
+
+    def test_concurrent_purchases_never_oversell(self):
+        offer = self.make_offer(self.seller, '50', '2.00')
+        buyers = [self.make_employer(f'buyer{index}') for index in range(self.BUYERS)]
+
+        with ThreadPoolExecutor(max_workers=self.BUYERS) as pool:
+            sold = list(pool.map(
+                lambda index: self.purchase(buyers[index % self.BUYERS], offer.id),
+                range(self.PURCHASES)
+            ))
+
+        offer.refresh_from_db()
+        transactions = MarketplaceTransaction.objects.filter(offer=offer)
+        self.assertLessEqual(sold.count(True), 50)
+        self.assertEqual(transactions.count(), 50)
+        self.assertEqual(transactions.aggregate(total=Sum('credit_amount'))['total'], Decimal('50'))
+        self.assertEqual(offer.credit_amount, 0)
+        self.assertEqual(offer.status, 'completed')
+
+    def test_stale_offer_read_cannot_oversell(self):
+        offer = self.make_offer(self.seller, '5', '2.00')
+        stale = MarketOffer.objects.get(pk=offer.pk)
+        orderbook.buy_from_offer(self.buyer, offer.id, Decimal('4'))
+
+        # A buyer still holding the old row can't take more than what is left
+        with self.assertRaises(orderbook.OrderError):
+            orderbook._execute(self.buyer, [orderbook.Fill(stale, Decimal('3'), stale.price_per_credit)])
+
+        offer.refresh_from_db()
+        self.assertEqual(offer.credit_amount, Decimal('1'))
+        self.assertEqual(MarketplaceTransaction.objects.count(), 1)
+
+        client = APIClient()
+        client.force_authenticate(self.buyer.user)
+        response = client.post(
+            reverse('marketplace:transaction_list'),
+            {'offer': offer.id, 'credit_amount': '2'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "Not enough credits available in this offer")
+
+
+@override_settings(MARKETPLACE_NOTIFICATIONS_ASYNC=False)
+class SettlementTestCase(MarketplaceTestMixin, TestCase):
+    """Rejecting, approving and cancelling with conditional updates."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller.user)
+
+    def test_double_reject_restores_credits_once(self):
+        offer = self.make_offer(self.seller, '5', '2.00')
+        transaction = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('5'))
+        stale = MarketplaceTransaction.objects.get(pk=transaction.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('marketplace:transaction_reject', args=[transaction.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'rejected')
+        self.assertTrue(TransactionNotification.objects.filter(
+            transaction=transaction, notification_type='status_change'
+        ).exists())
+
+        # A second reject still holding the pending row changes nothing
+        self.assertFalse(orderbook.reject(stale))
+        response = self.client.post(reverse('marketplace:transaction_reject', args=[transaction.pk]))
+        self.assertEqual(response.status_code, 400)
+
+        offer.refresh_from_db()
+        self.assertEqual(offer.credit_amount, Decimal('5'))
+        self.assertEqual(offer.total_price, Decimal('10.00'))
+        self.assertEqual(offer.status, 'active')
+
+    def test_restore_does_not_overwrite_a_concurrent_claim(self):
+        offer = self.make_offer(self.seller, '10', '2.00')
+        rejected = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('4'))
+        # Another buyer claims credits after the rejecting request loaded its rows
+        orderbook.buy_from_offer(self.other_seller, offer.id, Decimal('3'))
+
+        self.assertTrue(orderbook.reject(rejected))
+
+        offer.refresh_from_db()
+        self.assertEqual(offer.credit_amount, Decimal('7'))
+        self.assertEqual(offer.total_price, Decimal('14.00'))
+
+    def test_cancelled_offer_keeps_its_credits_and_settles_pending(self):
+        offer = self.make_offer(self.seller, '10', '2.00')
+        pending = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('4'))
+
+        response = self.client.post(reverse('marketplace:offer_cancel', args=[offer.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'cancelled')
+        response = self.client.post(reverse('marketplace:offer_cancel', args=[offer.pk]))
+        self.assertEqual(response.status_code, 400)
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'cancelled')
+        self.assertFalse(orderbook.reject(pending))
+        offer.refresh_from_db()
+        self.assertEqual(offer.credit_amount, Decimal('6'))
+
+    def test_approve_only_settles_pending_and_completes_empty_offers(self):
+        offer = self.make_offer(self.seller, '4', '2.00')
+        transaction = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('4'))
+        MarketOffer.objects.filter(pk=offer.pk).update(status='active')
+
+        response = self.client.post(reverse('marketplace:transaction_approve', args=[transaction.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'approved')
+        offer.refresh_from_db()
+        self.assertEqual(offer.status, 'completed')
+
+        response = self.client.post(reverse('marketplace:transaction_approve', args=[transaction.pk]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(orderbook.reject(transaction))
+
+
+@override_settings(MARKETPLACE_NOTIFICATIONS_ASYNC=False)
+class TransactionNotificationTestCase(MarketplaceTestMixin, TestCase):
+    """Notification fan-out for new and settled transactions."""
+
+    def add_bank_admins(self, count):
+        offset = User.objects.filter(is_bank_admin=True).count()
+        for index in range(offset, offset + count):
+            User.objects.create_user(
+                username=f'bank{index}',
+                email=f'bank{index}@test.com',
+                password='password123',
+                is_bank_admin=True
+            )
+
+    def test_notifications_are_written_on_commit(self):
+        self.add_bank_admins(3)
+        offer = self.make_offer(self.seller, '10', '2.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('4'))
+            self.assertFalse(TransactionNotification.objects.exists())
+
+        notifications = TransactionNotification.objects.filter(transaction=transaction)
+        self.assertEqual(notifications.filter(notification_type='purchase', user__is_bank_admin=True).count(), 3)
+        seller_notification = notifications.get(user=self.seller.user)
+        self.assertEqual(seller_notification.notification_type, 'sale')
+        self.assertIn(self.buyer.company_name, seller_notification.message)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.status = 'completed'
+            transaction.save()
+        self.assertEqual(
+            set(notifications.filter(notification_type='status_change').values_list('user', flat=True)),
+            {self.buyer.user.id, self.seller.user.id}
+        )
+
+    def test_fan_out_query_count_is_flat_in_bank_admins(self):
+        offer = self.make_offer(self.seller, '10', '2.00')
+        transaction = orderbook.buy_from_offer(self.buyer, offer.id, Decimal('1'))
+
+        self.add_bank_admins(1)
+        with self.assertNumQueries(3):
+            self.assertEqual(send_transaction_notifications(transaction.id), 2)
+
+        self.add_bank_admins(20)
+        with self.assertNumQueries(3):
+            self.assertEqual(send_transaction_notifications(transaction.id), 22)
+
+
+@override_settings(MARKETPLACE_NOTIFICATIONS_ASYNC=False)
+class NotificationInboxTestCase(MarketplaceTestMixin, TestCase):
+    """Cached unread counts and keyset paging of the inbox."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = self.seller.user
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def notify(self, count, created_at=None):
+        created_at = created_at or timezone.now()
+        rows = TransactionNotification.objects.bulk_create([
+            TransactionNotification(user=self.user, notification_type='other', message=f'n{index}', created_at=created_at)
+            for index in range(count)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.record_new_notifications(rows)
+        return rows
+
+    @override_settings(SHARED_CACHE='default')
+    def test_unread_count_is_cached_and_kept_in_step(self):
+        self.notify(3)
+        self.assertEqual(notifications.unread_count(self.user.id), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.user.id), 3)
+
+        # New transactions bump the count as their notifications are written
+        offer = self.make_offer(self.seller, '10', '2.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            orderbook.buy_from_offer(self.buyer, offer.id, Decimal('1'))
+        first = TransactionNotification.objects.filter(user=self.user).earliest('id')
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.user.id), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(notifications.set_read(self.user, first.id))
+            self.assertFalse(notifications.set_read(self.user, first.id))
+        self.assertEqual(notifications.unread_count(self.user.id), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('marketplace:notification_mark_all_read'))
+        self.assertEqual(response.data['marked'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.user.id), 0)
+        self.assertFalse(TransactionNotification.objects.filter(user=self.user, is_read=False).exists())
+
+        with self.assertRaises(TransactionNotification.DoesNotExist):
+            notifications.set_read(self.buyer.user, first.id)
+
+    def test_unread_count_without_shared_cache_is_counted(self):
+        """Without a shared cache the count is queried, so writes by other workers show at once."""
+        self.notify(2)
+        self.assertEqual(notifications.unread_count(self.user.id), 2)
+
+        # Written by another worker, whose counter updates this one never sees
+        TransactionNotification.objects.create(user=self.user, notification_type='other', message='elsewhere')
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.unread_count(self.user.id), 3)
+        self.assertIsNone(cache.get(notifications.UNREAD_COUNT_KEY.format(user_id=self.user.id)))
+
+    def test_inbox_pages_by_keyset_newest_first(self):
+        now = timezone.now()
+        older = self.notify(3, created_at=now - timedelta(hours=1))
+        # Same timestamp on every row of a page boundary: ids break the tie
+        newer = self.notify(4, created_at=now)
+        expected = [n.id for n in reversed(newer)] + [n.id for n in reversed(older)]
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(reverse('marketplace:notification_list'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['unread_count'], 7)
+            seen += [row['id'] for row in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(reverse('marketplace:notification_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
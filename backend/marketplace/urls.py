@@ -9,12 +9,22 @@ urlpatterns = [
     path('offers/<int:pk>/', views.MarketOfferDetailView.as_view(), name='offer_detail'),
     path('offers/<int:pk>/cancel/', views.MarketOfferCancelView.as_view(), name='offer_cancel'),
     
+    # Order book endpoints
+    path('orderbook/', views.OrderBookView.as_view(), name='order_book'),
+    path('orders/', views.MarketOrderView.as_view(), name='market_order'),
+    
     # Transaction endpoints
     path('transactions/', views.TransactionListCreateView.as_view(), name='transaction_list'),
     path('transactions/<int:pk>/', views.TransactionDetailView.as_view(), name='transaction_detail'),
     path('transactions/<int:pk>/approve/', views.TransactionApprovalView.as_view(), name='transaction_approve'),
     path('transactions/<int:pk>/reject/', views.TransactionRejectView.as_view(), name='transaction_reject'),
     
+    # Notification inbox
+    path('notifications/', views.NotificationListView.as_view(), name='notification_list'),
+    path('notifications/unread-count/', views.NotificationUnreadCountView.as_view(), name='notification_unread_count'),
+    path('notifications/mark-all-read/', views.NotificationMarkAllReadView.as_view(), name='notification_mark_all_read'),
+    path('notifications/<int:pk>/read/', views.NotificationReadView.as_view(), name='notification_read'),
+    
     # Analytics and stats
     path('stats/', views.MarketStatsView.as_view(), name='market_stats'),
 ] 
\ No newline at end of file
@@ -7,16 +7,21 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from django.utils import timezone
 from django.db.models import Sum, Avg, Count, F, Q
 
-from .models import MarketOffer, MarketplaceTransaction
+from .models import MarketOffer, MarketplaceTransaction, TransactionNotification
 from users.models import EmployerProfile
 from .serializers import (
     MarketOfferSerializer, MarketOfferCreateSerializer,
     TransactionSerializer, TransactionCreateSerializer,
-    TransactionApprovalSerializer, MarketStatsSerializer
+    TransactionApprovalSerializer, MarketStatsSerializer,
+    MarketOrderSerializer, OrderBookLevelSerializer,
+    TransactionNotificationSerializer
 )
+from . import notifications, orderbook
+from core.pagination import KeysetPagination
 from .permissions import IsEmployerOrAdmin, IsOfferParticipantOrAdmin, IsOfferSellerOrAdmin
 from users.permissions import IsApprovedUser
 
@@ -70,22 +75,12 @@ class MarketOfferCancelView(APIView):
         # Permission check
         self.check_object_permissions(request, offer)
             
-        # Check if the offer can be cancelled
-        if offer.status != 'active':
+        # Cancel the offer and any pending transactions, if it is still active
+        if not orderbook.cancel_offer(offer):
             return Response(
                 {"error": "Only active offers can be cancelled"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        # Cancel the offer
-        offer.status = 'cancelled'
-        offer.save()
-        
-        # Cancel any pending transactions
-        MarketplaceTransaction.objects.filter(
-            offer=offer,
-            status='pending'
-        ).update(status='cancelled')
         
         serializer = MarketOfferSerializer(offer)
         return Response(serializer.data)
@@ -102,10 +97,13 @@ class TransactionListCreateView(APIView):
         # Get transactions where user is either buyer or seller
         transactions = MarketplaceTransaction.objects.filter(
             Q(buyer=employer) | Q(seller=employer)
-        ).order_by('-created_at')
+        ).select_related('buyer', 'seller', 'offer__seller')
         
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        # Newest first, a keyset page at a time
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     def post(self, request):
         """Create a new transaction (purchase credits)"""
@@ -122,52 +120,17 @@ class TransactionListCreateView(APIView):
             offer_id = serializer.validated_data.get('offer')
             credit_amount = serializer.validated_data.get('credit_amount')
             
-            # Get the offer
-            offer = get_object_or_404(MarketOffer, pk=offer_id)
-            
-            # Check if offer is active
-            if offer.status != 'active':
-                return Response(
-                    {"error": "This offer is no longer active"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            # Check if trying to buy from self
-            if offer.seller == employer:
-                return Response(
-                    {"error": "You cannot buy your own credits"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            # Check if enough credits available
-            if credit_amount > offer.credit_amount:
-                return Response(
-                    {"error": "Not enough credits available in this offer"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
             # Check if buyer has enough funds (would integrate with payment system)
             # For now, assume they do
             
-            # Create the transaction
-            transaction = MarketplaceTransaction.objects.create(
-                offer=offer,
-                seller=offer.seller,
-                buyer=employer,
-                credit_amount=credit_amount,
-                total_price=credit_amount * offer.price_per_credit,
-                status='pending'
-            )
-            
-            # If this purchase uses all remaining credits, mark offer as completed
-            if credit_amount == offer.credit_amount:
-                offer.status = 'completed'
-                offer.save()
-            # Otherwise, reduce the available credits
-            else:
-                offer.credit_amount -= credit_amount
-                offer.total_price = offer.credit_amount * offer.price_per_credit
-                offer.save()
+            # Lock the offer, re-check it and take the credits in one transaction so
+            # concurrent buyers can't both pass the availability check
+            try:
+                transaction = orderbook.buy_from_offer(employer, offer_id, credit_amount)
+            except MarketOffer.DoesNotExist:
+                raise Http404("No MarketOffer matches the given query.")
+            except orderbook.OrderError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
                 
             return Response(
                 TransactionSerializer(transaction).data,
@@ -176,6 +139,63 @@ class TransactionListCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class OrderBookView(APIView):
+    permission_classes = [IsAuthenticated, IsApprovedUser, IsEmployerOrAdmin]
+    
+    def get(self, request):
+        """Get the order book aggregated by price level, best price first"""
+        try:
+            levels = int(request.query_params.get('levels', 20))
+        except ValueError:
+            levels = 20
+        
+        depth = orderbook.book_depth(levels=max(levels, 1))
+        return Response({
+            'best_price': depth[0]['price_per_credit'] if depth else None,
+            'levels': OrderBookLevelSerializer(depth, many=True).data,
+        })
+
+
+class MarketOrderView(APIView):
+    permission_classes = [IsAuthenticated, IsApprovedUser, IsEmployerOrAdmin]
+    
+    def post(self, request):
+        """Buy credits at the best available prices, filling across offers up to an optional limit price"""
+        # Permission already checked by IsEmployerOrAdmin
+        employer = request.user.employer_profile
+        
+        serializer = MarketOrderSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            transactions = orderbook.buy(
+                employer,
+                serializer.validated_data['credit_amount'],
+                limit_price=serializer.validated_data.get('limit_price'),
+                allow_partial=serializer.validated_data['allow_partial']
+            )
+        except orderbook.InsufficientLiquidityError as e:
+            return Response(
+                {"error": str(e), "available": e.available},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except orderbook.OrderError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        filled = sum((transaction.credit_amount for transaction in transactions), 0)
+        total_price = sum((transaction.total_price for transaction in transactions), 0)
+        return Response(
+            {
+                'credit_amount': filled,
+                'total_price': total_price,
+                'average_price': round(total_price / filled, 2) if filled else None,
+                'transactions': TransactionSerializer(transactions, many=True).data,
+            },
+            status=status.HTTP_201_CREATED if transactions else status.HTTP_200_OK
+        )
+
+
 class TransactionDetailView(APIView):
     permission_classes = [IsAuthenticated, IsApprovedUser, IsOfferParticipantOrAdmin]
     
@@ -200,22 +220,15 @@ class TransactionApprovalView(APIView):
         # Permission check
         self.check_object_permissions(request, transaction)
         
-        # Check transaction status
-        if transaction.status != 'pending':
+        # Approve the transaction if it is still pending
+        if not orderbook.settle(transaction, 'approved', completed_at=timezone.now()):
             return Response(
                 {"error": "Only pending transactions can be approved"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update transaction status
-        transaction.status = 'approved'
-        transaction.completed_at = timezone.now()
-        transaction.save()
-        
-        # If this transaction was for all credits in the offer, mark offer as completed
-        if transaction.offer.status == 'active' and transaction.credit_amount == transaction.offer.credit_amount:
-            transaction.offer.status = 'completed'
-            transaction.offer.save()
+        # If every credit in the offer has been claimed, mark the offer as completed
+        orderbook.complete_offer_if_empty(transaction.offer_id)
         
         # Transfer the credits to the buyer
         # This would be where you'd call a function to actually transfer credits
@@ -235,30 +248,13 @@ class TransactionRejectView(APIView):
         # Permission check
         self.check_object_permissions(request, transaction)
         
-        # Check transaction status
-        if transaction.status != 'pending':
+        # Reject the transaction and return its credits to the offer, if it is still pending
+        if not orderbook.reject(transaction):
             return Response(
                 {"error": "Only pending transactions can be rejected"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update transaction status
-        transaction.status = 'rejected'
-        transaction.save()
-        
-        # Return the credits to the offer
-        offer = transaction.offer
-        if offer.status == 'active' or offer.status == 'completed':
-            offer.credit_amount += transaction.credit_amount
-            offer.total_price = offer.credit_amount * offer.price_per_credit
-            
-            # If offer was marked as completed but we're rejecting the transaction,
-            # reactivate the offer
-            if offer.status == 'completed':
-                offer.status = 'active'
-                
-            offer.save()
-        
         serializer = TransactionSerializer(transaction)
         return Response(serializer.data)
 
@@ -301,3 +297,51 @@ class MarketStatsView(APIView):
         
         serializer = MarketStatsSerializer(stats)
         return Response(serializer.data)
+
+
+class NotificationListView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """List the user's notifications newest first, a keyset page at a time"""
+        unread_only = request.query_params.get('unread') in ('1', 'true', 'True')
+        
+        paginator = KeysetPagination(ordering=notifications.INBOX_ORDERING)
+        page = paginator.paginate_queryset(
+            notifications.inbox_queryset(request.user, unread_only=unread_only), request, view=self
+        )
+        return paginator.get_paginated_response(
+            TransactionNotificationSerializer(page, many=True).data,
+            unread_count=notifications.unread_count(request.user.id)
+        )
+
+
+class NotificationUnreadCountView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """Get the user's unread notification count (served from cache)"""
+        return Response({'unread_count': notifications.unread_count(request.user.id)})
+
+
+class NotificationReadView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request, pk):
+        """Mark one notification read, or unread with {"is_read": false}"""
+        is_read = request.data.get('is_read', True) not in (False, 'false', 'False', '0', 0)
+        try:
+            notifications.set_read(request.user, pk, is_read=is_read)
+        except TransactionNotification.DoesNotExist:
+            return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({'id': pk, 'is_read': is_read, 'unread_count': notifications.unread_count(request.user.id)})
+
+
+class NotificationMarkAllReadView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """Mark all of the user's notifications read"""
+        marked = notifications.mark_all_read(request.user)
+        return Response({'marked': marked, 'unread_count': 0})
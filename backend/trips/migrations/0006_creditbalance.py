@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 07:59
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    """Populate CreditBalance from the existing CarbonCredit rows."""
+    CarbonCredit = apps.get_model('trips', 'CarbonCredit')
+    CreditBalance = apps.get_model('trips', 'CreditBalance')
+    
+    balances = {}
+    rows = CarbonCredit.objects.values('owner_type', 'owner_id', 'status').annotate(total=Sum('amount'))
+    for row in rows:
+        if row['status'] not in ('active', 'pending', 'used', 'expired'):
+            continue
+        key = (row['owner_type'], row['owner_id'])
+        balance = balances.setdefault(key, CreditBalance(owner_type=key[0], owner_id=key[1]))
+        setattr(balance, row['status'], row['total'] or 0)
+    
+    CreditBalance.objects.bulk_create(balances.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0005_remove_trip_end_time_remove_trip_start_time_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.CharField(choices=[('employee', 'Employee'), ('employer', 'Employer')], max_length=10)),
+                ('owner_id', models.IntegerField()),
+                ('active', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('used', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('expired', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner_type', 'owner_id'), name='unique_credit_balance_owner')],
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0006_creditbalance'),
+        ('users', '0007_employerprofile_phone_employerprofile_position'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(fields=['owner_type', 'owner_id', 'status', 'timestamp'], name='credit_owner_status_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['owner_type', 'owner_id', 'timestamp'], name='credit_owner_active_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['employee', 'verification_status'], name='trip_employee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['employee', 'trip_date'], name='trip_employee_date_idx'),
+        ),
+    ]
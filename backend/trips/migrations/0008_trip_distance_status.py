@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0007_hot_path_indexes'),
+        ('users', '0007_employerprofile_phone_employerprofile_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='distance_status',
+            field=models.CharField(choices=[('provisional', 'Provisional'), ('final', 'Final')], default='final', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='end_latitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='end_longitude',
+            field=models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('distance_status', 'provisional')), fields=['id'], name='trip_distance_provisional_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 08:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0008_trip_distance_status'),
+        ('users', '0007_employerprofile_phone_employerprofile_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.CharField(choices=[('employee', 'Employee'), ('employer', 'Employer')], max_length=10)),
+                ('owner_id', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('employee', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='credit_account', to='users.employeeprofile')),
+                ('employer', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='credit_account', to='users.employerprofile')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='carboncredit',
+            name='account',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='credits', to='trips.creditaccount'),
+        ),
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(fields=['account', 'status', 'timestamp'], name='credit_account_status_ts_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='creditaccount',
+            constraint=models.UniqueConstraint(fields=('owner_type', 'owner_id'), name='unique_credit_account_owner'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_accounts(apps, schema_editor):
+    """Create one CreditAccount per existing (owner_type, owner_id) pair and point credits at it."""
+    CarbonCredit = apps.get_model('trips', 'CarbonCredit')
+    CreditAccount = apps.get_model('trips', 'CreditAccount')
+    EmployeeProfile = apps.get_model('users', 'EmployeeProfile')
+    EmployerProfile = apps.get_model('users', 'EmployerProfile')
+
+    employees = set(EmployeeProfile.objects.values_list('id', flat=True))
+    employers = set(EmployerProfile.objects.values_list('id', flat=True))
+    owners = CarbonCredit.objects.order_by().values_list('owner_type', 'owner_id').distinct()
+    CreditAccount.objects.bulk_create([
+        CreditAccount(
+            owner_type=owner_type,
+            owner_id=owner_id,
+            employee_id=owner_id if owner_type == 'employee' and owner_id in employees else None,
+            employer_id=owner_id if owner_type == 'employer' and owner_id in employers else None
+        )
+        for owner_type, owner_id in owners
+    ], batch_size=1000)
+
+    CarbonCredit.objects.update(account=Subquery(
+        CreditAccount.objects.filter(
+            owner_type=OuterRef('owner_type'),
+            owner_id=OuterRef('owner_id')
+        ).values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0009_creditaccount'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_accounts, migrations.RunPython.noop),
+    ]
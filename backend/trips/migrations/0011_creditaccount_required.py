@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 08:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0010_backfill_credit_accounts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='carboncredit',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='credits', to='trips.creditaccount'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0011_creditaccount_required'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expiry_date', 'id'], name='credit_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0012_credit_active_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.CharField(choices=[('employee', 'Employee'), ('employer', 'Employer')], max_length=10)),
+                ('owner_id', models.IntegerField()),
+                ('status', models.CharField(choices=[('used', 'Used'), ('expired', 'Expired')], max_length=10)),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='carboncredit',
+            index=models.Index(condition=models.Q(('status__in', ['used', 'expired'])), fields=['timestamp', 'id'], name='credit_settled_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditarchive',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_credits', to='trips.creditaccount'),
+        ),
+        migrations.AddConstraint(
+            model_name='creditarchive',
+            constraint=models.UniqueConstraint(fields=('owner_type', 'owner_id', 'status', 'day'), name='unique_credit_archive_row'),
+        ),
+    ]
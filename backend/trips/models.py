@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Q, Sum, Count
+from django.db.models.functions import TruncDate
 from django.utils import timezone
-from users.models import CustomUser, EmployeeProfile, Location
+from core.models import DailyCreditRollup, upsert_deltas
+from users.models import CustomUser, EmployeeProfile, EmployerProfile, Location
+from datetime import timedelta
 from decimal import Decimal
 
 
@@ -20,6 +24,11 @@ class Trip(models.Model):
         ('flagged', 'Flagged for Review'),
     )
     
+    DISTANCE_STATUS = (
+        ('provisional', 'Provisional'),
+        ('final', 'Final'),
+    )
+    
     employee = models.ForeignKey(
         EmployeeProfile, 
         on_delete=models.CASCADE, 
@@ -48,6 +57,15 @@ class Trip(models.Model):
         null=True,
         blank=True
     )
+    # Straight-line estimate until the background worker resolves the route distance
+    distance_status = models.CharField(
+        max_length=20,
+        choices=DISTANCE_STATUS,
+        default='final'
+    )
+    # Raw end-of-trip GPS fix, kept for route resolution
+    end_latitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
+    end_longitude = models.DecimalField(max_digits=10, decimal_places=7, null=True, blank=True)
     carbon_savings = models.DecimalField(
         max_digits=8, 
         decimal_places=2,
@@ -69,6 +87,20 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Pending-approval queues and per-status counts
+            models.Index(fields=['employee', 'verification_status'], name='trip_employee_status_idx'),
+            # Per-employee history and date-window dashboards
+            models.Index(fields=['employee', 'trip_date'], name='trip_employee_date_idx'),
+            # Background distance finalization queue
+            models.Index(
+                fields=['id'],
+                condition=Q(distance_status='provisional'),
+                name='trip_distance_provisional_idx'
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.employee.user.email}: {self.trip_date} ({self.transport_mode})"
     
@@ -89,6 +121,269 @@ class Trip(models.Model):
         return Decimal(str(self.distance_km)) * factor if self.distance_km else Decimal('0')
 
 
+def _to_amount(value):
+    """Convert a credit amount to the 2-decimal-place value stored in the database."""
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def _grouped_totals(queryset):
+    """Sum credit amounts in a queryset by (owner_type, owner_id, status)."""
+    rows = queryset.order_by().values('owner_type', 'owner_id', 'status').annotate(total=Sum('amount'))
+    return {
+        (row['owner_type'], row['owner_id'], row['status']): row['total'] or Decimal('0')
+        for row in rows
+    }
+
+
+def _deltas_from_totals(totals, sign=1):
+    """Turn grouped totals into per-owner status deltas for CreditBalance.apply_deltas."""
+    deltas = {}
+    for (owner_type, owner_id, status), total in totals.items():
+        owner_deltas = deltas.setdefault((owner_type, owner_id), {})
+        owner_deltas[status] = owner_deltas.get(status, Decimal('0')) + sign * total
+    return deltas
+
+
+def _credit_day(timestamp):
+    """Day a credit timestamp falls on in the current time zone (matches TruncDate)."""
+    return timezone.localdate(timestamp) if timezone.is_aware(timestamp) else timestamp.date()
+
+
+def _daily_totals(queryset):
+    """Sum credit amounts and counts in a queryset by day, as DailyCreditRollup.apply_deltas deltas."""
+    rows = queryset.order_by().values(day=TruncDate('timestamp')).annotate(total=Sum('amount'), count=Count('id'))
+    return {
+        (row['day'],): {'credits_issued': row['total'] or Decimal('0'), 'credit_count': row['count']}
+        for row in rows
+    }
+
+
+def _negate(deltas):
+    """Flip the sign of every value in a deltas dict."""
+    return {key: {field: -value for field, value in changes.items()} for key, changes in deltas.items()}
+
+
+def _merge_deltas(target, deltas):
+    """Merge per-key deltas (per-owner status deltas, per-day rollup deltas) into target in place."""
+    for owner, changes in deltas.items():
+        owner_deltas = target.setdefault(owner, {})
+        for status, amount in changes.items():
+            owner_deltas[status] = owner_deltas.get(status, 0) + amount
+    return target
+
+
+class CreditAccount(models.Model):
+    """
+    Ledger account holding credits: one row per credit owner.
+    
+    Credits reference their account by foreign key, and the account links to
+    the owning EmployeeProfile or EmployerProfile, so "this employer's and
+    its employees' credits" is a join over FK indexes (see
+    CarbonCreditQuerySet.owned_by and for_company) instead of an
+    owner_id__in list. Credits keep owner_type/owner_id as well:
+    CreditBalance, the daily rollups and the ledger still key on the pair,
+    and every CarbonCredit write path keeps account in step with it.
+    """
+    
+    owner_type = models.CharField(
+        max_length=10,
+        choices=(('employee', 'Employee'), ('employer', 'Employer'))
+    )
+    owner_id = models.IntegerField()  # ID of either EmployeeProfile or EmployerProfile
+    employee = models.OneToOneField(
+        EmployeeProfile,
+        on_delete=models.SET_NULL,
+        related_name='credit_account',
+        null=True,
+        blank=True
+    )
+    employer = models.OneToOneField(
+        EmployerProfile,
+        on_delete=models.SET_NULL,
+        related_name='credit_account',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_type', 'owner_id'], name='unique_credit_account_owner'),
+        ]
+    
+    def __str__(self):
+        return f"Credit account for {self.owner_type} ({self.owner_id})"
+    
+    @classmethod
+    def resolve(cls, owners, using='default'):
+        """
+        Get the account ids for (owner_type, owner_id) pairs, creating missing accounts.
+        
+        New accounts are linked to their EmployeeProfile/EmployerProfile when it
+        exists. Costs one query when every account exists, at most five otherwise.
+        
+        Args:
+            owners: Iterable of (owner_type, owner_id) pairs
+            
+        Returns:
+            Dict mapping each pair to its account id
+        """
+        owners = set(owners)
+        if not owners:
+            return {}
+        
+        def owner_filter():
+            ids_by_type = {}
+            for owner_type, owner_id in owners:
+                ids_by_type.setdefault(owner_type, set()).add(owner_id)
+            condition = Q()
+            for owner_type, owner_ids in ids_by_type.items():
+                condition |= Q(owner_type=owner_type, owner_id__in=owner_ids)
+            return condition, ids_by_type
+        
+        condition, ids_by_type = owner_filter()
+        accounts = {
+            (owner_type, owner_id): account_id
+            for account_id, owner_type, owner_id in cls.objects.using(using).filter(condition).values_list(
+                'id', 'owner_type', 'owner_id'
+            )
+        }
+        missing = owners - set(accounts)
+        if not missing:
+            return accounts
+        
+        employees = set(EmployeeProfile.objects.using(using).filter(
+            id__in=[owner_id for owner_type, owner_id in missing if owner_type == 'employee']
+        ).values_list('id', flat=True))
+        employers = set(EmployerProfile.objects.using(using).filter(
+            id__in=[owner_id for owner_type, owner_id in missing if owner_type == 'employer']
+        ).values_list('id', flat=True))
+        # ignore_conflicts: a concurrent writer may create the same account first
+        cls.objects.using(using).bulk_create([
+            cls(
+                owner_type=owner_type,
+                owner_id=owner_id,
+                employee_id=owner_id if owner_type == 'employee' and owner_id in employees else None,
+                employer_id=owner_id if owner_type == 'employer' and owner_id in employers else None
+            )
+            for owner_type, owner_id in missing
+        ], ignore_conflicts=True)
+        
+        owners = missing
+        condition, _ = owner_filter()
+        accounts.update({
+            (owner_type, owner_id): account_id
+            for account_id, owner_type, owner_id in cls.objects.using(using).filter(condition).values_list(
+                'id', 'owner_type', 'owner_id'
+            )
+        })
+        return accounts
+
+
+def _account_for_owner():
+    """Subquery for the account matching a credit's owner_type/owner_id (for bulk re-pointing)."""
+    return models.Subquery(
+        CreditAccount.objects.filter(
+            owner_type=models.OuterRef('owner_type'),
+            owner_id=models.OuterRef('owner_id')
+        ).values('id')[:1]
+    )
+
+
+# Days a credit issued for a trip stays valid
+CREDIT_VALIDITY_DAYS = 365
+
+
+def credit_expiry_date(issued_at=None):
+    """Expiry date of a credit issued at issued_at (defaults to now)."""
+    return (issued_at or timezone.now()) + timedelta(days=CREDIT_VALIDITY_DAYS)
+
+
+class CarbonCreditQuerySet(models.QuerySet):
+    """QuerySet that keeps CreditBalance and DailyCreditRollup in step with bulk credit writes."""
+
+    # Fields that change a day's DailyCreditRollup totals
+    ROLLUP_FIELDS = frozenset(('amount', 'timestamp'))
+
+    # Fields that decide which CreditAccount a credit belongs to
+    OWNER_FIELDS = frozenset(('owner_type', 'owner_id'))
+
+    def owned_by(self, owner):
+        """Credits held by one EmployeeProfile or EmployerProfile, through its account."""
+        if isinstance(owner, EmployeeProfile):
+            return self.filter(account__employee=owner)
+        if isinstance(owner, EmployerProfile):
+            return self.filter(account__employer=owner)
+        raise TypeError(f"Unsupported credit owner: {owner!r}")
+
+    def for_company(self, employer):
+        """Credits held by an employer or by any of its employees, as one join."""
+        return self.filter(Q(account__employer=employer) | Q(account__employee__employer=employer))
+
+    def update(self, **kwargs):
+        track_balances = bool(CreditBalance.TRACKED_FIELDS.intersection(kwargs))
+        track_days = bool(self.ROLLUP_FIELDS.intersection(kwargs))
+        track_accounts = bool(self.OWNER_FIELDS.intersection(kwargs)) and 'account' not in kwargs
+        if not (track_balances or track_days or track_accounts):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            # Pin the affected rows first, the update may move them out of this queryset's filter
+            pks = list(self.select_for_update().values_list('pk', flat=True))
+            rows = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            before = _grouped_totals(rows) if track_balances else {}
+            before_days = _daily_totals(rows) if track_days else {}
+            updated = super().update(**kwargs)
+
+            if track_balances:
+                deltas = _deltas_from_totals(before, sign=-1)
+                _merge_deltas(deltas, _deltas_from_totals(_grouped_totals(rows)))
+                CreditBalance.apply_deltas(deltas, using=self.db)
+            if track_days:
+                day_deltas = _merge_deltas(_negate(before_days), _daily_totals(rows))
+                DailyCreditRollup.apply_deltas(day_deltas, using=self.db)
+            if track_accounts:
+                # Re-point moved credits at their new owners' accounts
+                CreditAccount.resolve(rows.values_list('owner_type', 'owner_id').distinct(), using=self.db)
+                rows.update(account=_account_for_owner())
+        return updated
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            # Lock first, row locks can't be combined with the GROUP BY in _grouped_totals
+            pks = list(self.select_for_update().values_list('pk', flat=True))
+            rows = self.model._base_manager.using(self.db).filter(pk__in=pks)
+            totals = _grouped_totals(rows)
+            day_totals = _daily_totals(rows)
+            result = super().delete()
+            CreditBalance.apply_deltas(_deltas_from_totals(totals, sign=-1), using=self.db)
+            DailyCreditRollup.apply_deltas(_negate(day_totals), using=self.db)
+        return result
+
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            unassigned = [obj for obj in objs if obj.account_id is None]
+            if unassigned:
+                accounts = CreditAccount.resolve(((obj.owner_type, obj.owner_id) for obj in unassigned), using=self.db)
+                for obj in unassigned:
+                    obj.account_id = accounts[(obj.owner_type, obj.owner_id)]
+            created = super().bulk_create(objs, *args, **kwargs)
+            deltas = {}
+            day_deltas = {}
+            for obj in created:
+                amount = _to_amount(obj.amount)
+                _merge_deltas(deltas, {(obj.owner_type, obj.owner_id): {obj.status: amount}})
+                _merge_deltas(day_deltas, {(_credit_day(obj.timestamp),): {'credits_issued': amount, 'credit_count': 1}})
+            CreditBalance.apply_deltas(deltas, using=self.db)
+            DailyCreditRollup.apply_deltas(day_deltas, using=self.db)
+        return created
+
+    # bulk_update needs no override: Django applies it through update(), which keeps balances in step
+
+
 class CarbonCredit(models.Model):
     """Model for tracking carbon credits."""
     
@@ -112,6 +407,11 @@ class CarbonCredit(models.Model):
         choices=(('employee', 'Employee'), ('employer', 'Employer'))
     )
     owner_id = models.IntegerField()  # ID of either EmployeeProfile or EmployerProfile
+    account = models.ForeignKey(
+        CreditAccount,
+        on_delete=models.PROTECT,
+        related_name='credits'
+    )  # Kept in step with owner_type/owner_id on save
     timestamp = models.DateTimeField(default=timezone.now)
     status = models.CharField(
         max_length=10,
@@ -120,5 +420,301 @@ class CarbonCredit(models.Model):
     )
     expiry_date = models.DateTimeField(null=True, blank=True)
     
+    objects = CarbonCreditQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Owner wallet/history lookups, filtered by status and read oldest first
+            models.Index(fields=['owner_type', 'owner_id', 'status', 'timestamp'], name='credit_owner_status_ts_idx'),
+            # FIFO draw-downs only ever scan active credits
+            models.Index(
+                fields=['owner_type', 'owner_id', 'timestamp'],
+                name='credit_owner_active_ts_idx',
+                condition=Q(status='active')
+            ),
+            # Company-wide credit lists join through the account
+            models.Index(fields=['account', 'status', 'timestamp'], name='credit_account_status_ts_idx'),
+            # The expiry sweep only ever scans active credits, soonest expiry first
+            models.Index(
+                fields=['expiry_date', 'id'],
+                name='credit_active_expiry_idx',
+                condition=Q(status='active')
+            ),
+            # Archival scans settled credits oldest first
+            models.Index(
+                fields=['timestamp', 'id'],
+                name='credit_settled_ts_idx',
+                condition=Q(status__in=['used', 'expired'])
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.amount} credits for {self.owner_type} ({self.owner_id})"
+    
+    def save(self, *args, **kwargs):
+        """Save the credit and apply the change to the owner's CreditBalance and the daily rollup in the same transaction."""
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            deltas = {}
+            day_deltas = {}
+            if self.pk is not None and not self._state.adding:
+                old = CarbonCredit._base_manager.using(using).select_for_update().filter(
+                    pk=self.pk
+                ).values('owner_type', 'owner_id', 'status', 'amount', 'timestamp').first()
+                if old is not None:
+                    deltas[(old['owner_type'], old['owner_id'])] = {old['status']: -old['amount']}
+                    day_deltas[(_credit_day(old['timestamp']),)] = {'credits_issued': -old['amount'], 'credit_count': -1}
+                    if (old['owner_type'], old['owner_id']) != (self.owner_type, self.owner_id):
+                        self.account_id = None
+            
+            if self.account_id is None:
+                self.account_id = CreditAccount.resolve([(self.owner_type, self.owner_id)], using=using)[
+                    (self.owner_type, self.owner_id)
+                ]
+                if CarbonCredit.account.is_cached(self):
+                    CarbonCredit.account.field.delete_cached_value(self)
+            super().save(*args, **kwargs)
+            
+            amount = _to_amount(self.amount)
+            _merge_deltas(deltas, {(self.owner_type, self.owner_id): {self.status: amount}})
+            _merge_deltas(day_deltas, {(_credit_day(self.timestamp),): {'credits_issued': amount, 'credit_count': 1}})
+            CreditBalance.apply_deltas(deltas, using=using)
+            DailyCreditRollup.apply_deltas(day_deltas, using=using)
+    
+    def delete(self, *args, **kwargs):
+        """Delete the credit and remove it from the owner's CreditBalance and the daily rollup."""
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            old = CarbonCredit._base_manager.using(using).select_for_update().filter(
+                pk=self.pk
+            ).values('owner_type', 'owner_id', 'status', 'amount', 'timestamp').first()
+            result = super().delete(*args, **kwargs)
+            if old is not None:
+                CreditBalance.apply_deltas(
+                    {(old['owner_type'], old['owner_id']): {old['status']: -old['amount']}},
+                    using=using
+                )
+                DailyCreditRollup.apply_deltas(
+                    {(_credit_day(old['timestamp']),): {'credits_issued': -old['amount'], 'credit_count': -1}},
+                    using=using
+                )
+        return result
+
+
+class CreditBalance(models.Model):
+    """
+    Materialized credit totals per owner, one column per credit status.
+    
+    Maintained in the same transaction as every CarbonCredit write (model save/delete
+    and the CarbonCreditQuerySet bulk paths), so balance reads are a single indexed
+    lookup instead of a SUM over the credits table. `reconcile_credit_balances`
+    rebuilds it from CarbonCredit and reports any drift.
+    """
+    
+    STATUS_FIELDS = ('active', 'pending', 'used', 'expired')
+    TRACKED_FIELDS = frozenset(('amount', 'status', 'owner_type', 'owner_id'))
+    
+    owner_type = models.CharField(
+        max_length=10,
+        choices=(('employee', 'Employee'), ('employer', 'Employer'))
+    )
+    owner_id = models.IntegerField()  # ID of either EmployeeProfile or EmployerProfile
+    active = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    used = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    expired = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_type', 'owner_id'], name='unique_credit_balance_owner'),
+        ]
+    
+    def __str__(self):
+        return f"{self.active} active credits for {self.owner_type} ({self.owner_id})"
+    
+    @property
+    def total(self):
+        """Total credits across all statuses."""
+        return sum((getattr(self, status) for status in self.STATUS_FIELDS), Decimal('0'))
+    
+    @classmethod
+    def for_owner(cls, owner_type, owner_id):
+        """Get the balance row for an owner, or an unsaved zero balance if none exists."""
+        balance = cls.objects.filter(owner_type=owner_type, owner_id=owner_id).first()
+        return balance or cls(owner_type=owner_type, owner_id=owner_id)
+    
+    @classmethod
+    def get_balance(cls, owner_type, owner_id, status='active'):
+        """Get an owner's credit total for one status (active by default)."""
+        value = cls.objects.filter(
+            owner_type=owner_type,
+            owner_id=owner_id
+        ).values_list(status, flat=True).first()
+        return value or Decimal('0')
+    
+    @classmethod
+    def totals_for(cls, owners):
+        """
+        Sum balances over several owners.
+        
+        Args:
+            owners: Q object or queryset filter selecting the balance rows, or None for all owners
+            
+        Returns:
+            Dict of status -> Decimal total
+        """
+        queryset = cls.objects.all() if owners is None else cls.objects.filter(owners)
+        totals = queryset.aggregate(**{status: Sum(status) for status in cls.STATUS_FIELDS})
+        return {status: totals[status] or Decimal('0') for status in cls.STATUS_FIELDS}
+    
+    @classmethod
+    def grand_total(cls, owners=None):
+        """
+        Total credits ever issued across all statuses, archived credits included.
+        
+        Unlike a SUM over CarbonCredit this doesn't shrink when archive_credits
+        compacts settled credits into CreditArchive.
+        """
+        return sum(cls.totals_for(owners).values(), Decimal('0'))
+    
+    @classmethod
+    def apply_deltas(cls, deltas, using='default'):
+        """
+        Apply per-owner status deltas, e.g. {('employer', 3): {'active': Decimal('-5'), 'used': Decimal('5')}}.
+        
+        Must be called inside the transaction that changed the credits
+        (see core.models.upsert_deltas).
+        """
+        owners_by_type = {}
+        for owner_type, owner_id in deltas:
+            owners_by_type.setdefault(owner_type, []).append(owner_id)
+        owner_filter = Q()
+        for owner_type, owner_ids in owners_by_type.items():
+            owner_filter |= Q(owner_type=owner_type, owner_id__in=owner_ids)
+        
+        upsert_deltas(
+            cls, ('owner_type', 'owner_id'), cls.STATUS_FIELDS, deltas, lookup=owner_filter, using=using
+        )
+    
+    @classmethod
+    def rebuild(cls, dry_run=False):
+        """
+        Recompute every balance from CarbonCredit and CreditArchive.
+        
+        Returns:
+            List of (owner_type, owner_id, status, stored, expected) tuples for each drifted value
+        """
+        with transaction.atomic():
+            expected = {}
+            for (owner_type, owner_id, status), total in _grouped_totals(CarbonCredit.objects.all()).items():
+                if status in cls.STATUS_FIELDS:
+                    expected.setdefault((owner_type, owner_id), {})[status] = total
+            # Archived credits still count towards their owner's balance
+            for (owner_type, owner_id, status), total in _grouped_totals(CreditArchive.objects.all()).items():
+                owner_totals = expected.setdefault((owner_type, owner_id), {})
+                owner_totals[status] = owner_totals.get(status, Decimal('0')) + total
+            
+            stored = {
+                (balance.owner_type, balance.owner_id): balance
+                for balance in cls.objects.select_for_update()
+            }
+            
+            drift = []
+            to_update, to_create = [], []
+            for owner in set(expected) | set(stored):
+                balance = stored.get(owner) or cls(owner_type=owner[0], owner_id=owner[1])
+                changed = False
+                for status in cls.STATUS_FIELDS:
+                    current = getattr(balance, status) or Decimal('0')
+                    target = expected.get(owner, {}).get(status, Decimal('0'))
+                    if current != target:
+                        drift.append((owner[0], owner[1], status, current, target))
+                        setattr(balance, status, target)
+                        changed = True
+                if not changed:
+                    continue
+                if balance.pk is None:
+                    to_create.append(balance)
+                else:
+                    to_update.append(balance)
+            
+            if not dry_run:
+                if to_update:
+                    cls.objects.bulk_update(to_update, list(cls.STATUS_FIELDS))
+                if to_create:
+                    cls.objects.bulk_create(to_create)
+        
+        return sorted(drift)
+
+
+class CreditArchive(models.Model):
+    """
+    Compacted used and expired credits: one row per owner, status and day.
+    
+    trips.tasks.archive_credits folds settled CarbonCredit rows older than the
+    archive horizon into these rows and deletes them, so the credits table
+    stays sized to live balances instead of growing with every draw-down.
+    Archived amounts stay in CreditBalance and DailyCreditRollup;
+    CreditBalance.rebuild and rebuild_daily_rollups add these rows back in,
+    so both still reconcile.
+    """
+    
+    STATUSES = ('used', 'expired')
+    
+    owner_type = models.CharField(
+        max_length=10,
+        choices=(('employee', 'Employee'), ('employer', 'Employer'))
+    )
+    owner_id = models.IntegerField()  # ID of either EmployeeProfile or EmployerProfile
+    account = models.ForeignKey(
+        CreditAccount,
+        on_delete=models.PROTECT,
+        related_name='archived_credits'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=(('used', 'Used'), ('expired', 'Expired'))
+    )
+    day = models.DateField()  # Local day of the archived credits' timestamps
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner_type', 'owner_id', 'status', 'day'],
+                name='unique_credit_archive_row'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.amount} archived {self.status} credits for {self.owner_type} ({self.owner_id}) on {self.day}"
+    
+    @classmethod
+    def apply_totals(cls, totals, using='default'):
+        """
+        Add archived credit totals, e.g. {('employee', 3, 7, 'used', date(2025, 1, 2)): (Decimal('5'), 4)}.
+        
+        Keys are (owner_type, owner_id, account_id, status, day) and values
+        (amount, credit_count). Must be called inside the transaction that
+        deletes the credits (see core.models.upsert_deltas).
+        """
+        if not totals:
+            return
+        
+        owner_filter = Q()
+        for owner_type in {key[0] for key in totals}:
+            owner_filter |= Q(owner_type=owner_type, owner_id__in={key[1] for key in totals if key[0] == owner_type})
+        
+        deltas, accounts = {}, {}
+        for (owner_type, owner_id, account_id, status, day), (amount, count) in totals.items():
+            key = (owner_type, owner_id, status, day)
+            deltas[key] = {'amount': amount, 'credit_count': count}
+            accounts[key] = {'account_id': account_id}
+        
+        upsert_deltas(
+            cls, ('owner_type', 'owner_id', 'status', 'day'), ('amount', 'credit_count'), deltas,
+            lookup=owner_filter & Q(day__in={key[4] for key in totals}), create_defaults=accounts, using=using
+        )
@@ -1,9 +1,9 @@
 from rest_framework import serializers
+from django.db import models
 from .models import Trip, CarbonCredit
-from users.models import Location, EmployeeProfile
+from users.models import Location, EmployeeProfile, EmployerProfile
 from django.conf import settings
 import googlemaps
-from datetime import datetime
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,18 +25,17 @@ class TripSerializer(serializers.ModelSerializer):
             'start_location', 'start_location_name',
             'end_location', 'end_location_name',
             'trip_date', 'transport_mode',
-            'distance_km', 'carbon_savings', 'credits_earned',
-            'proof_image', 'verification_status', 'verified_by',
-            'created_at', 'duration'
+            'distance_km', 'distance_status', 'carbon_savings', 'credits_earned',
+            'verification_status', 'created_at', 'duration'
         ]
         read_only_fields = [
-            'carbon_savings', 'credits_earned', 'verified_by',
-            'verification_status'
+            'carbon_savings', 'credits_earned',
+            'verification_status', 'distance_status'
         ]
     
     def get_duration(self, obj):
         """Get the duration of the trip as a string."""
-        duration = obj.duration
+        duration = getattr(obj, 'duration', None)
         if duration:
             # Format duration as hours and minutes
             hours, remainder = divmod(duration.seconds, 3600)
@@ -91,51 +90,15 @@ class TripEndSerializer(serializers.Serializer):
     def validate(self, data):
         """
         Validate the end location data.
-        If GPS coordinates are provided, reverse geocode to get the address.
-        If distance is not provided, calculate it based on start and end locations.
+        GPS coordinates must come as a pair, and either coordinates or a distance is required.
+        The address and route distance are resolved in the background (see trips.tasks).
         """
-        # If GPS coordinates are provided but no address
-        if ('end_latitude' in data and 'end_longitude' in data and 
-            not data.get('end_address')):
-            
-            # Try to reverse geocode the coordinates
-            try:
-                gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-                reverse_geocode_result = gmaps.reverse_geocode(
-                    (data['end_latitude'], data['end_longitude'])
-                )
-                if reverse_geocode_result:
-                    formatted_address = reverse_geocode_result[0].get('formatted_address', '')
-                    data['end_address'] = formatted_address
-            except Exception as e:
-                # If reverse geocoding fails, just continue with the coordinates
-                pass
+        if ('end_latitude' in data) != ('end_longitude' in data):
+            raise serializers.ValidationError("end_latitude and end_longitude must be provided together.")
+        
+        if 'distance_km' not in data and 'end_latitude' not in data:
+            raise serializers.ValidationError("Provide distance_km or the end coordinates.")
         
-        # If distance is not provided and we have a trip ID and start/end coordinates
-        trip = self.context.get('trip')
-        if 'distance_km' not in data and trip and trip.start_location:
-            if ('end_latitude' in data and 'end_longitude' in data and 
-                hasattr(trip.start_location, 'latitude') and 
-                hasattr(trip.start_location, 'longitude')):
-                
-                try:
-                    # Calculate distance using Google Maps API
-                    gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
-                    directions_result = gmaps.directions(
-                        (trip.start_location.latitude, trip.start_location.longitude),
-                        (data['end_latitude'], data['end_longitude']),
-                        mode=trip.transport_mode if trip.transport_mode in ['driving', 'walking', 'bicycling', 'transit'] else 'driving',
-                        departure_time=datetime.now()
-                    )
-                    
-                    if directions_result:
-                        # Get distance in meters and convert to kilometers
-                        distance_meters = directions_result[0]['legs'][0]['distance']['value']
-                        data['distance_km'] = round(distance_meters / 1000, 2)
-                except Exception as e:
-                    # If distance calculation fails, ask for manual distance
-                    pass
-                
         return data
 
 
@@ -146,6 +109,59 @@ class TripVerificationSerializer(serializers.Serializer):
     verification_notes = serializers.CharField(max_length=500, required=False)
 
 
+def resolve_credit_context(credits):
+    """
+    Batch-load what CarbonCreditSerializer shows for a page of credits.
+
+    owner_id is a bare integer that Django can't prefetch, so owners are
+    collected from the page and loaded in one query per owner type, and
+    source trip dates in one more (skipped when source_trip is already
+    loaded through select_related).
+
+    Args:
+        credits: Sequence of CarbonCredit instances
+
+    Returns:
+        Serializer context dict with credit_owner_names, keyed by
+        (owner_type, owner_id), and credit_trip_dates, keyed by trip id
+    """
+    owner_ids = {'employee': set(), 'employer': set()}
+    trip_ids = set()
+    trip_dates = {}
+    for credit in credits:
+        owner_ids.setdefault(credit.owner_type, set()).add(credit.owner_id)
+        if credit.source_trip_id is None:
+            continue
+        if CarbonCredit.source_trip.is_cached(credit):
+            trip_dates[credit.source_trip_id] = credit.source_trip.trip_date
+        else:
+            trip_ids.add(credit.source_trip_id)
+
+    owner_names = {}
+    if owner_ids['employee']:
+        for employee in EmployeeProfile.objects.filter(id__in=owner_ids['employee']).select_related('user'):
+            owner_names[('employee', employee.id)] = employee.user.get_full_name()
+    if owner_ids['employer']:
+        for employer_id, company_name in EmployerProfile.objects.filter(
+            id__in=owner_ids['employer']
+        ).values_list('id', 'company_name'):
+            owner_names[('employer', employer_id)] = company_name
+    if trip_ids:
+        trip_dates.update(Trip.objects.filter(id__in=trip_ids).values_list('id', 'trip_date'))
+
+    return {'credit_owner_names': owner_names, 'credit_trip_dates': trip_dates}
+
+
+class CarbonCreditListSerializer(serializers.ListSerializer):
+    """Serializes a page of credits with owners and trip dates resolved in bulk."""
+    
+    def to_representation(self, data):
+        credits = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'credit_owner_names' not in self._context:
+            self._context.update(resolve_credit_context(credits))
+        return super().to_representation(credits)
+
+
 class CarbonCreditSerializer(serializers.ModelSerializer):
     """Serializer for the CarbonCredit model."""
     
@@ -159,24 +175,27 @@ class CarbonCreditSerializer(serializers.ModelSerializer):
             'owner_id', 'timestamp', 'status', 
             'expiry_date', 'trip_date', 'owner_name'
         ]
+        list_serializer_class = CarbonCreditListSerializer
     
     def get_trip_date(self, obj):
         """Get the date of the source trip."""
-        if obj.source_trip:
-            return obj.source_trip.trip_date
-        return None
+        if obj.source_trip_id is None:
+            return None
+        trip_dates = self.context.get('credit_trip_dates')
+        if trip_dates is not None and obj.source_trip_id in trip_dates:
+            return trip_dates[obj.source_trip_id]
+        return obj.source_trip.trip_date
     
     def get_owner_name(self, obj):
         """Get the name of the credit owner."""
+        owner_names = self.context.get('credit_owner_names')
+        if owner_names is None:
+            owner_names = resolve_credit_context([obj])['credit_owner_names']
+        if (obj.owner_type, obj.owner_id) in owner_names:
+            return owner_names[(obj.owner_type, obj.owner_id)]
         if obj.owner_type == 'employee':
-            try:
-                employee = EmployeeProfile.objects.get(id=obj.owner_id)
-                return employee.user.get_full_name()
-            except EmployeeProfile.DoesNotExist:
-                return f"Employee #{obj.owner_id}"
-        else:
-            # For employers, we would need similar logic
-            return f"Employer #{obj.owner_id}"
+            return f"Employee #{obj.owner_id}"
+        return f"Employer #{obj.owner_id}"
 
 
 class TripStatsSerializer(serializers.Serializer):
@@ -0,0 +1,317 @@
+"""
+Background work for trips.
+
+Ending a trip records a provisional straight-line distance so the request
+never waits on Google Maps. The route distance and the end address are
+resolved here afterwards, either by the in-process worker pool (queued on
+commit by enqueue_trip_finalization) or by the finalize_trips management
+command, which also picks up anything the pool didn't get to.
+
+Credits past their expiry_date are moved to 'expired' by expire_credits
+(run periodically through the expire_credits management command), so
+balance reads can trust status alone. Used and expired credits older than
+CREDIT_ARCHIVE_AFTER_DAYS are folded into CreditArchive by archive_credits
+(the archive_credits command), keeping the credits table small.
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+import googlemaps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.utils.credit_calculator import calculate_batch
+from core.utils.distance_calculator import resolve_distances
+from core.utils.workers import LazyExecutor
+from .models import Trip, CarbonCredit, CreditArchive, credit_expiry_date
+from .utils import google_travel_mode
+
+logger = logging.getLogger(__name__)
+
+# Credits expired per UPDATE
+EXPIRY_BATCH_SIZE = 1000
+
+# Credits archived per batch, and the default age (days) before settled credits are archived
+ARCHIVE_BATCH_SIZE = 1000
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+
+_executor = LazyExecutor('TRIP_FINALIZE_WORKERS', 2, 'trip-finalize')
+
+
+def enqueue_trip_finalization(trip_id):
+    """
+    Queue a trip with a provisional distance for background finalization.
+
+    The job is submitted once the current transaction commits. With
+    TRIP_FINALIZE_ASYNC disabled nothing is queued and trips wait for the
+    finalize_trips command.
+    """
+    if not getattr(settings, 'TRIP_FINALIZE_ASYNC', True):
+        return
+    transaction.on_commit(lambda: _executor.submit(_run_finalization, [trip_id]))
+
+
+def _run_finalization(trip_ids):
+    """Worker-thread entry point: own database connection, errors logged not raised."""
+    close_old_connections()
+    try:
+        finalize_trips(trip_ids)
+    except Exception:
+        logger.exception(f"Finalizing trips {trip_ids} failed")
+    finally:
+        close_old_connections()
+
+
+def finalize_trips(trip_ids=None, limit=None):
+    """
+    Replace provisional trip distances with route distances.
+
+    Route distances for the whole batch are resolved with batched Distance
+    Matrix calls (and the distance cache); pairs the API can't route keep
+    their straight-line distance. Blank end addresses are reverse-geocoded.
+    Savings and credits are recalculated, and the employee's pending credit
+    for the trip is adjusted to match. Trips that were verified in the
+    meantime keep the credits they were paid.
+
+    Args:
+        trip_ids: Optional list of trip ids to restrict to
+        limit: Optional maximum number of trips to process
+
+    Returns:
+        Number of trips finalized
+    """
+    trips = Trip.objects.filter(distance_status='provisional').select_related('start_location', 'end_location')
+    if trip_ids is not None:
+        trips = trips.filter(id__in=trip_ids)
+    trips = list(trips.order_by('id')[:limit] if limit else trips.order_by('id'))
+    if not trips:
+        return 0
+
+    # Resolve route distances outside the transaction, grouped by travel mode
+    route_distances = {}
+    by_mode = {}
+    for trip in trips:
+        if trip.start_location and trip.end_latitude is not None and trip.end_longitude is not None:
+            by_mode.setdefault(google_travel_mode(trip.transport_mode), []).append(trip)
+    for mode, mode_trips in by_mode.items():
+        pairs = [
+            (
+                (trip.start_location.latitude, trip.start_location.longitude),
+                (trip.end_latitude, trip.end_longitude)
+            )
+            for trip in mode_trips
+        ]
+        for trip, distance in zip(mode_trips, resolve_distances(pairs, mode=mode)):
+            if distance is not None:
+                route_distances[trip.id] = distance
+
+    addresses = _reverse_geocode_end_locations(trips)
+
+    finalized = 0
+    with transaction.atomic():
+        locked = Trip.objects.select_for_update().filter(
+            id__in=[trip.id for trip in trips],
+            distance_status='provisional'
+        )
+        finalized_trips, recalculated = [], []
+        for trip in locked:
+            distance = route_distances.get(trip.id, trip.distance_km)
+            trip.distance_km = round(Decimal(distance), 2)
+            trip.distance_status = 'final'
+            update_fields = ['distance_km', 'distance_status', 'updated_at']
+
+            if trip.verification_status != 'verified':
+                update_fields += ['carbon_savings', 'credits_earned']
+                recalculated.append(trip)
+            finalized_trips.append((trip, update_fields))
+
+        # Credits and savings for the whole batch from the configured calculator
+        credits, savings = calculate_batch(
+            [trip.distance_km for trip in recalculated],
+            [trip.transport_mode for trip in recalculated]
+        )
+        for trip, trip_credits, trip_savings in zip(recalculated, credits, savings):
+            trip.credits_earned = trip_credits
+            trip.carbon_savings = trip_savings
+
+        for trip, update_fields in finalized_trips:
+            trip.save(update_fields=update_fields)
+            finalized += 1
+        sync_pending_credits(recalculated)
+
+        for location, address in addresses:
+            location.address = address
+            location.save(update_fields=['address'])
+
+    return finalized
+
+
+def sync_pending_credits(trips):
+    """
+    Match employees' pending credits for trips to the trips' recalculated credits.
+
+    Existing pending credits are resized with one bulk_update, missing ones
+    are created with one bulk_create and those of trips that no longer earn
+    credits are deleted; CarbonCreditQuerySet applies each change to
+    CreditBalance. Must be called inside the transaction that saves the trips.
+
+    Args:
+        trips: Trips whose credits_earned was recalculated
+    """
+    trips = {trip.id: trip for trip in trips}
+    if not trips:
+        return
+
+    pending = {}
+    for credit in CarbonCredit.objects.filter(source_trip_id__in=trips, owner_type='employee', status='pending'):
+        pending.setdefault(credit.source_trip_id, []).append(credit)
+
+    to_update, to_create, to_delete = [], [], []
+    for trip_id, trip in trips.items():
+        credits = pending.get(trip_id, [])
+        if trip.credits_earned <= 0:
+            to_delete += [credit.pk for credit in credits]
+        elif not credits:
+            to_create.append(CarbonCredit(
+                amount=trip.credits_earned,
+                source_trip_id=trip_id,
+                owner_type='employee',
+                owner_id=trip.employee_id,
+                status='pending',
+                expiry_date=credit_expiry_date()
+            ))
+        else:
+            for credit in credits:
+                if credit.amount != trip.credits_earned:
+                    credit.amount = trip.credits_earned
+                    to_update.append(credit)
+
+    if to_update:
+        CarbonCredit.objects.bulk_update(to_update, ['amount'])
+    if to_create:
+        CarbonCredit.objects.bulk_create(to_create)
+    if to_delete:
+        CarbonCredit.objects.filter(pk__in=to_delete).delete()
+
+
+def _reverse_geocode_end_locations(trips):
+    """
+    Look up addresses for end locations that were saved without one.
+
+    Returns:
+        List of (location, address) pairs to save
+    """
+    locations = {
+        trip.end_location.id: (trip.end_location, trip.end_latitude, trip.end_longitude)
+        for trip in trips
+        if trip.end_location and not trip.end_location.address and trip.end_latitude is not None
+    }
+    if not locations:
+        return []
+
+    results = []
+    try:
+        gmaps = googlemaps.Client(
+            key=settings.GOOGLE_MAPS_API_KEY,
+            timeout=getattr(settings, 'GOOGLE_MAPS_TIMEOUT', 10)
+        )
+        for location, latitude, longitude in locations.values():
+            reverse_geocode_result = gmaps.reverse_geocode((latitude, longitude))
+            if reverse_geocode_result:
+                address = reverse_geocode_result[0].get('formatted_address', '')
+                if address:
+                    results.append((location, address[:255]))
+    except Exception as e:
+        # Addresses are cosmetic; keep the coordinates and carry on
+        logger.warning(f"Reverse geocoding failed: {str(e)}")
+    return results
+
+
+def expire_credits(now=None, batch_size=EXPIRY_BATCH_SIZE, limit=None):
+    """
+    Move active credits whose expiry_date has passed to 'expired'.
+
+    Due credits are found soonest-expiring first through the partial
+    credit_active_expiry_idx index and flipped in batches, each batch one
+    short transaction with a single UPDATE, so a large backlog never holds
+    a long lock. The queryset update applies the active -> expired moves
+    to CreditBalance, so balances stay correct without a date predicate.
+
+    Args:
+        now: Cut-off time (defaults to the current time)
+        batch_size: Credits expired per UPDATE
+        limit: Optional maximum number of credits to expire
+
+    Returns:
+        Number of credits expired
+    """
+    now = now or timezone.now()
+    due = CarbonCredit.objects.filter(status='active', expiry_date__lt=now)
+    expired = 0
+    while limit is None or expired < limit:
+        size = batch_size if limit is None else min(batch_size, limit - expired)
+        with transaction.atomic():
+            pks = list(due.order_by('expiry_date', 'id').values_list('pk', flat=True)[:size])
+            if not pks:
+                break
+            # Re-check the status, a credit may have been spent since it was selected
+            expired += due.filter(pk__in=pks).update(status='expired')
+        if len(pks) < size:
+            break
+
+    if expired:
+        logger.info(f"Expired {expired} credits due before {now.isoformat()}")
+    return expired
+
+
+def archive_credits(before=None, batch_size=ARCHIVE_BATCH_SIZE, limit=None):
+    """
+    Fold used and expired credits older than the archive horizon into CreditArchive.
+
+    Settled credits are taken oldest first through the partial
+    credit_settled_ts_idx index. Each batch is one transaction: the batch
+    is summed per (owner, status, day) into CreditArchive rows and the
+    credits are deleted with a plain DELETE, bypassing
+    CarbonCreditQuerySet, so CreditBalance and DailyCreditRollup keep
+    counting them.
+
+    Args:
+        before: Archive credits with a timestamp before this time
+            (defaults to CREDIT_ARCHIVE_AFTER_DAYS days ago)
+        batch_size: Credits archived per batch
+        limit: Optional maximum number of credits to archive
+
+    Returns:
+        Number of credits archived
+    """
+    if before is None:
+        days = getattr(settings, 'CREDIT_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+        before = timezone.now() - timedelta(days=days)
+    settled = CarbonCredit.objects.filter(status__in=CreditArchive.STATUSES, timestamp__lt=before)
+    archived = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - archived)
+        with transaction.atomic():
+            pks = list(settled.select_for_update().order_by('timestamp', 'id').values_list('pk', flat=True)[:size])
+            if not pks:
+                break
+            rows = CarbonCredit._base_manager.filter(pk__in=pks)
+            CreditArchive.apply_totals({
+                (row['owner_type'], row['owner_id'], row['account'], row['status'], row['day']): (row['total'], row['count'])
+                for row in rows.order_by().values(
+                    'owner_type', 'owner_id', 'account', 'status', day=TruncDate('timestamp')
+                ).annotate(total=Sum('amount'), count=Count('id'))
+            })
+            rows.delete()
+            archived += len(pks)
+        if len(pks) < size:
+            break
+
+    if archived:
+        logger.info(f"Archived {archived} credits settled before {before.isoformat()}")
+    return archived
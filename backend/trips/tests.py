@@ -1,10 +1,18 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from users.models import EmployeeProfile, Location, EmployerProfile
-from .models import Trip, CarbonCredit
+from .models import Trip, CarbonCredit, CreditAccount, CreditArchive, CreditBalance
+from .serializers import CarbonCreditSerializer
+from .tasks import archive_credits, expire_credits, finalize_trips
+from core.analytics import rebuild_daily_rollups
+from core.models import DailyCreditRollup, DistanceCacheEntry
+from core.utils.distance_cache import cache_key, distance_cache
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
@@ -215,7 +223,7 @@ class TripAPITestCase(APITestCase):
         url = reverse('trips:trip_list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
     
     def test_trip_detail(self):
         """Test retrieving trip details."""
@@ -325,8 +333,8 @@ class TripAPITestCase(APITestCase):
         url = reverse('trips:credit_list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(float(response.data[0]['amount']), 1.26)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(float(response.data['results'][0]['amount']), 1.26)
     
     def test_credit_history(self):
         """Test retrieving credit history."""
@@ -334,7 +342,7 @@ class TripAPITestCase(APITestCase):
         url = reverse('trips:credit_history')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
     
     def test_credit_stats(self):
         """Test retrieving credit statistics."""
@@ -631,7 +639,7 @@ class EmployeeTripFeaturesTestCase(TestCase):
         url = reverse('trips:trip_list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
     
     def test_employee_carbon_credit_dashboard(self):
         """Test that an employee can see their carbon credit dashboard."""
@@ -668,5 +676,420 @@ class EmployeeTripFeaturesTestCase(TestCase):
         url = reverse('trips:credit_list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(float(response.data[0]['amount']), 1.2) 
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(float(response.data['results'][0]['amount']), 1.2) 
+
+
+class CreditBalanceTestCase(TestCase):
+    """Tests for the materialized CreditBalance ledger."""
+    
+    def create_credit(self, amount, owner_type='employee', owner_id=1, status='active'):
+        return CarbonCredit.objects.create(
+            amount=Decimal(amount),
+            owner_type=owner_type,
+            owner_id=owner_id,
+            status=status,
+            expiry_date=timezone.now() + timedelta(days=365)
+        )
+    
+    def test_create_updates_balance(self):
+        """Test that creating credits adds to the owner's balance."""
+        self.create_credit('10.50')
+        self.create_credit('2.25', status='pending')
+        
+        balance = CreditBalance.for_owner('employee', 1)
+        self.assertEqual(balance.active, Decimal('10.50'))
+        self.assertEqual(balance.pending, Decimal('2.25'))
+        self.assertEqual(CreditBalance.get_balance('employee', 1), Decimal('10.50'))
+        self.assertEqual(CreditBalance.get_balance('employer', 1), Decimal('0'))
+    
+    def test_save_moves_amount_between_statuses(self):
+        """Test that changing a credit's status and amount moves it in the balance."""
+        credit = self.create_credit('8.00', status='pending')
+        credit.status = 'active'
+        credit.amount = Decimal('6.00')
+        credit.save()
+        
+        balance = CreditBalance.for_owner('employee', 1)
+        self.assertEqual(balance.pending, Decimal('0'))
+        self.assertEqual(balance.active, Decimal('6.00'))
+    
+    def test_queryset_update_and_delete(self):
+        """Test that queryset updates and deletes keep the balance in step."""
+        self.create_credit('3.00', status='pending')
+        self.create_credit('4.00', status='pending')
+        self.create_credit('5.00', owner_type='employer', owner_id=7)
+        
+        CarbonCredit.objects.filter(owner_type='employee', status='pending').update(status='active')
+        self.assertEqual(CreditBalance.get_balance('employee', 1), Decimal('7.00'))
+        self.assertEqual(CreditBalance.get_balance('employee', 1, 'pending'), Decimal('0'))
+        
+        CarbonCredit.objects.filter(owner_type='employer').delete()
+        self.assertEqual(CreditBalance.get_balance('employer', 7), Decimal('0'))
+    
+    def test_bulk_create_and_bulk_update(self):
+        """Test that bulk writes are reflected in the balance."""
+        credits = CarbonCredit.objects.bulk_create([
+            CarbonCredit(amount=Decimal('1.00'), owner_type='employee', owner_id=2, status='active'),
+            CarbonCredit(amount=Decimal('2.00'), owner_type='employee', owner_id=2, status='active'),
+        ])
+        self.assertEqual(CreditBalance.get_balance('employee', 2), Decimal('3.00'))
+        
+        credits = list(CarbonCredit.objects.filter(owner_id=2).order_by('amount'))
+        credits[0].status = 'used'
+        CarbonCredit.objects.bulk_update(credits, ['status'])
+        
+        balance = CreditBalance.for_owner('employee', 2)
+        self.assertEqual(balance.active, Decimal('2.00'))
+        self.assertEqual(balance.used, Decimal('1.00'))
+    
+    def test_rebuild_reports_and_fixes_drift(self):
+        """Test that rebuilding balances reports drift and restores the correct totals."""
+        self.create_credit('9.00')
+        CreditBalance.objects.filter(owner_type='employee', owner_id=1).update(active=Decimal('1.00'))
+        
+        drift = CreditBalance.rebuild(dry_run=True)
+        self.assertEqual(drift, [('employee', 1, 'active', Decimal('1.00'), Decimal('9.00'))])
+        self.assertEqual(CreditBalance.get_balance('employee', 1), Decimal('1.00'))
+        
+        CreditBalance.rebuild()
+        self.assertEqual(CreditBalance.get_balance('employee', 1), Decimal('9.00'))
+        self.assertEqual(CreditBalance.rebuild(), [])
+
+
+class CreditFixtureMixin:
+    """An employer with ten employees, one source trip and a helper to add credits."""
+    
+    def setUp(self):
+        employer_user = User.objects.create_user(
+            username='credits_employer', email='credits_employer@test.com', password='password123', is_employer=True
+        )
+        self.employer = EmployerProfile.objects.create(user=employer_user, company_name='Credit Co')
+        self.employees = []
+        for index in range(10):
+            user = User.objects.create_user(
+                username=f'credits_employee{index}',
+                email=f'credits_employee{index}@test.com',
+                password='password123',
+                first_name='Employee',
+                last_name=str(index),
+                is_employee=True
+            )
+            self.employees.append(EmployeeProfile.objects.create(user=user, employer=self.employer))
+        self.trip = Trip.objects.create(
+            employee=self.employees[0],
+            transport_mode='bicycle',
+            trip_date=timezone.now().date() - timedelta(days=3),
+            verification_status='verified'
+        )
+    
+    def create_credits(self, count):
+        CarbonCredit.objects.bulk_create([
+            CarbonCredit(
+                amount=Decimal('1.00'),
+                source_trip=self.trip if index % 2 else None,
+                owner_type='employer' if index % 5 == 0 else 'employee',
+                owner_id=self.employer.id if index % 5 == 0 else self.employees[index % 10].id,
+                status='active',
+                expiry_date=timezone.now() + timedelta(days=365)
+            )
+            for index in range(count)
+        ])
+
+
+class CreditAccountTestCase(CreditFixtureMixin, TestCase):
+    """Tests for the CreditAccount foreign key kept in step with owner_type/owner_id."""
+    
+    def test_writes_point_credits_at_their_owners_account(self):
+        """Test that save, bulk_create and owner updates all resolve the right account."""
+        employee = self.employees[0]
+        credit = CarbonCredit.objects.create(
+            amount=Decimal('2.00'), owner_type='employee', owner_id=employee.id,
+            expiry_date=timezone.now() + timedelta(days=365)
+        )
+        self.assertEqual(credit.account.employee, employee)
+        self.assertEqual((credit.account.owner_type, credit.account.owner_id), ('employee', employee.id))
+        
+        # One account per owner, shared by every credit it holds
+        self.create_credits(20)
+        self.assertEqual(CreditAccount.objects.count(), 10)
+        self.assertEqual(self.employer.credit_account.credits.count(), 4)
+        self.assertFalse(CarbonCredit.objects.filter(account__isnull=True).exists())
+        
+        credit.owner_type, credit.owner_id = 'employer', self.employer.id
+        credit.save()
+        self.assertEqual(credit.account, self.employer.credit_account)
+        
+        CarbonCredit.objects.filter(pk=credit.pk).update(owner_type='employee', owner_id=self.employees[1].id)
+        credit.refresh_from_db()
+        self.assertEqual(credit.account, self.employees[1].credit_account)
+    
+    def test_company_and_owner_helpers_join_through_accounts(self):
+        """Test that for_company covers the employer and its employees, and nothing else."""
+        self.create_credits(20)
+        other_user = User.objects.create_user(
+            username='other_company', email='other_company@test.com', password='password123', is_employer=True
+        )
+        other = EmployerProfile.objects.create(user=other_user, company_name='Other Co')
+        CarbonCredit.objects.create(
+            amount=Decimal('1.00'), owner_type='employer', owner_id=other.id,
+            expiry_date=timezone.now() + timedelta(days=365)
+        )
+        
+        company = CarbonCredit.objects.for_company(self.employer)
+        self.assertEqual(company.count(), 20)
+        self.assertIn('trips_creditaccount', str(company.query))
+        self.assertEqual(CarbonCredit.objects.owned_by(self.employer).count(), 4)
+        self.assertEqual(CarbonCredit.objects.owned_by(self.employees[1]).count(), 2)
+        self.assertEqual(CarbonCredit.objects.owned_by(other).count(), 1)
+
+
+class CreditExpiryTestCase(CreditFixtureMixin, TestCase):
+    """Tests for the batched credit expiry sweep."""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_credits(10)
+        # Half the credits fell due yesterday, one of them was already spent
+        due = list(CarbonCredit.objects.order_by('id').values_list('id', flat=True)[:5])
+        CarbonCredit.objects.filter(id__in=due).update(expiry_date=timezone.now() - timedelta(days=1))
+        CarbonCredit.objects.filter(id=due[0]).update(status='used')
+    
+    def test_sweep_expires_due_active_credits_in_batches(self):
+        """Test that only due active credits expire and balances follow without a date filter."""
+        self.assertEqual(expire_credits(batch_size=2, limit=3), 3)
+        self.assertEqual(expire_credits(batch_size=2), 1)
+        self.assertEqual(expire_credits(), 0)
+        
+        self.assertEqual(CarbonCredit.objects.filter(status='expired').count(), 4)
+        self.assertEqual(CarbonCredit.objects.filter(status='used').count(), 1)
+        self.assertFalse(CarbonCredit.objects.filter(status='active', expiry_date__lt=timezone.now()).exists())
+        self.assertEqual(CreditBalance.rebuild(dry_run=True), [])
+    
+    def test_command_reports_counts(self):
+        """Test that the expire_credits command sweeps everything due and prints counts."""
+        out = io.StringIO()
+        call_command('expire_credits', '--batch-size', '3', stdout=out)
+        self.assertIn('Expired 3 credits', out.getvalue())
+        self.assertIn('Expired 4 credits in total', out.getvalue())
+        self.assertEqual(CarbonCredit.objects.filter(status='expired').count(), 4)
+
+
+class CreditArchiveTestCase(CreditFixtureMixin, TestCase):
+    """Tests for compacting old settled credits into CreditArchive."""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_credits(10)
+        CarbonCredit.objects.update(timestamp=timezone.now() - timedelta(days=400))
+        ids = list(CarbonCredit.objects.order_by('id').values_list('id', flat=True))
+        # The employer's two credits (0 and 5) and three employees' credits are used, one expired
+        CarbonCredit.objects.filter(id__in=[ids[0], ids[5], ids[1], ids[2], ids[3]]).update(status='used')
+        CarbonCredit.objects.filter(id=ids[4]).update(status='expired')
+    
+    def snapshot(self):
+        balances = sorted(CreditBalance.objects.values_list('owner_type', 'owner_id', 'active', 'used', 'expired'))
+        rollups = sorted(DailyCreditRollup.objects.filter(credit_count__gt=0).values_list('day', 'credits_issued', 'credit_count'))
+        return balances, rollups
+    
+    def test_archive_compacts_settled_credits_and_totals_reconcile(self):
+        """Test that old used/expired credits become archive rows without changing any total."""
+        before = self.snapshot()
+        
+        self.assertEqual(archive_credits(batch_size=1, limit=4), 4)
+        self.assertEqual(archive_credits(), 2)
+        self.assertEqual(archive_credits(), 0)
+        
+        self.assertEqual(CarbonCredit.objects.count(), 4)
+        self.assertFalse(CarbonCredit.objects.exclude(status='active').exists())
+        self.assertEqual(CreditArchive.objects.count(), 5)
+        employer_row = CreditArchive.objects.get(owner_type='employer', owner_id=self.employer.id)
+        self.assertEqual((employer_row.status, employer_row.amount, employer_row.credit_count), ('used', Decimal('2.00'), 2))
+        self.assertEqual(employer_row.account, self.employer.credit_account)
+        
+        # Balances and rollups are untouched, and rebuilding them from CarbonCredit + archive agrees
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(CreditBalance.rebuild(dry_run=True), [])
+        rebuild_daily_rollups()
+        self.assertEqual(self.snapshot(), before)
+    
+    def test_horizon_keeps_recent_credits(self):
+        """Test that credits newer than the horizon stay in CarbonCredit, and the command reports counts."""
+        self.assertEqual(archive_credits(before=timezone.now() - timedelta(days=500)), 0)
+        
+        out = io.StringIO()
+        call_command('archive_credits', '--days', '30', stdout=out)
+        self.assertIn('Archived 6 credits in total', out.getvalue())
+        self.assertEqual(CarbonCredit.objects.count(), 4)
+
+
+class CarbonCreditSerializerQueryTestCase(CreditFixtureMixin, TestCase):
+    """Tests that serializing a page of credits takes a constant number of queries."""
+    
+    def test_page_of_credits_takes_constant_queries(self):
+        """Test that owners and trip dates are resolved in bulk, not per row."""
+        self.create_credits(1000)
+        
+        # Credits, employees with their users, employers, source trips
+        with self.assertNumQueries(4):
+            data = CarbonCreditSerializer(CarbonCredit.objects.order_by('id'), many=True).data
+        
+        self.assertEqual(len(data), 1000)
+        self.assertEqual(data[0]['owner_name'], 'Credit Co')
+        self.assertEqual(data[1]['owner_name'], 'Employee 1')
+        self.assertEqual(data[1]['trip_date'], self.trip.trip_date)
+        self.assertIsNone(data[2]['trip_date'])
+        
+        # select_related trips are used as loaded
+        with self.assertNumQueries(3):
+            CarbonCreditSerializer(CarbonCredit.objects.select_related('source_trip'), many=True).data
+    
+    def test_single_credit_still_resolves_its_owner(self):
+        """Test that serializing one credit without list context looks up its owner."""
+        self.create_credits(2)
+        credit = CarbonCredit.objects.get(owner_type='employee')
+        self.assertEqual(CarbonCreditSerializer(credit).data['owner_name'], 'Employee 1')
+
+
+class CreditListPaginationTestCase(CreditFixtureMixin, TestCase):
+    """Tests for keyset pagination of the credit list endpoints."""
+    
+    def test_employer_pages_through_own_and_employee_credits(self):
+        """Test that pages are bounded, cover every credit once and skip other employers' credits."""
+        self.create_credits(25)
+        other_user = User.objects.create_user(
+            username='other_employer', email='other_employer@test.com', password='password123', is_employer=True
+        )
+        other = EmployerProfile.objects.create(user=other_user, company_name='Other Co')
+        CarbonCredit.objects.create(
+            amount=Decimal('1.00'), owner_type='employer', owner_id=other.id,
+            status='active', expiry_date=timezone.now() + timedelta(days=365)
+        )
+        # Every credit shares a timestamp, so only the id separates pages
+        CarbonCredit.objects.update(timestamp=timezone.now())
+        
+        client = APIClient()
+        client.force_authenticate(self.employer.user)
+        seen = []
+        params = {'page_size': 10}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('trips:credit_list'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 10)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            seen += [row['id'] for row in response.data['results']]
+            if response.data['next_cursor'] is None:
+                self.assertIsNone(response.data['next'])
+                break
+            self.assertIn('cursor=', response.data['next'])
+            params['cursor'] = response.data['next_cursor']
+        
+        expected = CarbonCredit.objects.exclude(owner_id=other.id, owner_type='employer').order_by('-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+        
+        response = client.get(reverse('trips:credit_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TRIP_FINALIZE_ASYNC=False, GOOGLE_MAPS_DISTANCE_MATRIX_URL='http://127.0.0.1:9/unreachable')
+class TripEndProvisionalDistanceTestCase(APITestCase):
+    """Tests for ending trips with a provisional distance that is finalized in the background."""
+
+    def setUp(self):
+        distance_cache.clear()
+        employer_user = User.objects.create_user(
+            username='employer',
+            email='employer@test.com',
+            password='password123',
+            is_employer=True
+        )
+        self.employer = EmployerProfile.objects.create(user=employer_user, company_name='Test Company')
+        self.employee_user = User.objects.create_user(
+            username='employee',
+            email='employee@test.com',
+            password='password123',
+            is_employee=True
+        )
+        self.employee = EmployeeProfile.objects.create(user=self.employee_user, employer=self.employer)
+        self.home = Location.objects.create(
+            name='Home',
+            created_by=self.employee_user,
+            latitude=Decimal('19.0000000'),
+            longitude=Decimal('72.8000000'),
+            address='1 Home St',
+            location_type='home'
+        )
+        self.trip = Trip.objects.create(
+            employee=self.employee,
+            start_location=self.home,
+            transport_mode='carpool'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.employee_user)
+
+    def end_trip(self):
+        url = reverse('trips:trip_end', kwargs={'pk': self.trip.pk})
+        return self.client.post(url, {
+            'end_location': 'Office',
+            'end_address': '2 Office Rd',
+            'end_latitude': 19.1,
+            'end_longitude': 72.8
+        }, format='json')
+
+    def test_end_trip_records_provisional_distance(self):
+        """Test that ending a trip answers with a straight-line distance and queues finalization."""
+        response = self.end_trip()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['distance_status'], 'provisional')
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.distance_km, Decimal('11.12'))
+        self.assertEqual(self.trip.end_latitude, Decimal('19.1'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id, 'pending'), Decimal('1.67'))
+
+        # Ending twice is rejected
+        self.assertEqual(self.end_trip().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_finalize_replaces_distance_and_pending_credit(self):
+        """Test that the worker applies the route distance and adjusts the pending credit."""
+        self.end_trip()
+        key = cache_key((self.home.latitude, self.home.longitude), (19.1, 72.8), 'driving')
+        DistanceCacheEntry.objects.create(
+            start_latitude=key[0], start_longitude=key[1],
+            end_latitude=key[2], end_longitude=key[3],
+            mode='driving', distance_km=Decimal('15.000')
+        )
+
+        self.assertEqual(finalize_trips(), 1)
+
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.distance_status, 'final')
+        self.assertEqual(self.trip.distance_km, Decimal('15.00'))
+        self.assertEqual(self.trip.credits_earned, Decimal('2.25'))
+        self.assertEqual(self.trip.carbon_savings, Decimal('1.44'))
+        self.assertEqual(CarbonCredit.objects.get(source_trip=self.trip).amount, Decimal('2.25'))
+        self.assertEqual(CreditBalance.get_balance('employee', self.employee.id, 'pending'), Decimal('2.25'))
+        self.assertEqual(finalize_trips(), 0)
+
+    def test_finalize_issues_missing_pending_credit_with_expiry(self):
+        """Test that a pending credit created during finalization expires like one issued at trip end."""
+        self.end_trip()
+        CarbonCredit.objects.filter(source_trip=self.trip).delete()
+
+        self.assertEqual(finalize_trips(), 1)
+
+        credit = CarbonCredit.objects.get(source_trip=self.trip)
+        self.assertEqual(credit.status, 'pending')
+        self.assertAlmostEqual(credit.expiry_date, timezone.now() + timedelta(days=365), delta=timedelta(minutes=1))
+
+    def test_unresolved_route_keeps_straight_line_distance(self):
+        """Test that a trip the Maps API can't route is finalized with its provisional distance."""
+        self.end_trip()
+
+        self.assertEqual(finalize_trips(), 1)
+
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.distance_status, 'final')
+        self.assertEqual(self.trip.distance_km, Decimal('11.12'))
+
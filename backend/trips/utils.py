@@ -4,6 +4,7 @@ import math
 import googlemaps
 from datetime import datetime
 from django.conf import settings
+from core.utils.distance_cache import distance_cache
 
 def calculate_distance_haversine(lat1, lon1, lat2, lon2):
     """
@@ -24,6 +25,27 @@ def calculate_distance_haversine(lat1, lon1, lat2, lon2):
     r = 6371  # Radius of earth in kilometers
     return c * r
 
+def google_travel_mode(mode):
+    """
+    Convert a trip transport mode to a Google Maps travel mode.
+    
+    Args:
+        mode (str): Trip transport mode, or a Google Maps mode
+        
+    Returns:
+        str: driving, walking, bicycling or transit
+    """
+    if mode in ['driving', 'walking', 'bicycling', 'transit']:
+        return mode
+    if mode == 'bicycle':
+        return 'bicycling'
+    if mode == 'walking':
+        return 'walking'
+    if mode == 'public_transport':
+        return 'transit'
+    # Default to driving for modes not supported by Google Maps
+    return 'driving'
+
 def calculate_distance_google_maps(origin_lat, origin_lon, dest_lat, dest_lon, mode='driving'):
     """
     Calculate distance between two points using Google Maps API.
@@ -39,37 +61,26 @@ def calculate_distance_google_maps(origin_lat, origin_lon, dest_lat, dest_lon, m
         float: Distance in kilometers
     """
     try:
-        gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+        google_mode = google_travel_mode(mode)
         
-        # Convert transport mode to Google Maps format
-        google_mode = mode
-        if mode not in ['driving', 'walking', 'bicycling', 'transit']:
-            # Default to driving for modes not supported by Google Maps
-            if mode == 'car' or mode == 'carpool':
-                google_mode = 'driving'
-            elif mode == 'bicycle':
-                google_mode = 'bicycling'
-            elif mode == 'walking':
-                google_mode = 'walking'
-            elif mode == 'public_transport':
-                google_mode = 'transit'
-            else:
-                google_mode = 'driving'
-        
-        directions_result = gmaps.directions(
-            (origin_lat, origin_lon),
-            (dest_lat, dest_lon),
-            mode=google_mode,
-            departure_time=datetime.now()
-        )
-        
-        if directions_result:
+        def resolve():
+            gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+            directions_result = gmaps.directions(
+                (origin_lat, origin_lon),
+                (dest_lat, dest_lon),
+                mode=google_mode,
+                departure_time=datetime.now()
+            )
+            if not directions_result:
+                raise ValueError("No route found")
             # Get distance in meters and convert to kilometers
-            distance_meters = directions_result[0]['legs'][0]['distance']['value']
-            return round(distance_meters / 1000, 2)
+            return directions_result[0]['legs'][0]['distance']['value'] / 1000
         
-        # If Google Maps API fails, fall back to Haversine formula
-        return calculate_distance_haversine(origin_lat, origin_lon, dest_lat, dest_lon)
+        # Repeat commutes are served from the distance cache
+        distance_km = distance_cache.get_or_resolve(
+            (origin_lat, origin_lon), (dest_lat, dest_lon), google_mode, resolve
+        )
+        return round(float(distance_km), 2)
     
     except Exception as e:
         # If Google Maps API fails, fall back to Haversine formula
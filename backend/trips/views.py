@@ -7,13 +7,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
+from decimal import Decimal
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from .models import Trip, CarbonCredit
+from .models import Trip, CarbonCredit, CreditBalance, credit_expiry_date
 from users.models import EmployeeProfile, Location
 from .serializers import (
     TripSerializer, TripStartSerializer, TripEndSerializer, 
@@ -21,11 +22,15 @@ from .serializers import (
     CreditStatsSerializer, EmployerCreditStatsSerializer, TripStatsSerializer
 )
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, Avg, Count
+from django.db import transaction
+from django.db.models import Sum, Avg, Count, Q
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
 from users.permissions import IsApprovedUser, IsBankAdmin
 from .permissions import IsOwnerOrAdmin, IsEmployerOrAdmin, IsEmployeeOrEmployerOrAdmin, IsCreditOwnerOrAdmin
-from .utils import calculate_carbon_savings
+from .utils import calculate_distance_haversine
+from .tasks import enqueue_trip_finalization
+from core.pagination import KeysetPagination
+from core.utils.credit_calculator import calculate_batch
 
 User = get_user_model()
 
@@ -38,20 +43,25 @@ class TripListView(APIView):
         
         if user.is_super_admin or user.is_bank_admin:
             # Admins can see all trips
-            trips = Trip.objects.all().order_by('-trip_date')
+            trips = Trip.objects.all()
         elif user.is_employer:
             # Employers can see their employees' trips
             employer_profile = user.employer_profile
             trips = Trip.objects.filter(
                 employee__employer=employer_profile
-            ).order_by('-trip_date')
+            )
         else:
             # Employees can see their own trips
             employee = EmployeeProfile.objects.get(user=user)
-            trips = Trip.objects.filter(employee=employee).order_by('-trip_date')
-            
-        serializer = TripSerializer(trips, many=True)
-        return Response(serializer.data)
+            trips = Trip.objects.filter(employee=employee)
+        
+        # Newest first, a keyset page at a time
+        paginator = KeysetPagination(ordering=('-trip_date', '-id'))
+        page = paginator.paginate_queryset(
+            trips.select_related('start_location', 'end_location', 'employee__user'), request, view=self
+        )
+        serializer = TripSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class TripDetailView(APIView):
     permission_classes = [IsAuthenticated, IsApprovedUser, IsOwnerOrAdmin]
@@ -121,14 +131,16 @@ class TripEndView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        if trip.end_time:
+        if trip.end_location_id:
             return Response({"error": "Trip already ended"}, status=status.HTTP_400_BAD_REQUEST)
             
-        # Pass the trip in the context for distance calculation
-        serializer = TripEndSerializer(data=request.data, context={'trip': trip})
+        serializer = TripEndSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+        end_latitude = serializer.validated_data.get('end_latitude')
+        end_longitude = serializer.validated_data.get('end_longitude')
+        
         # Get or create location
         end_location, created = Location.objects.get_or_create(
             name=serializer.validated_data['end_location'],
@@ -136,36 +148,56 @@ class TripEndView(APIView):
                 'address': serializer.validated_data.get('end_address', ''),
                 'created_by': request.user,
                 'location_type': 'commute',
-                'latitude': serializer.validated_data.get('end_latitude', 0),
-                'longitude': serializer.validated_data.get('end_longitude', 0)
+                'latitude': end_latitude or 0,
+                'longitude': end_longitude or 0
             }
         )
         
-        # Get distance from serializer
-        distance = float(serializer.validated_data['distance_km'])
+        if 'distance_km' in serializer.validated_data:
+            distance = float(serializer.validated_data['distance_km'])
+            distance_status = 'final'
+        elif trip.start_location:
+            # Straight-line estimate now; the route distance is resolved in the background
+            distance = round(calculate_distance_haversine(
+                trip.start_location.latitude, trip.start_location.longitude,
+                end_latitude, end_longitude
+            ), 2)
+            distance_status = 'provisional'
+        else:
+            return Response(
+                {"distance_km": ["This field is required when the trip has no start location."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Calculate carbon savings and credits using utility function
-        carbon_saved, credits = calculate_carbon_savings(distance, trip.transport_mode)
+        # Calculate carbon savings and credits with the configured calculator
+        (credits,), (carbon_saved,) = calculate_batch([round(Decimal(str(distance)), 2)], [trip.transport_mode])
         
         # Update trip
         trip.end_location = end_location
-        trip.end_time = timezone.now()
+        trip.end_latitude = end_latitude
+        trip.end_longitude = end_longitude
         trip.distance_km = distance
+        trip.distance_status = distance_status
         trip.carbon_savings = carbon_saved
         trip.credits_earned = credits
-        trip.save()
         
-        # Create carbon credits if applicable
-        if credits > 0:
-            CarbonCredit.objects.create(
-                amount=credits,
-                source_trip=trip,
-                owner_type='employee',
-                owner_id=trip.employee.id,
-                timestamp=timezone.now(),
-                status='pending',
-                expiry_date=timezone.now() + timezone.timedelta(days=365)  # 1 year validity
-            )
+        with transaction.atomic():
+            trip.save()
+            
+            # Create carbon credits if applicable
+            if credits > 0:
+                CarbonCredit.objects.create(
+                    amount=trip.credits_earned,
+                    source_trip=trip,
+                    owner_type='employee',
+                    owner_id=trip.employee.id,
+                    timestamp=timezone.now(),
+                    status='pending',
+                    expiry_date=credit_expiry_date()
+                )
+            
+            if distance_status == 'provisional':
+                enqueue_trip_finalization(trip.id)
         
         trip_serializer = TripSerializer(trip)
         return Response(trip_serializer.data)
@@ -260,6 +292,11 @@ class TripStatsView(APIView):
         return Response(serializer.data)
 
 # Carbon Credit Views
+
+# Credit lists page newest first
+CREDIT_PAGE_ORDERING = ('-timestamp', '-id')
+
+
 class CreditListView(APIView):
     permission_classes = [IsAuthenticated, IsApprovedUser, IsEmployeeOrEmployerOrAdmin]
     
@@ -268,27 +305,10 @@ class CreditListView(APIView):
         
         if user.is_super_admin or user.is_bank_admin:
             # Admins see all active credits
-            credits = CarbonCredit.objects.filter(status='active').order_by('-timestamp')
+            credits = CarbonCredit.objects.filter(status='active')
         elif user.is_employer:
             # Employers see their own and their employees' credits
-            employer_profile = user.employer_profile
-            
-            # Credits directly owned by the employer
-            employer_credits = CarbonCredit.objects.filter(
-                owner_type='employer',
-                owner_id=employer_profile.id,
-                status='active'
-            )
-            
-            # Credits owned by employees of the employer
-            employee_ids = EmployeeProfile.objects.filter(employer=employer_profile).values_list('id', flat=True)
-            employee_credits = CarbonCredit.objects.filter(
-                owner_type='employee',
-                owner_id__in=employee_ids,
-                status='active'
-            )
-            
-            credits = employer_credits.union(employee_credits).order_by('-timestamp')
+            credits = CarbonCredit.objects.for_company(user.employer_profile).filter(status='active')
         else:
             # Employees see their own credits
             employee = EmployeeProfile.objects.get(user=user)
@@ -296,10 +316,12 @@ class CreditListView(APIView):
                 owner_type='employee', 
                 owner_id=employee.id,
                 status='active'
-            ).order_by('-timestamp')
+            )
         
-        serializer = CarbonCreditSerializer(credits, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=CREDIT_PAGE_ORDERING)
+        page = paginator.paginate_queryset(credits, request, view=self)
+        serializer = CarbonCreditSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class CreditHistoryView(APIView):
     permission_classes = [IsAuthenticated, IsApprovedUser, IsEmployeeOrEmployerOrAdmin]
@@ -309,35 +331,22 @@ class CreditHistoryView(APIView):
         
         if user.is_super_admin or user.is_bank_admin:
             # Admins see all credits
-            credits = CarbonCredit.objects.all().order_by('-timestamp')
+            credits = CarbonCredit.objects.all()
         elif user.is_employer:
             # Employers see their own and their employees' credits
-            employer_profile = user.employer_profile
-            
-            # Credits directly owned by the employer
-            employer_credits = CarbonCredit.objects.filter(
-                owner_type='employer',
-                owner_id=employer_profile.id
-            )
-            
-            # Credits owned by employees of the employer
-            employee_ids = EmployeeProfile.objects.filter(employer=employer_profile).values_list('id', flat=True)
-            employee_credits = CarbonCredit.objects.filter(
-                owner_type='employee',
-                owner_id__in=employee_ids
-            )
-            
-            credits = employer_credits.union(employee_credits).order_by('-timestamp')
+            credits = CarbonCredit.objects.for_company(user.employer_profile)
         else:
             # Employees see their own credits
             employee = EmployeeProfile.objects.get(user=user)
             credits = CarbonCredit.objects.filter(
                 owner_type='employee', 
                 owner_id=employee.id
-            ).order_by('-timestamp')
+            )
         
-        serializer = CarbonCreditSerializer(credits, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination(ordering=CREDIT_PAGE_ORDERING)
+        page = paginator.paginate_queryset(credits, request, view=self)
+        serializer = CarbonCreditSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class CreditStatsView(APIView):
     permission_classes = [IsAuthenticated, IsApprovedUser, IsEmployeeOrEmployerOrAdmin]
@@ -347,41 +356,30 @@ class CreditStatsView(APIView):
         
         if user.is_super_admin or user.is_bank_admin:
             # Admins see overall stats
-            user_credits = CarbonCredit.objects.all()
+            owners = None
         elif user.is_employer:
-            # Employers see their employees' stats
+            # Employers see their own and their employees' balances
             employer_profile = user.employer_profile
-            
-            # Credits directly owned by the employer
-            employer_credits = CarbonCredit.objects.filter(
-                owner_type='employer',
-                owner_id=employer_profile.id
-            )
-            
-            # Credits owned by employees of the employer
-            employee_ids = EmployeeProfile.objects.filter(employer=employer_profile).values_list('id', flat=True)
-            employee_credits = CarbonCredit.objects.filter(
-                owner_type='employee',
-                owner_id__in=employee_ids
+            owners = (
+                Q(owner_type='employer', owner_id=employer_profile.id) |
+                Q(owner_type='employee', owner_id__in=EmployeeProfile.objects.filter(
+                    employer=employer_profile
+                ).values('id'))
             )
-            
-            user_credits = employer_credits.union(employee_credits)
         else:
             # Employees see their own stats
             employee = EmployeeProfile.objects.get(user=user)
-            user_credits = CarbonCredit.objects.filter(
-                owner_type='employee', 
-                owner_id=employee.id
-            )
+            owners = Q(owner_type='employee', owner_id=employee.id)
         
-        active_credits = user_credits.filter(status='active')
+        # Read the materialized per-owner balances instead of summing every credit row
+        totals = CreditBalance.totals_for(owners)
         
         stats = {
-            'total_credits_earned': user_credits.aggregate(Sum('amount'))['amount__sum'] or 0,
-            'active_credits': active_credits.aggregate(Sum('amount'))['amount__sum'] or 0,
-            'pending_credits': user_credits.filter(status='pending').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'expired_credits': user_credits.filter(status='expired').aggregate(Sum('amount'))['amount__sum'] or 0,
-            'used_credits': user_credits.filter(status='used').aggregate(Sum('amount'))['amount__sum'] or 0,
+            'total_credits_earned': sum(totals.values()),
+            'active_credits': totals['active'],
+            'pending_credits': totals['pending'],
+            'expired_credits': totals['expired'],
+            'used_credits': totals['used'],
         }
         
         serializer = CreditStatsSerializer(stats)
@@ -394,16 +392,13 @@ class EmployerCreditStatsView(APIView):
         user = self.request.user
         
         if user.is_super_admin or user.is_bank_admin:
-            # Admin users see company-wide statistics
-            all_credits = CarbonCredit.objects.all()
+            # Admin users see company-wide statistics, from the balances so archived credits still count
+            totals = CreditBalance.totals_for(None)
             
             stats = {
-                'total_credits_issued': all_credits.aggregate(Sum('amount'))['amount__sum'] or 0,
-                'active_credits': all_credits.filter(status='active').aggregate(Sum('amount'))['amount__sum'] or 0,
-                'credits_by_status': {
-                    status[0]: all_credits.filter(status=status[0]).aggregate(Sum('amount'))['amount__sum'] or 0
-                    for status in CarbonCredit.CREDIT_STATUS
-                },
+                'total_credits_issued': sum(totals.values(), Decimal('0')),
+                'active_credits': totals['active'],
+                'credits_by_status': {status[0]: totals[status[0]] for status in CarbonCredit.CREDIT_STATUS},
                 'top_employees': EmployeeProfile.objects.annotate(
                     total_credits=Sum('trips__credits_earned')
                 ).exclude(total_credits=None).order_by('-total_credits')[:10].values(
@@ -414,31 +409,16 @@ class EmployerCreditStatsView(APIView):
             # Employer sees only their company's statistics
             employer_profile = user.employer_profile
             
-            # Get all employees for this employer
-            employee_ids = EmployeeProfile.objects.filter(employer=employer_profile).values_list('id', flat=True)
-            
-            # Get all credits for these employees
-            employee_credits = CarbonCredit.objects.filter(
-                owner_type='employee',
-                owner_id__in=employee_ids
+            # The employer's own balance and its employees', archived credits included
+            totals = CreditBalance.totals_for(
+                Q(owner_type='employer', owner_id=employer_profile.id) |
+                Q(owner_type='employee', owner_id__in=employer_profile.employees.values('id'))
             )
             
-            # Get all credits for the employer
-            employer_credits = CarbonCredit.objects.filter(
-                owner_type='employer',
-                owner_id=employer_profile.id
-            )
-            
-            # Combine both sets of credits
-            all_credits = employee_credits.union(employer_credits)
-            
             stats = {
-                'total_credits_issued': all_credits.aggregate(Sum('amount'))['amount__sum'] or 0,
-                'active_credits': all_credits.filter(status='active').aggregate(Sum('amount'))['amount__sum'] or 0,
-                'credits_by_status': {
-                    status[0]: all_credits.filter(status=status[0]).aggregate(Sum('amount'))['amount__sum'] or 0
-                    for status in CarbonCredit.CREDIT_STATUS
-                },
+                'total_credits_issued': sum(totals.values(), Decimal('0')),
+                'active_credits': totals['active'],
+                'credits_by_status': {status[0]: totals[status[0]] for status in CarbonCredit.CREDIT_STATUS},
                 'top_employees': EmployeeProfile.objects.filter(employer=employer_profile).annotate(
                     total_credits=Sum('trips__credits_earned')
                 ).exclude(total_credits=None).order_by('-total_credits')[:10].values(